@@ -0,0 +1,22 @@
+import os
+import sys
+
+###############################################################################
+# API Keys
+###############################################################################
+# Keys come from /FlavorAI/APIkey.py when it exists (the original setup), and
+# otherwise from the environment. Missing keys are None: the service still
+# starts, and only the calls that need Google or Gemini fail, so benchmarks
+# and replayed fixtures run without any keys at all.
+GOOGLE_MAPS_KEY_ENV = "GOOGLE_MAPS_API_KEY"
+GEMINI_KEY_ENV = "GEMINI_API_KEY"
+
+key_dir = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+if key_dir not in sys.path:
+    sys.path.insert(0, key_dir)
+
+try:
+    from APIkey import othersapi_key, geminiapi_key
+except ImportError:
+    othersapi_key = os.environ.get(GOOGLE_MAPS_KEY_ENV)
+    geminiapi_key = os.environ.get(GEMINI_KEY_ENV)
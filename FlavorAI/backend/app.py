@@ -1,31 +1,69 @@
 import requests
-import pandas as pd
 import time
-import os
-import sys
 import json
-from google import genai
-from google.genai import types
-from plyer import gps
+import math
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from cache import flavor_profile_cache
+from feedback import apply_feedback
+from metrics import record_upstream, span
+from candidates import CandidateIndex, merge_tried_foods, tried_set
+from nearby_cache import (
+    NEARBY_ANSWER_STATUS,
+    geohash_encode,
+    geohash_neighborhood,
+    haversine_m,
+    is_complete_answer,
+    nearby_search_cache,
+)
+from place_details import place_details
+from places_client import PlacesClient
+from profile_store import TASTE_KEYS, get_profile_store
+from results import Recommendation
+from singleflight import flavor_flight, nearby_flight
+from taste_history import taste_history
 
 ###############################################################################
 # Setup & Configuration
 ###############################################################################
-current_dir = os.path.dirname(os.path.abspath(__file__))
-key_dir = os.path.abspath(os.path.join(current_dir, ".."))
-if key_dir not in sys.path:
-    sys.path.insert(0, key_dir)
-from APIkey import othersapi_key, geminiapi_key
+from api_keys import othersapi_key, geminiapi_key
+
+# Shared Google Places client (pooled session, bounded concurrency, retries)
+places = PlacesClient(othersapi_key)
 
-# Create a Gemini client for flavor profile generation
-client = genai.Client(api_key=geminiapi_key)
+# Heavy modules (numpy, google-genai, plyer) are imported on first use,
+# so serving profiles or a health check never pays for them at startup.
+_gemini_client = None
+_gemini_client_lock = threading.Lock()
 
-# Always show all columns in Pandas DataFrames
-pd.set_option("display.max_columns", None)
+def get_gemini_client():
+    """
+    Returns the shared Gemini client, creating it on first use.
+    """
+    global _gemini_client
+    if _gemini_client is None:
+        with _gemini_client_lock:
+            if _gemini_client is None:
+                from google import genai
+                _gemini_client = genai.Client(api_key=geminiapi_key)
+    return _gemini_client
 
 # Globals
 gps_location = {}       # Dictionary to store the latest device GPS location
 RESTAURANT_COUNT = 20   # Maximum number of restaurants returned by Google Maps
+BATCH_GROUP_PRECISION = 5   # Geohash length used to index batch groups (~5 km cells)
+BATCH_GROUP_DISTANCE_M = 3000  # Users this close to a group's first member share its candidates
+FLAVOR_CHUNK_SIZE = 10      # Restaurant names per Gemini flavor-profile call
+FLAVOR_MAX_PARALLEL = 4     # Gemini flavor-profile calls in flight at once
+FLAVOR_MAX_ATTEMPTS = 3     # Rounds per name before falling back to the neutral profile
+NEARBY_EXPANDED_TYPES = ("restaurant", "cafe", "meal_takeaway", "bar")  # Searched in parallel
+NEARBY_MAX_PAGES = 3        # Google serves at most 3 pages of 20 per search
+NEARBY_PAGE_TOKEN_DELAY = 2.0   # A next_page_token only becomes valid about 2 s after it is issued
+NEARBY_EXPANDED_BUDGET = 8.0    # Seconds spent waiting for pages before ranking what arrived
+NEARBY_PAGE_WORKERS = 32    # Threads following page chains, across all requests; an
+                            # expanded search gets as many chains (types) as are free
 
 ###############################################################################
 # 1. GPS Location Acquisition
@@ -49,6 +87,12 @@ def get_geolocation(timeout=10):
     Returns:
         (float, float) | (None, None): The (latitude, longitude) or None if unavailable
     """
+    try:
+        from plyer import gps
+    except ImportError:
+        print("Plyer is not installed; GPS is unavailable.")
+        return None, None
+
     try:
         gps.configure(on_location=on_location)
         gps.start(minTime=1000, minDistance=0)
@@ -86,36 +130,250 @@ def find_nearby_restaurants(lat, lon, radius_value, radius_unit):
     Returns:
         list: Up to RESTAURANT_COUNT dictionaries describing nearby restaurants
     """
-    if radius_unit.lower() in ['kilometers', 'km']:
-        radius_meters = radius_value * 1000
-    elif radius_unit.lower() in ['miles', 'mi']:
-        radius_meters = radius_value * 1609.34
-    else:
+    radius_meters = radius_to_meters(radius_value, radius_unit)
+    if radius_meters is None:
         print("Invalid radius unit. Use 'miles' or 'kilometers'.")
         return []
 
-    url = "https://maps.googleapis.com/maps/api/place/nearbysearch/json"
-    params = {
-        'location': f'{lat},{lon}',
-        'radius': radius_meters,
-        'type': 'restaurant',
-        'key': othersapi_key
-    }
-    response = requests.get(url, params=params)
-    if response.status_code == 200:
-        data = response.json()
-        results = data.get('results', [])
-        return results[:RESTAURANT_COUNT]
-    else:
-        print("Google Maps API error:", response.status_code, response.text)
+    # Concurrent identical searches share one upstream call; every caller gets
+    # its own copies because later stages add fields to the dicts
+    with span("nearby_search"):
+        results = nearby_flight.do(
+            ("nearby", lat, lon, radius_meters),
+            lambda: _search_nearby(lat, lon, radius_meters),
+        )
+    return [dict(r) for r in results[:RESTAURANT_COUNT]]
+
+def _search_nearby(lat, lon, radius_meters):
+    # Serve from an already-fetched tile when this search circle is covered by it
+    cached = nearby_search_cache.lookup(lat, lon, radius_meters)
+    if cached is not None:
+        return cached
+
+    try:
+        data = places.nearby_search(lat, lon, radius_meters, place_type="restaurant")
+    except requests.RequestException as e:
+        print("Google Maps API error:", e)
+        return []
+    results = data.get('results', [])
+    if data.get("status") not in NEARBY_ANSWER_STATUS:
+        print(f"Google Maps API returned error: {data.get('status')}")
+        return []  # Not remembered, so the next search asks again
+    remember_nearby_results(lat, lon, radius_meters, results, is_complete_answer(data))
+    return results
+
+def remember_nearby_results(lat, lon, radius_meters, results, complete=False):
+    """
+    Keeps a Nearby Search answer in the tile cache and the restaurant catalog.
+    """
+    nearby_search_cache.store(lat, lon, radius_meters, results, complete=complete)
+    _restaurant_catalog().add(results)
+
+def _restaurant_catalog():
+    # Imported on first use: the catalog's KD-tree needs NumPy
+    from catalog import restaurant_catalog
+    return restaurant_catalog
+
+def find_catalog_candidates(lat, lon, radius_value, radius_unit, limit=None):
+    """
+    Candidate retrieval from the local restaurant catalog (see catalog.py)
+    instead of Google. Returns far more than RESTAURANT_COUNT candidates when the
+    catalog knows them; Google is only called when the catalog has fewer than
+    CATALOG_MIN_CANDIDATES places in range, and its results join the catalog.
+
+    Args:
+        lat (float): Latitude of current location
+        lon (float): Longitude of current location
+        radius_value (float): Numeric radius in the provided unit
+        radius_unit (str): 'miles' or 'kilometers'
+        limit (int): Maximum candidates, defaults to CATALOG_CANDIDATE_LIMIT
+
+    Returns:
+        list: Restaurant dicts, nearest first, each with a 'distance_m' field
+    """
+    from catalog import CATALOG_CANDIDATE_LIMIT, CATALOG_MIN_CANDIDATES
+
+    radius_meters = radius_to_meters(radius_value, radius_unit)
+    if radius_meters is None:
+        print("Invalid radius unit. Use 'miles' or 'kilometers'.")
         return []
+    limit = limit or CATALOG_CANDIDATE_LIMIT
+
+    catalog = _restaurant_catalog()
+    with span("catalog_search"):
+        candidates = catalog.within(lat, lon, radius_meters, limit=limit)
+    if len(candidates) < CATALOG_MIN_CANDIDATES:
+        find_nearby_restaurants(lat, lon, radius_value, radius_unit)  # Fills the gap
+        with span("catalog_search"):
+            candidates = catalog.within(lat, lon, radius_meters, limit=limit)
+    return candidates
+
+_page_pool = None
+_page_pool_lock = threading.Lock()
+_active_chains = 0          # Page chains submitted to the pool and not yet finished
+
+def _nearby_page_pool():
+    global _page_pool
+    if _page_pool is None:
+        with _page_pool_lock:
+            if _page_pool is None:
+                _page_pool = ThreadPoolExecutor(max_workers=NEARBY_PAGE_WORKERS, thread_name_prefix="nearby-pages")
+    return _page_pool
+
+def _reserve_chains(wanted):
+    """
+    Claims up to `wanted` of the page pool's free threads. Returns how many
+    were granted; each is given back by _fetch_type_pages when its chain ends.
+    """
+    global _active_chains
+    with _page_pool_lock:
+        granted = max(0, min(wanted, NEARBY_PAGE_WORKERS - _active_chains))
+        _active_chains += granted
+    return granted
+
+def _release_chain():
+    global _active_chains
+    with _page_pool_lock:
+        _active_chains -= 1
+
+def _fetch_type_pages(lat, lon, radius_meters, place_type, pages, deadline, stop, failed):
+    """
+    Follows one type's next_page_token chain, putting each page's results on
+    the `pages` queue as it arrives and None when the chain ends. Stops at
+    NEARBY_MAX_PAGES, at the deadline, or when `stop` is set; sets `failed`
+    when a page could not be fetched.
+    """
+    token = None
+    try:
+        for _ in range(NEARBY_MAX_PAGES):
+            data = places.nearby_search(lat, lon, radius_meters, place_type=place_type, page_token=token)
+            # A token used before it is valid is answered with INVALID_REQUEST
+            while token and data.get("status") == "INVALID_REQUEST" \
+                    and time.monotonic() + NEARBY_PAGE_TOKEN_DELAY / 2 < deadline:
+                if stop.wait(NEARBY_PAGE_TOKEN_DELAY / 2):
+                    return
+                data = places.nearby_search(lat, lon, radius_meters, place_type=place_type, page_token=token)
+            if data.get("status") not in NEARBY_ANSWER_STATUS:
+                print(f"Google Maps API returned error ({place_type}): {data.get('status')}")
+                failed.set()
+                return
+            pages.put(data.get("results", []))
+            token = data.get("next_page_token")
+            if not token or time.monotonic() + NEARBY_PAGE_TOKEN_DELAY >= deadline:
+                return
+            if stop.wait(NEARBY_PAGE_TOKEN_DELAY):
+                return
+    except requests.RequestException as e:
+        print(f"Google Maps API error ({place_type}):", e)
+        failed.set()
+    finally:
+        _release_chain()
+        pages.put(None)
+
+def iter_nearby_pages(lat, lon, radius_meters, budget=NEARBY_EXPANDED_BUDGET, place_types=NEARBY_EXPANDED_TYPES):
+    """
+    Expanded candidate retrieval: searches every type in place_types in
+    parallel, follows each one's next_page_token pages, and yields batches of
+    new places (deduplicated by place_id) as pages arrive, so callers can start
+    work on the first page while later ones are still being fetched. Pages
+    still missing after `budget` seconds are given up on.
+
+    Each type's chain holds one of the NEARBY_PAGE_WORKERS page threads, so
+    the fan-out shrinks with load: under contention only the first types of
+    place_types that fit are searched, and with no thread free the search
+    degrades to the single first page of find_nearby_restaurants.
+
+    Complete answers are kept in the tile cache (as type 'expanded') and every
+    place joins the restaurant catalog.
+
+    Yields:
+        list: Place dicts not yielded before
+    """
+    cached = nearby_search_cache.lookup(lat, lon, radius_meters, place_type="expanded")
+    if cached is not None:
+        yield [dict(r) for r in cached]
+        return
+
+    granted = _reserve_chains(len(place_types))
+    if not granted:
+        with span("nearby_search"):
+            results = nearby_flight.do(("nearby", lat, lon, radius_meters),
+                                       lambda: _search_nearby(lat, lon, radius_meters))
+        yield [dict(r) for r in results]
+        return
+
+    deadline = time.monotonic() + budget
+    pages = queue.Queue()
+    stop = threading.Event()
+    failed = threading.Event()
+    for place_type in place_types[:granted]:
+        _nearby_page_pool().submit(_fetch_type_pages, lat, lon, radius_meters, place_type, pages, deadline,
+                                   stop, failed)
+
+    seen = set()
+    collected = []
+    running = granted
+    try:
+        while running:
+            try:
+                page = pages.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                break  # Budget spent
+            # Take every page that has arrived meanwhile, so one batch covers them all
+            batch = []
+            while True:
+                if page is None:
+                    running -= 1
+                else:
+                    for place in page:
+                        place_id = place.get("place_id")
+                        if place_id and place_id not in seen:
+                            seen.add(place_id)
+                            batch.append(place)
+                try:
+                    page = pages.get_nowait()
+                except queue.Empty:
+                    break
+            if batch:
+                collected.extend(batch)
+                yield [dict(r) for r in batch]
+    finally:
+        stop.set()
+        _restaurant_catalog().add(collected)
+
+    # Every chain of every type finished without an error
+    if not running and granted == len(place_types) and not failed.is_set():
+        nearby_search_cache.store(lat, lon, radius_meters, collected, place_type="expanded")
+
+def radius_to_meters(radius_value, radius_unit):
+    """
+    Converts a radius in miles or kilometers to meters. Returns None for an unknown unit.
+    """
+    if radius_unit.lower() in ['kilometers', 'km']:
+        return radius_value * 1000
+    if radius_unit.lower() in ['miles', 'mi']:
+        return radius_value * 1609.34
+    return None
 
 ###############################################################################
 # 3. Google Places: Get Reviews
 ###############################################################################
+def get_place_details(place_id, fields):
+    """
+    Place Details for one place through the shared place-details service
+    (place_details.py): served from the cache when every field is fresh,
+    otherwise fetched together with the rest of the restaurant card.
+
+    Raises:
+        requests.RequestException: When Google could not be reached
+    """
+    with span("place_details"):
+        return place_details.get(place_id, fields, places)
+
 def get_reviews(restaurant_id):
     """
-    Retrieves reviews for a given restaurant ID via the Google Places Details API.
+    Retrieves reviews for a given restaurant ID via the Google Places Details API
+    (cached; see get_place_details).
 
     Args:
         restaurant_id (str): The Google Place ID
@@ -123,100 +381,249 @@ def get_reviews(restaurant_id):
     Returns:
         list of dict: Each with 'text' and 'rating' for the review
     """
-    endpoint = "https://maps.googleapis.com/maps/api/place/details/json"
-    params = {
-        "placeid": restaurant_id,
-        "fields": "reviews",
-        "key": othersapi_key
-    }
     try:
-        response = requests.get(endpoint, params=params)
-        response.raise_for_status()
-        data = response.json()
-        if data.get("status") != "OK":
-            print(f"Google Places API returned error: {data.get('status')}")
-            return []
-        reviews = data.get("result", {}).get("reviews", [])
-        return [{"text": r.get("text", ""), "rating": r.get("rating")} for r in reviews]
+        data = get_place_details(restaurant_id, "reviews")
     except requests.RequestException as e:
         print("Error contacting Google Places API:", e)
         return []
+    return parse_reviews(data)
+
+def parse_reviews(data):
+    if data.get("status") != "OK":
+        print(f"Google Places API returned error: {data.get('status')}")
+        return []
+    reviews = data.get("result", {}).get("reviews", [])
+    return [{"text": r.get("text", ""), "rating": r.get("rating")} for r in reviews]
 
 ###############################################################################
-# 4. Gemini: Single Function Call for Flavor Profiles
+# 4. Gemini: Chunked Function Calls for Flavor Profiles
 ###############################################################################
 def generate_flavor_profiles(restaurants):
     """
-    Makes ONE aggregated call to Gemini to retrieve flavor profiles for all restaurants at once.
+    Attaches a flavor profile to every restaurant. Profiles are looked up in the
+    persistent flavor-profile cache by place_id first; only the restaurants that
+    miss the cache are sent to Gemini (see request_flavor_profiles).
 
     Args:
-        restaurants (list): Each element is a dict with at least a 'name' key.
+        restaurants (list): Each element is a dict with at least a 'name' key
+                            (and normally a 'place_id').
 
     Returns:
         list: The original list with each dict having an added 'flavor_profile' field.
     """
-    generate_profiles_function = {
-        "name": "generate_flavor_profiles",
-        "description": (
-            "Generate a JSON object mapping each restaurant's name to a flavor profile "
-            "with keys: 'salty', 'umami', 'spicy', 'sweet', 'sour' (floats between 0 and 1), "
-            "and 'textures' (array of descriptive strings)."
-        ),
-        "parameters": {
-            "type": "object",
-            "properties": {
-                "profiles": {
-                    "type": "object",
-                    "description": (
-                        "A JSON object whose keys are restaurant names and whose values "
-                        "are dictionaries of the form: {"
-                        "'salty': float, 'umami': float, 'spicy': float, 'sweet': float, "
-                        "'sour': float, 'textures': [str, ...]}"
-                    )
-                }
-            },
-            "required": ["profiles"]
+    with span("flavor_profiles"):
+        cached, misses = cached_flavor_profiles(restaurants)
+
+        flavor_dict = {}
+        if misses:
+            # Concurrent requests for the same uncached set share one Gemini call
+            flavor_dict = flavor_flight.do(flavor_flight_key(misses), lambda: request_flavor_profiles(misses))
+        return attach_flavor_profiles(restaurants, cached, flavor_dict)
+
+def cached_flavor_profiles(restaurants):
+    """
+    Splits restaurants into cached profiles (place_id -> profile) and the
+    restaurants that still need a Gemini call.
+    """
+    place_ids = [r["place_id"] for r in restaurants if r.get("place_id")]
+    cached = flavor_profile_cache.get_many(place_ids)
+    return cached, [r for r in restaurants if r.get("place_id") not in cached]
+
+def flavor_flight_key(misses):
+    return ("flavor", tuple(sorted(r.get("name", "Unknown") for r in misses)))
+
+def attach_flavor_profiles(restaurants, cached, flavor_dict):
+    """
+    Sets 'flavor_profile' on every restaurant from the cache hits and Gemini's
+    answers (by name), falling back to a neutral profile, and caches new answers.
+    """
+    fallback_profile = {"salty": 0.5, "umami": 0.5, "spicy": 0.5, "sweet": 0.5, "sour": 0.5, "textures": ["varied"]}
+
+    fresh = {}
+    for r in restaurants:
+        place_id = r.get("place_id")
+        if place_id in cached:
+            r["flavor_profile"] = cached[place_id]
+            continue
+        profile = flavor_dict.get(r.get("name", ""))
+        if profile is not None and place_id:
+            fresh[place_id] = profile
+        r["flavor_profile"] = profile if profile is not None else fallback_profile
+
+    # Only real Gemini answers are cached, never the fallback
+    flavor_profile_cache.set_many(fresh)
+    return restaurants
+
+FLAVOR_PROFILE_FUNCTION = {
+    "name": "generate_flavor_profiles",
+    "description": (
+        "Generate a JSON object mapping each restaurant's name to a flavor profile "
+        "with keys: 'salty', 'umami', 'spicy', 'sweet', 'sour' (floats between 0 and 1), "
+        "and 'textures' (array of descriptive strings)."
+    ),
+    "parameters": {
+        "type": "object",
+        "properties": {
+            "profiles": {
+                "type": "object",
+                "description": (
+                    "A JSON object whose keys are restaurant names and whose values "
+                    "are dictionaries of the form: {"
+                    "'salty': float, 'umami': float, 'spicy': float, 'sweet': float, "
+                    "'sour': float, 'textures': [str, ...]}"
+                )
+            }
         },
-    }
+        "required": ["profiles"]
+    },
+}
+
+_flavor_pool = None
+_flavor_pool_lock = threading.Lock()
+
+def _gemini_pool():
+    global _flavor_pool
+    if _flavor_pool is None:
+        with _flavor_pool_lock:
+            if _flavor_pool is None:
+                _flavor_pool = ThreadPoolExecutor(max_workers=FLAVOR_MAX_PARALLEL, thread_name_prefix="gemini")
+    return _flavor_pool
+
+def request_flavor_profiles(restaurants, gemini=None):
+    """
+    Retrieves flavor profiles from Gemini for the given restaurants. Names are
+    split into chunks of FLAVOR_CHUNK_SIZE that are sent concurrently; every
+    answer is validated against FLAVOR_PROFILE_FUNCTION's schema, and only the
+    names that came back missing or malformed are retried.
+
+    Args:
+        restaurants (list): Each element is a dict with at least a 'name' key.
+        gemini (genai.Client): Client to use, defaults to get_gemini_client()
+
+    Returns:
+        dict: Restaurant name -> validated flavor profile, for every name Gemini answered.
+    """
+    gemini = gemini or get_gemini_client()
+    pending = list(dict.fromkeys(r.get("name", "Unknown") for r in restaurants))
+    profiles = {}
+
+    for attempt in range(FLAVOR_MAX_ATTEMPTS):
+        if not pending:
+            break
+        chunks = [pending[i:i + FLAVOR_CHUNK_SIZE] for i in range(0, len(pending), FLAVOR_CHUNK_SIZE)]
+        if len(chunks) == 1:
+            answers = [_request_flavor_chunk(chunks[0], gemini)]
+        else:
+            answers = list(_gemini_pool().map(lambda chunk: _request_flavor_chunk(chunk, gemini), chunks))
+        for chunk, answer in zip(chunks, answers):
+            profiles.update(match_flavor_profiles(chunk, answer))
+        pending = [name for name in pending if name not in profiles]
+        if pending and attempt + 1 < FLAVOR_MAX_ATTEMPTS:
+            print(f"Retrying Gemini flavor profiles for {len(pending)} missing or malformed restaurants.")
+
+    if pending:
+        print(f"No valid flavor profile from Gemini for {len(pending)} restaurants: {', '.join(pending)}")
+    return profiles
 
+def _request_flavor_chunk(names, gemini):
+    """
+    Makes ONE Gemini function call for a chunk of restaurant names and returns
+    the raw 'profiles' mapping (empty on any error).
+    """
+    prompt, config = flavor_chunk_request(names)
+    started = time.perf_counter()
+    try:
+        response = gemini.models.generate_content(
+            model="gemini-2.0-flash",
+            contents=prompt,
+            config=config
+        )
+    except Exception as e:
+        record_upstream("gemini", "flavor_profiles", "error", time.perf_counter() - started)
+        print("Error calling Gemini for flavor profiles:", e)
+        return {}
+    record_upstream("gemini", "flavor_profiles", "ok", time.perf_counter() - started)
+    return parse_flavor_chunk_response(response)
+
+def flavor_chunk_request(names):
+    """
+    The prompt and tool config for one flavor-profile call over names.
+    """
     prompt_lines = [
         "You are given a list of restaurant names. Please call the function "
         "'generate_flavor_profiles' and produce a JSON object mapping each restaurant's name "
         "to a flavor profile. Return ONLY the function call.\n\nRestaurants:"
     ]
-    for r in restaurants:
-        prompt_lines.append(f"- {r.get('name', 'Unknown')}")
+    for name in names:
+        prompt_lines.append(f"- {name}")
+
+    from google.genai import types
 
     prompt = "\n".join(prompt_lines)
-    flavor_profiles_tool = types.Tool(function_declarations=[generate_profiles_function])
+    flavor_profiles_tool = types.Tool(function_declarations=[FLAVOR_PROFILE_FUNCTION])
     config = types.GenerateContentConfig(tools=[flavor_profiles_tool])
+    return prompt, config
 
-    response = client.models.generate_content(
-        model="gemini-2.0-flash",
-        contents=prompt,
-        config=config
-    )
-
-    candidate = response.candidates[0]
-    content_parts = candidate.content.parts
-    flavor_dict = {}
+def parse_flavor_chunk_response(response):
+    """
+    Extracts the raw 'profiles' mapping from a Gemini response (empty on any error).
+    """
+    try:
+        content_parts = response.candidates[0].content.parts
+    except Exception as e:
+        print("Error calling Gemini for flavor profiles:", e)
+        return {}
 
     if content_parts and content_parts[0].function_call:
         fn_call = content_parts[0].function_call
         if fn_call.name == "generate_flavor_profiles":
             args = fn_call.args or {}
-            flavor_dict = args.get("profiles", {})
-        else:
-            print(f"Unexpected function call name: {fn_call.name}")
+            profiles = args.get("profiles", {})
+            return profiles if isinstance(profiles, dict) else {}
+        print(f"Unexpected function call name: {fn_call.name}")
     else:
-        print("No function call found in Gemini response. Returning restaurants without flavor profiles.")
+        print("No function call found in Gemini response.")
+    return {}
 
-    fallback_profile = {"salty": 0.5, "umami": 0.5, "spicy": 0.5, "sweet": 0.5, "sour": 0.5, "textures": ["varied"]}
-    for r in restaurants:
-        name = r.get("name", "")
-        r["flavor_profile"] = flavor_dict.get(name, fallback_profile)
+def match_flavor_profiles(names, answer):
+    """
+    Pairs requested names with Gemini's answer (tolerating case and whitespace
+    differences in the keys) and keeps only profiles that pass validation.
+    """
+    by_key = {str(key).strip().casefold(): value for key, value in answer.items()}
+    matched = {}
+    for name in names:
+        profile = validate_flavor_profile(answer.get(name, by_key.get(name.strip().casefold())))
+        if profile is not None:
+            matched[name] = profile
+    return matched
 
-    return restaurants
+def validate_flavor_profile(raw):
+    """
+    Checks one profile against the function declaration's schema: the five
+    tastes must be numbers in [0, 1] and 'textures' a list of strings.
+
+    Returns:
+        dict | None: The normalized profile, or None if it is malformed
+    """
+    if not isinstance(raw, dict):
+        return None
+    profile = {}
+    for taste in TASTE_KEYS:
+        try:
+            value = float(raw.get(taste))
+        except (TypeError, ValueError):
+            return None
+        if not math.isfinite(value) or not 0 <= value <= 1:
+            return None
+        profile[taste] = value
+    textures = raw.get("textures", [])
+    if isinstance(textures, str):
+        textures = [textures]
+    if not isinstance(textures, list):
+        return None
+    profile["textures"] = [str(t) for t in textures if str(t).strip()]
+    return profile
 
 ###############################################################################
 # 5. Generating Restaurant Recommendations
@@ -224,48 +631,227 @@ def generate_flavor_profiles(restaurants):
 def generate_recommendations(user_profile, restaurants, tried_foods, n):
     """
     Filters out:
-      - Restaurants the user has already tried,
-      - Restaurants conflicting with user's dietary restrictions,
+      - Restaurants the user has already tried (tried_foods plus the profile's
+        persisted 'tried_foods'),
+      - Restaurants conflicting with user's dietary restrictions or allergies,
       - Restaurants that are currently not open,
     then uses a single Gemini call to get flavor profiles for the filtered restaurants.
 
     Finally, it computes a similarity score for each restaurant vs. the user's tastes,
-    and returns the top n recommendations as a DataFrame.
-    """
-    filtered = [r for r in restaurants if r.get("name", "").lower() not in [t.lower() for t in tried_foods]]
-    if "gluten-free" in user_profile.get("dietary_restrictions", []):
-        filtered = [r for r in filtered if "burger" not in r.get("name", "").lower()]
-    filtered = [r for r in filtered if r.get("opening_hours", {}).get("open_now") == True]
-    filtered = generate_flavor_profiles(filtered)
-
-    records = []
-    for r in filtered:
-        flavor = r.get("flavor_profile", {})
-        records.append({
-            "restaurant_id": r.get("place_id"),
-            "name": r.get("name"),
-            "vicinity": r.get("vicinity"),
-            "salty": flavor.get("salty", 0),
-            "umami": flavor.get("umami", 0),
-            "spicy": flavor.get("spicy", 0),
-            "sweet": flavor.get("sweet", 0),
-            "sour": flavor.get("sour", 0),
-            "textures": ", ".join(flavor.get("textures", []))
-        })
-
-    df = pd.DataFrame(records)
-
-    def similarity(row):
-        score = 0.0
-        for taste_key in ["salty", "umami", "spicy", "sweet", "sour"]:
-            user_val = user_profile["favorite_tastes"].get(taste_key, 0)
-            rest_val = row[taste_key]
-            score += 1 - abs(user_val - rest_val)
-        return score / 5
-
-    df["similarity"] = df.apply(similarity, axis=1)
-    df = df.sort_values("similarity", ascending=False).head(n)
-    return df
+    and returns the top n recommendations as a list of Recommendation records,
+    best first.
+    """
+    filtered = filter_candidates(user_profile, restaurants, tried_foods)
+    return rank_candidates(user_profile, generate_flavor_profiles(filtered), n)
+
+def generate_expanded_recommendations(user_profile, lat, lon, radius_value, radius_unit, tried_foods, n,
+                                      budget=NEARBY_EXPANDED_BUDGET):
+    """
+    generate_recommendations over the expanded candidate pool of
+    iter_nearby_pages. Candidates are streamed: each batch is filtered and
+    sent for flavor profiles as soon as its pages arrive, so Gemini works on
+    the first pages while Google is still serving the next ones, and the
+    final ranking covers every candidate that arrived within the budget.
+
+    Returns:
+        list: The top n Recommendation records, best first
+    """
+    radius_meters = radius_to_meters(radius_value, radius_unit)
+    if radius_meters is None:
+        print("Invalid radius unit. Use 'miles' or 'kilometers'.")
+        return []
+
+    profiled = []
+    for batch in iter_nearby_pages(lat, lon, radius_meters, budget):
+        filtered = filter_candidates(user_profile, batch, tried_foods)
+        if filtered:
+            profiled.extend(generate_flavor_profiles(filtered))
+    return rank_candidates(user_profile, profiled, n)
+
+def filter_candidates(user_profile, restaurants, tried_foods):
+    """
+    The restaurants that are open, untried and free of dietary or allergy conflicts.
+    """
+    with span("filter"):
+        index = CandidateIndex(restaurants)
+        return index.filter(user_profile, tried_set(tried_foods, user_profile.get("tried_foods")))
+
+def rank_candidates(user_profile, restaurants, n):
+    """
+    Scores restaurants that already carry a 'flavor_profile' against the user's
+    tastes and returns the top n as Recommendation records, best first.
+    """
+    with span("scoring"):
+        from scoring import score, taste_matrix, taste_vector, top_n
+
+        records = [Recommendation.from_restaurant(r) for r in restaurants]
+        if not records:
+            return []
+
+        # Score every candidate in one vectorized pass, then keep only the top n
+        similarities = score(taste_matrix(records), taste_vector(user_profile["favorite_tastes"]))
+        best = top_n(similarities, n)
+        return [records[i].with_similarity(float(similarities[i])) for i in best]
+
+def find_taste_matches(user_profile, k, lat=None, lon=None, radius_value=None, radius_unit="miles"):
+    """
+    City-wide "restaurants like my profile" query against the taste index
+    (see taste_index.py), which covers every restaurant with a cached flavor
+    profile rather than only the ones just fetched from Google. Restaurants the
+    user has tried or that conflict with their dietary restrictions or
+    allergies are skipped.
+
+    Args:
+        user_profile (dict): The user's profile
+        k (int): Number of matches
+        lat, lon (float): Optional search center
+        radius_value (float): Optional radius around (lat, lon)
+        radius_unit (str): 'miles' or 'kilometers'
+
+    Returns:
+        list: Recommendation records, best first
+    """
+    from taste_index import get_taste_index
+
+    radius_meters = None
+    if radius_value is not None and lat is not None and lon is not None:
+        radius_meters = radius_to_meters(radius_value, radius_unit)
+        if radius_meters is None:
+            print("Invalid radius unit. Use 'miles' or 'kilometers'.")
+            return []
+
+    index = get_taste_index()
+    exclude = tried_set(user_profile.get("tried_foods"))
+    fetch = k
+    while True:
+        with span("taste_index"):
+            matches = index.search(
+                user_profile["favorite_tastes"],
+                user_profile.get("texture_preferences"),
+                k=fetch, lat=lat, lon=lon, radius_meters=radius_meters, exclude=exclude,
+            )
+        # Drop dietary and allergy conflicts the same way filter_candidates does,
+        # fetching more matches until k are left or the index runs out
+        records = [index.record(row) for row, _ in matches]
+        conflicts = CandidateIndex(records).conflicting(user_profile)
+        kept = [(record, similarity) for i, (record, (_, similarity)) in enumerate(zip(records, matches))
+                if i not in conflicts]
+        if len(kept) >= k or len(matches) < fetch:
+            break
+        fetch *= 2
+    return [Recommendation.from_restaurant(record).with_similarity(similarity) for record, similarity in kept[:k]]
+
+def record_tried_foods(user_id, names, user_profile=None):
+    """
+    Persists restaurant names as tried in the user's profile, so later
+    requests exclude them without the client sending them again. Given the
+    already loaded profile, nothing is written when every name is in it.
+
+    Returns:
+        dict | None: The updated profile, or None if the user does not exist
+    """
+    if user_profile is not None and tried_set(names) <= tried_set(user_profile.get("tried_foods")):
+        return user_profile
+    return get_profile_store().update(user_id, lambda profile: merge_tried_foods(profile, names))
+
+def group_batch_requests(batch):
+    """
+    Groups batch users whose search areas overlap. A user joins the first group
+    whose anchor (first member) is within BATCH_GROUP_DISTANCE_M; groups are
+    indexed by geohash cell so only neighbouring cells are checked.
+
+    Args:
+        batch (list): Dicts with 'lat', 'lon' and 'radius_meters'
+
+    Returns:
+        list: Lists of batch entries; each list shares one candidate search
+    """
+    groups = []
+    by_cell = {}
+    for entry in batch:
+        target = None
+        for cell in geohash_neighborhood(entry["lat"], entry["lon"], BATCH_GROUP_PRECISION):
+            for group in by_cell.get(cell, []):
+                anchor = group[0]
+                if haversine_m(anchor["lat"], anchor["lon"], entry["lat"], entry["lon"]) <= BATCH_GROUP_DISTANCE_M:
+                    target = group
+                    break
+            if target is not None:
+                break
+        if target is None:
+            target = []
+            groups.append(target)
+            cell = geohash_encode(entry["lat"], entry["lon"], BATCH_GROUP_PRECISION)
+            by_cell.setdefault(cell, []).append(target)
+        target.append(entry)
+    return groups
+
+def generate_batch_recommendations(batch):
+    """
+    Recommends restaurants for many users at once. Users are grouped by
+    overlapping search area; each member gets the nearby search a single
+    request would make (overlapping ones are served by the tile cache), each
+    group gets ONE flavor-profile pass over the merged candidates, and all
+    members are scored against the shared candidate matrix in a single
+    score_batch call.
+
+    Args:
+        batch (list): Dicts with 'user_profile', 'lat', 'lon', 'radius_meters',
+                      'tried_foods' and 'n'
+
+    Returns:
+        list: One list of Recommendation records per batch entry, in input order
+    """
+    from scoring import score_batch, taste_matrix, top_n
+
+    results = [None] * len(batch)
+    indexed = [dict(entry, index=i) for i, entry in enumerate(batch)]
+
+    for group in group_batch_requests(indexed):
+        # Every member searches its own circle, exactly as a single request
+        # would (one search over a circle around the whole group would be cut
+        # to RESTAURANT_COUNT places shared by all members). Overlapping
+        # circles are mostly served by the tile cache; the results are merged
+        # into one candidate list
+        restaurants = []
+        positions = {}
+        member_rows = []
+        for e in group:
+            rows = set()
+            for r in find_nearby_restaurants(e["lat"], e["lon"], e["radius_meters"] / 1000, "km"):
+                key = r.get("place_id") or r.get("name")
+                if key not in positions:
+                    positions[key] = len(restaurants)
+                    restaurants.append(r)
+                rows.add(positions[key])
+            member_rows.append(rows)
+
+        # Which candidates each member may see: its own search results that pass its filters
+        index = CandidateIndex(restaurants)
+        eligible = []
+        for e, rows in zip(group, member_rows):
+            tried = tried_set(e["tried_foods"], e["user_profile"].get("tried_foods"))
+            mask = index.eligible(e["user_profile"], tried)
+            eligible.append([ok and i in rows for i, ok in enumerate(mask)])
+
+        wanted = [i for i in range(len(restaurants)) if any(mask[i] for mask in eligible)]
+        candidates = generate_flavor_profiles([restaurants[i] for i in wanted])
+        records = [Recommendation.from_restaurant(r) for r in candidates]
+        if not records:
+            for e in group:
+                results[e["index"]] = []
+            continue
+
+        user_matrix = taste_matrix([e["user_profile"]["favorite_tastes"] for e in group])
+        similarities = score_batch(taste_matrix(records), user_matrix)
+        for row, e in enumerate(group):
+            allowed = [eligible[row][i] for i in wanted]
+            user_scores = similarities[row].copy()
+            user_scores[[not ok for ok in allowed]] = -1.0  # Below any real similarity
+            best = top_n(user_scores, min(e["n"], sum(allowed)))
+            results[e["index"]] = [records[i].with_similarity(float(user_scores[i])) for i in best]
+
+    return results
 
 ###############################################################################
 # 6. Push Notification & Feedback
@@ -283,69 +869,55 @@ def push_feedback(user_profile, restaurant, user_id):
     return favorability, comment
 
 ###############################################################################
-# 7. Manage User Profiles in CSV
+# 7. Manage User Profiles (see profile_store.py)
 ###############################################################################
 def get_user_profile(user_id):
-    csv_file = os.path.join("personaldata", f"{user_id}_profile.csv")
-    try:
-        df = pd.read_csv(csv_file)
-    except FileNotFoundError:
-        print(f"Error: Could not find '{csv_file}' for user {user_id}.")
-        return None
-
-    row = df.iloc[0].to_dict()
-    favorite_tastes = {k: row.get(k, 0) for k in ["salty", "umami", "spicy", "sweet", "sour"]}
+    with span("profile_load"):
+        user_profile = get_profile_store().get(user_id)
+    if user_profile is None:
+        print(f"Error: Could not find a profile for user {user_id}.")
+    return user_profile
 
-    def parse_list(val):
-        if pd.isna(val):
-            return []
-        return [x.strip() for x in val.split(",") if x.strip()]
-
-    return {
-        "user_id": row.get("user_id"),
-        "favorite_tastes": favorite_tastes,
-        "texture_preferences": parse_list(row.get("texture_preferences", "")),
-        "dietary_restrictions": parse_list(row.get("dietary_restrictions", "")),
-        "allergies": parse_list(row.get("allergies", ""))
-    }
+def get_user_profile_as_of(user_id, when):
+    """
+    The stored profile with its tastes as they were at `when` (epoch seconds),
+    replayed from the user's taste history. None if the user is unknown or
+    their history starts after `when`.
+    """
+    user_profile = get_user_profile(user_id)
+    if user_profile is None:
+        return None
+    with span("profile_history"):
+        tastes = taste_history.as_of(user_id, when)
+    if tastes is None:
+        return None
+    return {**user_profile, "favorite_tastes": tastes, "as_of": when}
 
 def update_user_profile(user_profile, favorability, comment, user_id):
-    csv_file = os.path.join("personaldata", f"{user_id}_profile.csv")
-    comment_lower = comment.lower()
-
-    for taste in ["salty", "umami", "spicy", "sweet", "sour"]:
-        if f"too {taste}" in comment_lower:
-            old_val = user_profile["favorite_tastes"][taste]
-            new_val = max(old_val - 0.1, 0)
-            user_profile["favorite_tastes"][taste] = new_val
-            print(f"Updated {taste}: {old_val} -> {new_val}")
-        elif f"not {taste} enough" in comment_lower:
-            old_val = user_profile["favorite_tastes"][taste]
-            new_val = min(old_val + 0.1, 1)
-            user_profile["favorite_tastes"][taste] = new_val
+    """
+    Applies one feedback comment to the stored profile right away (see
+    feedback.apply_feedback). The API records feedback through
+    feedback.record_feedback instead, which batches updates in the background.
+    """
+    def apply_comment(profile):
+        # Runs inside the store's transaction, against the latest stored values
+        changes = apply_feedback(profile, [comment])
+        for taste, (old_val, new_val) in changes.items():
             print(f"Updated {taste}: {old_val} -> {new_val}")
 
     try:
-        df = pd.read_csv(csv_file)
-        df["dietary_restrictions"] = df["dietary_restrictions"].fillna("").astype(str)
-        df["allergies"] = df["allergies"].fillna("").astype(str)
-
-        idx = df.index[df["user_id"] == user_id]
-        if not idx.empty:
-            for taste in ["salty", "umami", "spicy", "sweet", "sour"]:
-                df.loc[idx, taste] = user_profile["favorite_tastes"][taste]
-            df.loc[idx, "texture_preferences"] = ", ".join(user_profile["texture_preferences"])
-            df.loc[idx, "dietary_restrictions"] = ", ".join(user_profile["dietary_restrictions"])
-            df.loc[idx, "allergies"] = ", ".join(user_profile["allergies"])
-            df.to_csv(csv_file, index=False)
-            print(f"Profile for user {user_id} updated and saved.")
-        else:
-            print(f"User {user_id} not found in CSV '{csv_file}'.")
+        updated = get_profile_store().update(user_id, apply_comment)
     except Exception as e:
-        print("Error updating CSV:", e)
+        print("Error updating profile:", e)
+        return
+    if updated is None:
+        print(f"User {user_id} not found in the profile store.")
+        return
+    user_profile["favorite_tastes"].update(updated["favorite_tastes"])
+    print(f"Profile for user {user_id} updated and saved.")
 
 ###############################################################################
-# 8. Create new userdata.csv for onboarding based on favorite foods
+# 8. Create a new user profile for onboarding based on favorite foods
 ###############################################################################
 def build_onboarding_profile(user_id, favorites_df, dietary_list=None, allergies_list=None):
     """
@@ -358,8 +930,7 @@ def build_onboarding_profile(user_id, favorites_df, dietary_list=None, allergies
     dietary_list and allergies_list are also provided as lists of strings
     from the API call, instead of prompting interactively.
 
-    Then writes the new user profile to personaldata/<user_id>_profile.csv
-    for future use.
+    Then writes the new user profile to the profile store for future use.
 
     Args:
         user_id (str): Unique identifier for the user.
@@ -411,15 +982,22 @@ def build_onboarding_profile(user_id, favorites_df, dietary_list=None, allergies
     prompt = "\n".join(prompt_lines)
 
     # Create a "Tool" for Gemini's function calling
+    from google.genai import types
     build_profile_tool = types.Tool(function_declarations=[build_profile_function])
     config = types.GenerateContentConfig(tools=[build_profile_tool])
 
     # Make a single Gemini call
-    response = client.models.generate_content(
-        model="gemini-2.0-flash",
-        contents=prompt,
-        config=config
-    )
+    started = time.perf_counter()
+    try:
+        response = get_gemini_client().models.generate_content(
+            model="gemini-2.0-flash",
+            contents=prompt,
+            config=config
+        )
+    except Exception:
+        record_upstream("gemini", "onboarding_profile", "error", time.perf_counter() - started)
+        raise
+    record_upstream("gemini", "onboarding_profile", "ok", time.perf_counter() - started)
 
     # Parse the Gemini response
     candidate = response.candidates[0]
@@ -454,24 +1032,9 @@ def build_onboarding_profile(user_id, favorites_df, dietary_list=None, allergies
         "allergies": allergies_list if allergies_list else []
     }
 
-    # Write user profile to personaldata/<user_id>_profile.csv
-    os.makedirs("personaldata", exist_ok=True)
-    csv_file = os.path.join("personaldata", f"{user_id}_profile.csv")
-
-    row_dict = {
-        "user_id": user_profile["user_id"],
-        "salty": user_profile["favorite_tastes"]["salty"],
-        "umami": user_profile["favorite_tastes"]["umami"],
-        "spicy": user_profile["favorite_tastes"]["spicy"],
-        "sweet": user_profile["favorite_tastes"]["sweet"],
-        "sour":  user_profile["favorite_tastes"]["sour"],
-        "texture_preferences": ", ".join(user_profile["texture_preferences"]),
-        "dietary_restrictions": ", ".join(user_profile["dietary_restrictions"]),
-        "allergies": ", ".join(user_profile["allergies"]),
-    }
-
-    df = pd.DataFrame([row_dict])
-    df.to_csv(csv_file, index=False)
-    print(f"Created user profile at '{csv_file}'.")
+    # Write user profile to the profile store; its history starts over from here
+    get_profile_store().save(user_profile)
+    taste_history.record_base(user_id, user_profile["favorite_tastes"])
+    print(f"Created user profile for '{user_id}'.")
 
-    return user_profile
\ No newline at end of file
+    return user_profile
@@ -1,21 +1,78 @@
-from flask import Flask, request, jsonify
-import pandas as pd
+from flask import Blueprint, Flask, Response, g, request, jsonify
+import hashlib
+import json
 import os
+import requests
+import time
+from datetime import datetime
 
-from app import *
+# Only light modules are imported here; pandas, numpy, google-genai and plyer
+# are loaded by app.py the first time a request actually needs them.
+from app import (
+    NEARBY_EXPANDED_BUDGET,
+    find_catalog_candidates,
+    find_nearby_restaurants,
+    find_taste_matches,
+    generate_batch_recommendations,
+    generate_expanded_recommendations,
+    generate_recommendations,
+    get_place_details,
+    get_user_profile,
+    get_user_profile_as_of,
+    radius_to_meters,
+    record_tried_foods,
+)
+from cache import start_cache_purger
+from feedback import feedback_applier, record_feedback
+from jobs import UPLOAD_DIR, QueueFullError, job_queue, remove_upload
+from metrics import (
+    SERVER_TIMING_REQUEST_HEADER,
+    finish_request_spans,
+    render_prometheus,
+    span,
+    start_request_spans,
+    wants_server_timing,
+)
+from results import dumps
+from singleflight import all_stats as coalescing_stats
 
-current_dir = os.path.dirname(os.path.abspath(__file__))
-key_dir = os.path.abspath(os.path.join(current_dir, ".."))
-if key_dir not in sys.path:
-    sys.path.insert(0, key_dir)
-from APIkey import othersapi_key, geminiapi_key
+api = Blueprint("api", __name__)
 
-from flask_cors import CORS  # For cross-origin support
+def create_app():
+    """
+    Application factory: builds the Flask app and registers every endpoint.
+    """
+    from flask_cors import CORS  # For cross-origin support
+
+    flask_app = Flask(__name__)
+    CORS(flask_app)  # Allow cross-origin requests so React can call your Flask server
+    flask_app.register_blueprint(api)
+    job_queue.start()  # Resume jobs queued before a restart
+    start_cache_purger()  # Sweep expired cache rows now and every few hours
+    feedback_applier.start()  # Apply feedback logged before a restart
+    return flask_app
+
+@api.before_app_request
+def start_server_timing():
+    # Spans are only collected for requests that will report them
+    if wants_server_timing(request.headers.get(SERVER_TIMING_REQUEST_HEADER)):
+        g.server_timing = (start_request_spans(), time.perf_counter())
 
-app = Flask(__name__)
-CORS(app)  # Allow cross-origin requests so React can call your Flask server
+@api.after_app_request
+def add_server_timing(response):
+    timing = g.pop("server_timing", None)
+    if timing is not None:
+        token, started = timing
+        stages = finish_request_spans(token)
+        total = f"total;dur={(time.perf_counter() - started) * 1000:.2f}"
+        response.headers["Server-Timing"] = f"{stages}, {total}" if stages else total
+    return response
 
-@app.route("/onboarding/<user_id>", methods=["POST"])
+@api.route("/health", methods=["GET"])
+def health():
+    return jsonify({"status": "ok"})
+
+@api.route("/onboarding/<user_id>", methods=["POST"])
 def onboard_user(user_id):
     """
     Onboard a new user by creating their initial taste profile.
@@ -25,31 +82,128 @@ def onboard_user(user_id):
       "dietary_restrictions": ["gluten-free", "halal"],
       "allergies": ["nuts", "shellfish"]
     }
+
+    The profile is built by a background job (one Gemini call); the response
+    is 202 with the job, whose status is at /jobs/<job_id>. Repeating the same
+    request returns the same job.
     """
     data = request.get_json(force=True)
-    favorites_list = data.get("favorites", [])
-    dietary_list = data.get("dietary_restrictions", [])
-    allergies_list = data.get("allergies", [])
-
-    favorites_df = pd.DataFrame({"food_name": favorites_list})
-    user_profile = build_onboarding_profile(
-        user_id, favorites_df,
-        dietary_list=dietary_list,
-        allergies_list=allergies_list
-    )
-    return jsonify({
-        "message": f"Onboarding complete for user {user_id}",
-        "user_profile": user_profile
-    })
-
-@app.route("/userprofile/<user_id>", methods=["GET"])
-def api_user_profile(user_id):
-    user_profile = get_user_profile(user_id)
+    payload = {
+        "user_id": user_id,
+        "favorites": data.get("favorites", []),
+        "dietary_restrictions": data.get("dietary_restrictions", []),
+        "allergies": data.get("allergies", []),
+    }
+    digest = hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()[:16]
+    return submit_job("onboarding", payload, f"onboarding:{user_id}:{digest}", user_id,
+                      f"Onboarding queued for user {user_id}")
+
+@api.route("/takeout/<user_id>", methods=["POST"])
+def upload_takeout(user_id):
+    """
+    Queues ingestion of a Google Takeout location history (plain JSON, gzip or
+    zip), sent as the multipart field 'file' or as the raw request body. The
+    response is 202 with the job; uploading the same file again returns the
+    same job and keeps no second copy. The upload is deleted once its job is
+    done or has failed (see jobs.remove_upload).
+    """
+    upload = request.files.get("file")
+    stream = upload.stream if upload is not None else request.stream
+
+    # Stream to disk while hashing, so large archives are never held in memory
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    sha = hashlib.sha256()
+    tmp_path = os.path.join(UPLOAD_DIR, f"{user_id}_{time.time_ns()}.part")
+    size = 0
+    with open(tmp_path, "wb") as f:
+        for chunk in iter(lambda: stream.read(1024 * 1024), b""):
+            sha.update(chunk)
+            f.write(chunk)
+            size += len(chunk)
+    if size == 0:
+        os.remove(tmp_path)
+        return jsonify({"error": "No location history uploaded"}), 400
+
+    digest = sha.hexdigest()[:16]
+    key = f"takeout:{user_id}:{digest}"
+    message = f"Takeout ingestion queued for user {user_id}"
+    job = job_queue.find(key)
+    if job is not None and job["status"] != "failed":
+        # Already queued, running or ingested: the queued job has its own copy
+        os.remove(tmp_path)
+        return jsonify({"message": message, "job": job, "status_url": f"/jobs/{job['job_id']}"}), 202
+
+    path = os.path.abspath(os.path.join(UPLOAD_DIR, f"{user_id}_{digest}.takeout"))
+    os.replace(tmp_path, path)
+    response, status = submit_job("takeout", {"user_id": user_id, "path": path}, key, user_id, message)
+    if status != 202:
+        remove_upload({"path": path})  # Refused; nothing will ever read it
+    return response, status
+
+def submit_job(kind, payload, key, user_id, message):
+    """
+    Submits a job and shapes the 202 response (503 when the queue is full).
+    """
+    try:
+        job = job_queue.submit(kind, payload, key=key, user_id=user_id)
+    except QueueFullError as e:
+        response = jsonify({"error": f"Too many background jobs pending, try again later ({e})"})
+        response.headers["Retry-After"] = "30"
+        return response, 503
+    return jsonify({"message": message, "job": job, "status_url": f"/jobs/{job['job_id']}"}), 202
+
+@api.route("/jobs/<job_id>", methods=["GET"])
+def api_job_status(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": f"Job {job_id} not found."}), 404
+    return jsonify(job)
+
+@api.route("/jobs", methods=["GET"])
+def api_jobs():
+    """
+    Most recent background jobs, optionally for one user (?user_id=...), with
+    the number of jobs in each status.
+    """
+    user_id = request.args.get("user_id")
+    limit = min(int(request.args.get("limit", 50)), 500)
+    return jsonify({"jobs": job_queue.list(user_id=user_id, limit=limit), "counts": job_queue.counts()})
+
+def parse_as_of(value):
+    """
+    Parses an ?as_of= value, epoch seconds or ISO 8601, to epoch seconds.
+    Raises ValueError if it is neither.
+    """
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+def user_profile_response(user_id, as_of=None):
+    """
+    (status, body) for GET /userprofile, shared with asgi_service.py. With
+    as_of, the tastes are the ones the user had at that time.
+    """
+    if as_of is None:
+        user_profile = get_user_profile(user_id)
+        if user_profile is None:
+            return 404, {"error": f"Profile for {user_id} not found."}
+        return 200, user_profile
+    try:
+        when = parse_as_of(as_of)
+    except ValueError:
+        return 400, {"error": "as_of must be epoch seconds or an ISO 8601 time."}
+    user_profile = get_user_profile_as_of(user_id, when)
     if user_profile is None:
-        return jsonify({"error": f"Profile for {user_id} not found."}), 404
-    return jsonify(user_profile)
+        return 404, {"error": f"No profile history for {user_id} as of {as_of}."}
+    return 200, user_profile
+
+@api.route("/userprofile/<user_id>", methods=["GET"])
+def api_user_profile(user_id):
+    status, body = user_profile_response(user_id, request.args.get("as_of"))
+    return jsonify(body), status
 
-@app.route("/restaurants", methods=["GET"])
+@api.route("/restaurants", methods=["GET"])
 def api_find_restaurants():
     lat = float(request.args.get("lat", 48.8575))
     lon = float(request.args.get("lon", 2.3514))
@@ -58,7 +212,7 @@ def api_find_restaurants():
     results = find_nearby_restaurants(lat, lon, radius_value, radius_unit)
     return jsonify(results)
 
-@app.route("/recommendations/<user_id>", methods=["POST"])
+@api.route("/recommendations/<user_id>", methods=["POST"])
 def api_recommendations(user_id):
     data = request.get_json(force=True)
     lat = data.get("lat", 48.8575)
@@ -67,19 +221,98 @@ def api_recommendations(user_id):
     radius_unit = data.get("radius_unit", "miles")
     tried = data.get("triedFoods", [])
     n = data.get("n", 5)  # default to 5 if not provided
+    # 'places' asks Google every time; 'catalog' ranks over the local catalog;
+    # 'expanded' follows every page of several place types (see iter_nearby_pages)
+    candidate_source = data.get("candidate_source", "places")
 
     user_profile = get_user_profile(user_id)
     if user_profile is None:
         return jsonify({"error": f"No profile for user {user_id}"}), 404
+    record_tried_foods(user_id, tried, user_profile)  # Remembered for later requests
 
     # (Find restaurants using lat/lon, radius_value, etc.)
-    restaurants = find_nearby_restaurants(lat, lon, radius_value, radius_unit)
+    if candidate_source == "expanded":
+        # Retrieval and scoring are interleaved, under a caller-adjustable time budget
+        budget = min(float(data.get("budget_s", NEARBY_EXPANDED_BUDGET)), NEARBY_EXPANDED_BUDGET)
+        recs = generate_expanded_recommendations(user_profile, lat, lon, radius_value, radius_unit, tried, n, budget)
+    else:
+        if candidate_source == "catalog":
+            restaurants = find_catalog_candidates(lat, lon, radius_value, radius_unit)
+        else:
+            restaurants = find_nearby_restaurants(lat, lon, radius_value, radius_unit)
+
+        # Pass the 'n' to generate_recommendations
+        recs = generate_recommendations(user_profile, restaurants, tried, n)
+    with span("serialize"):
+        body = dumps({"recommendations": recs})
+    return Response(body, mimetype="application/json")
+
+@api.route("/recommendations/batch", methods=["POST"])
+def api_batch_recommendations():
+    """
+    Recommendations for many users in one call. Users whose search areas
+    overlap share one nearby search and one flavor-profile pass.
+    POST body example:
+    {
+      "users": [
+        {"user_id": "alice", "lat": 38.627, "lon": -90.1994, "radius_value": 2,
+         "radius_unit": "miles", "triedFoods": [], "n": 5},
+        ...
+      ]
+    }
+    """
+    data = request.get_json(force=True)
+    results = {}
+    batch = []
+    for entry in data.get("users", []):
+        user_id = entry.get("user_id")
+        user_profile = get_user_profile(user_id)
+        if user_profile is None:
+            results[user_id] = {"error": f"No profile for user {user_id}"}
+            continue
+        radius_meters = radius_to_meters(entry.get("radius_value", 2), entry.get("radius_unit", "miles"))
+        if radius_meters is None:
+            results[user_id] = {"error": "Invalid radius unit. Use 'miles' or 'kilometers'."}
+            continue
+        record_tried_foods(user_id, entry.get("triedFoods", []), user_profile)
+        batch.append({
+            "user_id": user_id,
+            "user_profile": user_profile,
+            "lat": float(entry.get("lat", 48.8575)),
+            "lon": float(entry.get("lon", 2.3514)),
+            "radius_meters": radius_meters,
+            "tried_foods": entry.get("triedFoods", []),
+            "n": int(entry.get("n", 5)),
+        })
+
+    for entry, recs in zip(batch, generate_batch_recommendations(batch)):
+        results[entry["user_id"]] = {"recommendations": recs}
+    with span("serialize"):
+        body = dumps({"results": results})
+    return Response(body, mimetype="application/json")
+
+@api.route("/taste-matches/<user_id>", methods=["GET"])
+def api_taste_matches(user_id):
+    """
+    Restaurants anywhere in the taste index closest to the user's profile.
+    Pass lat, lon and radius_value (plus radius_unit) to limit the distance.
+    """
+    k = request.args.get("k", 10, type=int)
+    lat = request.args.get("lat", type=float)
+    lon = request.args.get("lon", type=float)
+    radius_value = request.args.get("radius_value", type=float)
+    radius_unit = request.args.get("radius_unit", "miles")
+
+    user_profile = get_user_profile(user_id)
+    if user_profile is None:
+        return jsonify({"error": f"No profile for user {user_id}"}), 404
 
-    # Pass the 'n' to generate_recommendations
-    recs_df = generate_recommendations(user_profile, restaurants, tried, n)
-    return jsonify({"recommendations": recs_df.to_dict(orient="records")})
+    matches = find_taste_matches(user_profile, k, lat, lon, radius_value, radius_unit)
+    with span("serialize"):
+        body = dumps({"matches": matches})
+    return Response(body, mimetype="application/json")
 
-@app.route("/feedback/<user_id>", methods=["POST"])
+@api.route("/feedback/<user_id>", methods=["POST"])
 def api_feedback(user_id):
     """
     POST body example:
@@ -94,43 +327,40 @@ def api_feedback(user_id):
     favorability = float(data.get("favorability", 0.0))
     comment = data.get("comment", "")
 
-    user_profile = get_user_profile(user_id)
-    if user_profile is None:
+    if get_user_profile(user_id) is None:
         return jsonify({"error": f"No profile for user {user_id}"}), 404
 
-    mock_restaurant = {"name": restaurant_name}
-    push_feedback(user_profile, mock_restaurant, user_id)
-    return jsonify({"message": f"Feedback recorded for {restaurant_name}."})
+    # Logged and acknowledged now; the profile is updated by the background applier
+    event_id = record_feedback(user_id, restaurant_name, favorability, comment)
+    return jsonify({"message": f"Feedback recorded for {restaurant_name}.", "event_id": event_id}), 202
 
-@app.route("/restaurant/<restaurant_id>", methods=["GET"])
+@api.route("/restaurant/<restaurant_id>", methods=["GET"])
 def api_restaurant_info(restaurant_id):
     """
-    Returns detailed info about a specific restaurant (place_id) by calling Google Places Details API.
+    Returns detailed info about a specific restaurant (place_id) from the Google Places Details API,
+    served from the shared place-details cache when fresh (see app.get_place_details).
     This 'restaurant_id' should be the Google 'place_id' from your recommendations data.
     """
-    endpoint = "https://maps.googleapis.com/maps/api/place/details/json"
-    params = {
-        "placeid": restaurant_id,  # The place_id from the URL param
-        "fields": (
-            # Which fields we want from Google Places
-            "name,formatted_address,formatted_phone_number,website,"
-            "opening_hours,geometry,reviews"
-        ),
-        "key": othersapi_key  # imported from your app.py / APIkey.py
-    }
-
     try:
-        resp = requests.get(endpoint, params=params)
-        resp.raise_for_status()
+        data = get_place_details(restaurant_id, RESTAURANT_INFO_FIELDS)
     except requests.RequestException as e:
         return jsonify({"error": f"Error contacting Google Places API: {str(e)}"}), 500
 
-    data = resp.json()
     if data.get("status") != "OK":
         return jsonify({"error": f"Google Places error: {data.get('status')}"}), 400
 
-    result = data.get("result", {})
+    return jsonify(restaurant_info(data.get("result", {})))
+
+# Which fields we want from Google Places
+RESTAURANT_INFO_FIELDS = (
+    "name,formatted_address,formatted_phone_number,website,"
+    "opening_hours,geometry,reviews"
+)
 
+def restaurant_info(result):
+    """
+    Shapes a Place Details 'result' into the /restaurant response.
+    """
     # Parse out relevant fields
     name = result.get("name")
     address = result.get("formatted_address")
@@ -158,7 +388,7 @@ def api_restaurant_info(restaurant_id):
     lng = location.get("lng")
 
     # Build a final dictionary with the data you want to return
-    restaurant_info = {
+    return {
         "name": name,
         "address": address,
         "phone": phone,
@@ -168,7 +398,23 @@ def api_restaurant_info(restaurant_id):
         "location": {"lat": lat, "lng": lng},
     }
 
-    return jsonify(restaurant_info)
+@api.route("/stats/coalescing", methods=["GET"])
+def api_coalescing_stats():
+    """
+    Counters for the single-flight layer in front of Places and Gemini calls.
+    """
+    return jsonify({"flights": coalescing_stats()})
+
+@api.route("/metrics", methods=["GET"])
+def api_metrics():
+    """
+    Stage timings, upstream call counters and cache hit ratios in the
+    Prometheus text format.
+    """
+    return Response(render_prometheus(), mimetype="text/plain; version=0.0.4")
+
+# Module-level app for `python appService.py` and `flask --app appService run`
+app = create_app()
 
 if __name__ == "__main__":
     app.run(debug=True)
\ No newline at end of file
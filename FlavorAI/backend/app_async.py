@@ -0,0 +1,179 @@
+import asyncio
+import time
+
+import httpx
+
+from app import (
+    FLAVOR_CHUNK_SIZE,
+    FLAVOR_MAX_ATTEMPTS,
+    RESTAURANT_COUNT,
+    attach_flavor_profiles,
+    cached_flavor_profiles,
+    filter_candidates,
+    flavor_chunk_request,
+    flavor_flight_key,
+    get_gemini_client,
+    match_flavor_profiles,
+    othersapi_key,
+    parse_flavor_chunk_response,
+    parse_reviews,
+    radius_to_meters,
+    rank_candidates,
+    remember_nearby_results,
+)
+from metrics import record_upstream, span
+from nearby_cache import NEARBY_ANSWER_STATUS, is_complete_answer, nearby_search_cache
+from place_details import place_details
+from places_client import AsyncPlacesClient
+from singleflight import async_flavor_flight, async_nearby_flight
+
+###############################################################################
+# Setup & Configuration
+###############################################################################
+# Async counterparts of the network-bound functions in app.py, used by the
+# ASGI service (asgi_service.py). Caches, filtering and scoring are shared
+# with the synchronous code; only the waiting on Google and Gemini changes.
+places_async = AsyncPlacesClient(othersapi_key)
+
+# Gemini calls in flight across all requests. Far above the synchronous
+# FLAVOR_MAX_PARALLEL: a waiting coroutine holds no thread.
+GEMINI_ASYNC_MAX_CONCURRENCY = 64
+
+_gemini_slots = None
+
+def _gemini_semaphore():
+    global _gemini_slots
+    if _gemini_slots is None:
+        _gemini_slots = asyncio.Semaphore(GEMINI_ASYNC_MAX_CONCURRENCY)
+    return _gemini_slots
+
+###############################################################################
+# 1. Google Maps Search for Nearby Restaurants
+###############################################################################
+async def find_nearby_restaurants_async(lat, lon, radius_value, radius_unit):
+    """
+    Async find_nearby_restaurants: same tile cache, catalog and coalescing of
+    identical concurrent searches.
+    """
+    radius_meters = radius_to_meters(radius_value, radius_unit)
+    if radius_meters is None:
+        print("Invalid radius unit. Use 'miles' or 'kilometers'.")
+        return []
+
+    with span("nearby_search"):
+        results = await async_nearby_flight.do(
+            ("nearby", lat, lon, radius_meters),
+            lambda: _search_nearby_async(lat, lon, radius_meters),
+        )
+    return [dict(r) for r in results[:RESTAURANT_COUNT]]
+
+async def _search_nearby_async(lat, lon, radius_meters):
+    cached = nearby_search_cache.lookup(lat, lon, radius_meters)
+    if cached is not None:
+        return cached
+
+    try:
+        data = await places_async.nearby_search(lat, lon, radius_meters, place_type="restaurant")
+    except httpx.HTTPError as e:
+        print("Google Maps API error:", e)
+        return []
+    results = data.get('results', [])
+    if data.get("status") not in NEARBY_ANSWER_STATUS:
+        print(f"Google Maps API returned error: {data.get('status')}")
+        return []  # Not remembered, so the next search asks again
+    remember_nearby_results(lat, lon, radius_meters, results, is_complete_answer(data))
+    return results
+
+###############################################################################
+# 2. Google Places: Reviews & Details
+###############################################################################
+async def get_reviews_async(restaurant_id):
+    try:
+        data = await get_place_details_async(restaurant_id, "reviews")
+    except httpx.HTTPError as e:
+        print("Error contacting Google Places API:", e)
+        return []
+    return parse_reviews(data)
+
+async def get_place_details_async(place_id, fields):
+    """
+    Place Details for one place through the shared place-details service
+    (see app.get_place_details).
+
+    Raises:
+        httpx.HTTPError: When Google could not be reached
+    """
+    with span("place_details"):
+        return await place_details.get_async(place_id, fields, places_async)
+
+###############################################################################
+# 3. Gemini: Flavor Profiles
+###############################################################################
+async def generate_flavor_profiles_async(restaurants, gemini=None):
+    """
+    Async generate_flavor_profiles: cache first, then concurrent Gemini calls
+    through the client's aio interface for the misses.
+    """
+    with span("flavor_profiles"):
+        cached, misses = cached_flavor_profiles(restaurants)
+
+        flavor_dict = {}
+        if misses:
+            flavor_dict = await async_flavor_flight.do(
+                flavor_flight_key(misses), lambda: request_flavor_profiles_async(misses, gemini)
+            )
+        return attach_flavor_profiles(restaurants, cached, flavor_dict)
+
+async def request_flavor_profiles_async(restaurants, gemini=None):
+    """
+    Async request_flavor_profiles: chunks are sent concurrently (at most
+    GEMINI_ASYNC_MAX_CONCURRENCY in the process) and only missing or malformed
+    names are retried.
+    """
+    gemini = gemini or get_gemini_client()
+    pending = list(dict.fromkeys(r.get("name", "Unknown") for r in restaurants))
+    profiles = {}
+
+    for attempt in range(FLAVOR_MAX_ATTEMPTS):
+        if not pending:
+            break
+        chunks = [pending[i:i + FLAVOR_CHUNK_SIZE] for i in range(0, len(pending), FLAVOR_CHUNK_SIZE)]
+        answers = await asyncio.gather(*(_request_flavor_chunk_async(chunk, gemini) for chunk in chunks))
+        for chunk, answer in zip(chunks, answers):
+            profiles.update(match_flavor_profiles(chunk, answer))
+        pending = [name for name in pending if name not in profiles]
+        if pending and attempt + 1 < FLAVOR_MAX_ATTEMPTS:
+            print(f"Retrying Gemini flavor profiles for {len(pending)} missing or malformed restaurants.")
+
+    if pending:
+        print(f"No valid flavor profile from Gemini for {len(pending)} restaurants: {', '.join(pending)}")
+    return profiles
+
+async def _request_flavor_chunk_async(names, gemini):
+    prompt, config = flavor_chunk_request(names)
+    async with _gemini_semaphore():
+        started = time.perf_counter()
+        try:
+            response = await gemini.aio.models.generate_content(
+                model="gemini-2.0-flash",
+                contents=prompt,
+                config=config
+            )
+        except Exception as e:
+            record_upstream("gemini", "flavor_profiles", "error", time.perf_counter() - started)
+            print("Error calling Gemini for flavor profiles:", e)
+            return {}
+    record_upstream("gemini", "flavor_profiles", "ok", time.perf_counter() - started)
+    return parse_flavor_chunk_response(response)
+
+###############################################################################
+# 4. Recommendations
+###############################################################################
+async def generate_recommendations_async(user_profile, restaurants, tried_foods, n, gemini=None):
+    """
+    Async generate_recommendations: identical filtering and scoring, with the
+    flavor-profile step awaited instead of blocking.
+    """
+    filtered = filter_candidates(user_profile, restaurants, tried_foods)
+    filtered = await generate_flavor_profiles_async(filtered, gemini)
+    return rank_candidates(user_profile, filtered, n)
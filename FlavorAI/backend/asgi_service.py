@@ -0,0 +1,274 @@
+"""
+ASGI serving mode for the FlavorAI API.
+
+Endpoints that wait on Google or Gemini are served natively on the event loop
+(see app_async.py), so one process keeps hundreds of recommendation requests
+in flight without a thread per request. Every other route is handed to the
+Flask app from appService.py on a worker thread, so both modes expose the
+same API.
+
+Run with:
+    uvicorn asgi_service:app --host 0.0.0.0 --port 5000
+"""
+import asyncio
+import io
+import json
+import re
+import sys
+import time
+from urllib.parse import parse_qsl
+
+import httpx
+
+from app import (
+    NEARBY_EXPANDED_BUDGET,
+    find_catalog_candidates,
+    generate_expanded_recommendations,
+    get_user_profile,
+    record_tried_foods,
+)
+from app_async import (
+    find_nearby_restaurants_async,
+    generate_recommendations_async,
+    get_place_details_async,
+    places_async,
+)
+from appService import RESTAURANT_INFO_FIELDS, app as flask_app, restaurant_info, user_profile_response
+from metrics import (
+    SERVER_TIMING_REQUEST_HEADER,
+    finish_request_spans,
+    render_prometheus,
+    span,
+    start_request_spans,
+    wants_server_timing,
+)
+from results import dumps
+from singleflight import all_stats as coalescing_stats
+
+###############################################################################
+# 1. Requests & Responses
+###############################################################################
+class Request:
+    """
+    The parts of an ASGI HTTP request the handlers need.
+    """
+
+    def __init__(self, scope, body):
+        self.scope = scope
+        self.method = scope["method"]
+        self.path = scope["path"]
+        self.args = dict(parse_qsl(scope.get("query_string", b"").decode("latin-1")))
+        self.headers = {k.decode("latin-1"): v.decode("latin-1") for k, v in scope.get("headers", [])}
+        self.body = body
+
+    def json(self):
+        return json.loads(self.body or b"{}")
+
+async def read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            return b"".join(chunks)
+
+async def send_response(send, status, body, content_type="application/json", headers=()):
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", content_type.encode()),
+            (b"content-length", str(len(body)).encode()),
+            (b"access-control-allow-origin", b"*"),
+            *headers,
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+###############################################################################
+# 2. Native Async Handlers
+###############################################################################
+async def health(request):
+    return 200, {"status": "ok"}
+
+async def user_profile(request, user_id):
+    return user_profile_response(user_id, request.args.get("as_of"))
+
+async def find_restaurants(request):
+    lat = float(request.args.get("lat", 48.8575))
+    lon = float(request.args.get("lon", 2.3514))
+    radius_value = float(request.args.get("radius_value", 2))
+    radius_unit = request.args.get("radius_unit", "miles")
+    return 200, await find_nearby_restaurants_async(lat, lon, radius_value, radius_unit)
+
+async def recommendations(request, user_id):
+    data = request.json()
+    lat = data.get("lat", 48.8575)
+    lon = data.get("lon", 2.3514)
+    radius_value = data.get("radius_value", 2)
+    radius_unit = data.get("radius_unit", "miles")
+    tried = data.get("triedFoods", [])
+    n = data.get("n", 5)
+    candidate_source = data.get("candidate_source", "places")
+
+    profile = get_user_profile(user_id)
+    if profile is None:
+        return 404, {"error": f"No profile for user {user_id}"}
+    record_tried_foods(user_id, tried, profile)  # Remembered for later requests
+
+    if candidate_source == "expanded":
+        # Paged multi-type retrieval runs on its own threads; wait without blocking the loop
+        budget = min(float(data.get("budget_s", NEARBY_EXPANDED_BUDGET)), NEARBY_EXPANDED_BUDGET)
+        recs = await asyncio.to_thread(generate_expanded_recommendations, profile, lat, lon,
+                                       radius_value, radius_unit, tried, n, budget)
+        return 200, {"recommendations": recs}
+    if candidate_source == "catalog":
+        # Local KD-tree lookup; may fall back to a blocking Google search
+        restaurants = await asyncio.to_thread(find_catalog_candidates, lat, lon, radius_value, radius_unit)
+    else:
+        restaurants = await find_nearby_restaurants_async(lat, lon, radius_value, radius_unit)
+
+    recs = await generate_recommendations_async(profile, restaurants, tried, n)
+    return 200, {"recommendations": recs}
+
+async def restaurant_details(request, restaurant_id):
+    try:
+        data = await get_place_details_async(restaurant_id, RESTAURANT_INFO_FIELDS)
+    except httpx.HTTPError as e:
+        return 500, {"error": f"Error contacting Google Places API: {str(e)}"}
+
+    if data.get("status") != "OK":
+        return 400, {"error": f"Google Places error: {data.get('status')}"}
+    return 200, restaurant_info(data.get("result", {}))
+
+async def stats(request):
+    return 200, {"flights": coalescing_stats()}
+
+async def metrics(request):
+    return 200, render_prometheus()  # Text, not JSON
+
+# (method, path pattern, handler); a None handler sends the route to Flask
+ROUTES = [
+    ("GET", r"/health", health),
+    ("GET", r"/userprofile/(?P<user_id>[^/]+)", user_profile),
+    ("GET", r"/restaurants", find_restaurants),
+    ("POST", r"/recommendations/batch", None),
+    ("POST", r"/recommendations/(?P<user_id>[^/]+)", recommendations),
+    ("GET", r"/restaurant/(?P<restaurant_id>[^/]+)", restaurant_details),
+    ("GET", r"/stats/coalescing", stats),
+    ("GET", r"/metrics", metrics),
+]
+_ROUTES = [(method, re.compile(pattern + r"\Z"), handler) for method, pattern, handler in ROUTES]
+
+def match_route(method, path):
+    """
+    Returns (handler, path params) for a native route, or (None, None).
+    """
+    for route_method, pattern, handler in _ROUTES:
+        found = pattern.match(path)
+        if found and route_method == method:
+            return handler, found.groupdict()
+    return None, None
+
+###############################################################################
+# 3. Flask Fallback (WSGI on a worker thread)
+###############################################################################
+def wsgi_environ(scope, body):
+    server = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", ""),
+        "PATH_INFO": scope["path"],
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": str(server[0]),
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+        "CONTENT_LENGTH": str(len(body)),
+    }
+    for raw_name, raw_value in scope.get("headers", []):
+        name = raw_name.decode("latin-1").upper().replace("-", "_")
+        value = raw_value.decode("latin-1")
+        if name == "CONTENT_TYPE":
+            environ["CONTENT_TYPE"] = value
+        elif name != "CONTENT_LENGTH":
+            key = f"HTTP_{name}"
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+def call_wsgi(environ):
+    started = {}
+
+    def start_response(status, headers, exc_info=None):
+        started["status"] = int(status.split(" ", 1)[0])
+        started["headers"] = headers
+
+    result = flask_app.wsgi_app(environ, start_response)
+    try:
+        body = b"".join(result)
+    finally:
+        if hasattr(result, "close"):
+            result.close()
+    return started["status"], started["headers"], body
+
+async def serve_with_flask(scope, body, send):
+    status, headers, body = await asyncio.to_thread(call_wsgi, wsgi_environ(scope, body))
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in headers],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+###############################################################################
+# 4. ASGI Entry Point
+###############################################################################
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await places_async.aclose()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+    if scope["type"] != "http":
+        return
+
+    body = await read_body(receive)
+    handler, params = match_route(scope["method"], scope["path"])
+    if handler is None:
+        # CORS preflights and every non-native route go through Flask
+        await serve_with_flask(scope, body, send)
+        return
+
+    request = Request(scope, body)
+    timing = None
+    if wants_server_timing(request.headers.get(SERVER_TIMING_REQUEST_HEADER.lower())):
+        timing = (start_request_spans(), time.perf_counter())
+    try:
+        status, payload = await handler(request, **params)
+    except Exception as e:
+        print(f"Error handling {request.method} {request.path}:", e)
+        status, payload = 500, {"error": "Internal server error"}
+
+    if isinstance(payload, str):
+        body, content_type = payload.encode("utf-8"), "text/plain; version=0.0.4"
+    else:
+        with span("serialize"):
+            body, content_type = dumps(payload), "application/json"
+
+    headers = []
+    if timing is not None:
+        token, started = timing
+        stages = finish_request_spans(token)
+        total = f"total;dur={(time.perf_counter() - started) * 1000:.2f}"
+        headers.append((b"server-timing", (f"{stages}, {total}" if stages else total).encode()))
+    await send_response(send, status, body, content_type, headers)
@@ -0,0 +1,254 @@
+"""
+Load test for the ASGI serving mode against local fake upstreams.
+
+A fake Google Places server (real HTTP on localhost, in its own thread) and a
+fake Gemini client both answer after a fixed latency. The test fires
+--requests concurrent POST /recommendations calls at asgi_service.app in one
+process and one event loop; every request searches a different area with
+different restaurants, so every one goes upstream to both Places and Gemini.
+With --compare-threads it runs the same load through the Flask app on a
+thread pool of that size.
+
+Usage:
+    python benchmarks/async_load_test.py [--requests 500] [--latency 0.2] [--compare-threads 16]
+
+Exits with status 1 if any request fails or the async run takes longer than
+--max-wall seconds.
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl, urlsplit
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+###############################################################################
+# 1. Fake Upstreams
+###############################################################################
+def fake_nearby(params):
+    lat, lon = params["location"].split(",")
+    return {"status": "OK", "results": [
+        {
+            "place_id": f"{lat}:{lon}:{i}",
+            "name": f"Fake Kitchen {lat} {lon} #{i}",
+            "vicinity": "1 Test Street",
+            "types": ["restaurant"],
+            "opening_hours": {"open_now": True},
+            "geometry": {"location": {"lat": float(lat), "lng": float(lon)}},
+        }
+        for i in range(20)
+    ]}
+
+class FakePlacesServer:
+    """
+    Minimal keep-alive HTTP/1.1 server for /nearbysearch/json and
+    /details/json, answering every request after latency seconds.
+    """
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.requests = 0
+        self.port = None
+        self._ready = threading.Event()
+
+    def start(self):
+        threading.Thread(target=lambda: asyncio.run(self._serve()), daemon=True).start()
+        self._ready.wait()
+        return f"http://127.0.0.1:{self.port}"
+
+    async def _serve(self):
+        server = await asyncio.start_server(self._handle, "127.0.0.1", 0, backlog=2048)
+        self.port = server.sockets[0].getsockname()[1]
+        self._ready.set()
+        async with server:
+            await server.serve_forever()
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                target = head.split(b" ", 2)[1].decode()
+                url = urlsplit(target)
+                params = dict(parse_qsl(url.query))
+                self.requests += 1
+                await asyncio.sleep(self.latency)
+                if url.path.endswith("/nearbysearch/json"):
+                    payload = fake_nearby(params)
+                else:
+                    payload = {"status": "OK", "result": {"name": params.get("placeid"), "reviews": []}}
+                body = json.dumps(payload).encode()
+                writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                             b"Content-Length: " + str(len(body)).encode() + b"\r\n\r\n" + body)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+class _Obj:
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+def fake_gemini_response(contents):
+    names = re.findall(r"^- (.+)$", contents, flags=re.MULTILINE)
+    profiles = {n: {"salty": 0.4, "umami": 0.6, "spicy": 0.3, "sweet": 0.2, "sour": 0.1,
+                    "textures": ["crispy"]} for n in names}
+    call = _Obj(name="generate_flavor_profiles", args={"profiles": profiles})
+    return _Obj(candidates=[_Obj(content=_Obj(parts=[_Obj(function_call=call)]))])
+
+class FakeGemini:
+    """
+    Stands in for genai.Client: models.generate_content blocks, and
+    aio.models.generate_content awaits, for latency seconds.
+    """
+
+    def __init__(self, latency):
+        self.calls = 0
+        outer = self
+
+        class Models:
+            def generate_content(self, model, contents, config):
+                outer.calls += 1
+                time.sleep(latency)
+                return fake_gemini_response(contents)
+
+        class AsyncModels:
+            async def generate_content(self, model, contents, config):
+                outer.calls += 1
+                await asyncio.sleep(latency)
+                return fake_gemini_response(contents)
+
+        self.models = Models()
+        self.aio = _Obj(models=AsyncModels())
+
+###############################################################################
+# 2. Load Generation
+###############################################################################
+def request_body(i):
+    # A distinct, non-overlapping search area per request
+    return {"lat": -60 + (i % 240) * 0.5, "lon": -170 + (i // 240) * 1.0,
+            "radius_value": 2, "radius_unit": "miles", "n": 5}
+
+async def asgi_post(app, path, payload):
+    body = json.dumps(payload).encode()
+    scope = {"type": "http", "method": "POST", "path": path, "query_string": b"",
+             "headers": [(b"content-type", b"application/json")]}
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message):
+        sent.append(message)
+
+    await app(scope, receive, send)
+    return sent[0]["status"], json.loads(sent[1]["body"])
+
+async def run_async(count):
+    import asgi_service
+
+    in_flight = peak = 0
+    latencies = []
+
+    async def one(i):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        start = time.perf_counter()
+        status, payload = await asgi_post(asgi_service.app, f"/recommendations/load-user-{i % 10}", request_body(i))
+        latencies.append(time.perf_counter() - start)
+        in_flight -= 1
+        return status == 200 and len(payload["recommendations"]) == 5
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(one(i) for i in range(count)))
+    wall = time.perf_counter() - start
+    return {"wall_s": wall, "latencies": latencies, "ok": sum(results),
+            "peak_in_flight": peak, "threads": threading.active_count()}
+
+def run_threads(count, workers, offset):
+    import appService
+
+    client = appService.app.test_client()
+    latencies = []
+
+    def one(i):
+        start = time.perf_counter()
+        response = client.post(f"/recommendations/load-user-{i % 10}", json=request_body(offset + i))
+        latencies.append(time.perf_counter() - start)
+        return response.status_code == 200 and len(response.get_json()["recommendations"]) == 5
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(one, range(count)))
+    wall = time.perf_counter() - start
+    return {"wall_s": wall, "latencies": latencies, "ok": sum(results),
+            "peak_in_flight": workers, "threads": workers}
+
+def report(label, count, result):
+    lat = sorted(result["latencies"])
+    p99 = lat[min(len(lat) - 1, int(len(lat) * 0.99))]
+    print(f"{label:10s} {result['ok']}/{count} ok   wall {result['wall_s']:6.2f} s   "
+          f"{count / result['wall_s']:7.1f} req/s   p50 {statistics.median(lat) * 1000:7.1f} ms   "
+          f"p99 {p99 * 1000:7.1f} ms   peak in flight {result['peak_in_flight']}   threads {result['threads']}")
+
+###############################################################################
+# 3. Main
+###############################################################################
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--latency", type=float, default=0.2, help="Fake upstream latency in seconds")
+    parser.add_argument("--compare-threads", type=int, default=0,
+                        help="Also run the Flask app on a thread pool of this size")
+    parser.add_argument("--max-wall", type=float, default=15.0,
+                        help="Fail if the async run takes longer than this")
+    args = parser.parse_args()
+
+    # Scratch caches and profiles; set before the service modules are imported
+    scratch = tempfile.mkdtemp(prefix="flavorai-load-")
+    os.chdir(scratch)
+    os.environ["FLAVORAI_CACHE_DB"] = os.path.join(scratch, "cache.db")
+    os.environ["FLAVORAI_PROFILE_DB"] = os.path.join(scratch, "profiles.db")
+    sys.path.insert(0, BACKEND_DIR)
+
+    import app
+    import app_async
+    import places_client
+    from profile_store import get_profile_store
+
+    places = FakePlacesServer(args.latency)
+    base_url = places.start()
+    places_client.PLACES_BASE_URL = base_url
+    app_async.places_async.base_url = base_url
+    gemini = FakeGemini(args.latency)
+    app._gemini_client = gemini
+
+    store = get_profile_store()
+    for u in range(10):
+        store.save({"user_id": f"load-user-{u}",
+                    "favorite_tastes": {"salty": 0.5, "umami": 0.5, "spicy": 0.5, "sweet": 0.5, "sour": 0.5},
+                    "texture_preferences": [], "dietary_restrictions": [], "allergies": [], "tried_foods": []})
+
+    print(f"{args.requests} concurrent recommendation requests, upstream latency {args.latency * 1000:.0f} ms")
+    result = asyncio.run(run_async(args.requests))
+    report("asgi", args.requests, result)
+    print(f"{'':10s} upstream calls: places {places.requests}, gemini {gemini.calls}")
+    failed = result["ok"] < args.requests or result["wall_s"] > args.max_wall
+
+    if args.compare_threads:
+        report(f"flask x{args.compare_threads}", args.requests,
+               run_threads(args.requests, args.compare_threads, offset=args.requests))
+
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,537 @@
+"""
+Benchmark suite for the recommendation pipeline, replaying recorded upstreams.
+
+Google Places and Gemini responses are replayed from benchmarks/fixtures, so
+no API keys or network are needed. Every scenario runs at several scales and
+reports p50/p99 latency per operation and throughput; results are compared
+with a stored baseline and regressions are flagged. A fixed reference
+workload is timed in every run and saved with the baseline; baseline timings
+are scaled by how much faster or slower it ran here, so a baseline saved on
+one machine can gate runs on another. A scenario that looks slower is
+measured again, CONFIRM_RUNS times in all, and only the median counts.
+
+Scenarios:
+    nearby_search         find_nearby_restaurants, a new area every call
+    nearby_search_cached  find_nearby_restaurants, served from the tile cache
+    flavor_profiles_cold  generate_flavor_profiles with an empty profile cache
+    flavor_profiles_warm  generate_flavor_profiles with every profile cached
+    recommendations       generate_recommendations over N candidates
+    recommendations_expanded  generate_expanded_recommendations, a new area every call
+                          (4 types x 3 pages = 240 candidates, no page-token wait)
+    restaurant_card       a restaurant card (Place Details + reviews) for a new place every call
+    restaurant_card_cached  the same card again, served from the place-details cache
+    profile_load          get_user_profile
+    profile_update        update_user_profile with a feedback comment
+    feedback_record       record_feedback (logged; applied later in the background)
+    profile_as_of         get_user_profile_as_of over a long taste history
+    history_recompute     taste_history.recompute_all over N events (N / 1000 per user)
+    feedback_recompute    feedback.recompute_tastes over N comments (N / 1000 per user)
+    takeout_ingestion     run_ingestion over a Takeout timeline of N entries
+    takeout_reingestion   run_ingestion again over the same, already ingested timeline
+
+Usage:
+    python benchmarks/pipeline_benchmark.py [--scale quick|default|full] [--only SCENARIO ...]
+                                            [--save-baseline] [--baseline PATH] [--tolerance 0.5]
+    python benchmarks/pipeline_benchmark.py record --lat 38.6488 --lon -90.3108 [--radius 3000]
+
+`record` calls the live APIs (keys from APIkey.py or GOOGLE_MAPS_API_KEY /
+GEMINI_API_KEY) and overwrites the Places and Gemini fixtures.
+
+Exits with status 1 if any scenario's p50 is more than --tolerance slower than
+the (scaled) baseline.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import re
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+import zlib
+from datetime import datetime, timedelta
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+# Candidate counts (N), Takeout timeline lengths and taste-history sizes per scale preset
+SCALES = {
+    "quick": {"candidates": [20, 1000], "history": [10, 10000], "taste_events": [10000], "calls": 50},
+    "default": {"candidates": [20, 1000, 10000], "history": [10, 10000, 100000],
+                "taste_events": [10000, 100000], "calls": 200},
+    "full": {"candidates": [20, 1000, 10000, 50000], "history": [10, 10000, 100000, 1000000],
+             "taste_events": [10000, 100000, 1000000], "calls": 500},
+}
+VISITS_PER_PLACE = 20          # Timeline entries per unique place in generated histories
+REGRESSION_TOLERANCE = 0.5     # p50 this much slower than the baseline is a regression
+NOISE_FLOOR_S = 0.002          # Differences below this are never regressions (ms cases jitter by ~1 ms)
+TARGET_SECONDS = 2.0           # Approximate time spent per scenario and scale
+REPLAY_PAGES = 3               # Nearby Search pages replayed per search and type
+TASTE_HISTORY_USERS = 1000     # Users sharing the events of history_recompute
+REFERENCE_RUNS = 21            # Timings of the reference workload per measurement
+CONFIRM_RUNS = 3               # Measurements of a flagged scenario whose median decides
+
+###############################################################################
+# 1. Fixtures & Replay
+###############################################################################
+def load_fixture(name):
+    with open(os.path.join(FIXTURE_DIR, name)) as f:
+        return json.load(f)
+
+def replay_places_client(latency=0.0):
+    """
+    A PlacesClient whose get_json answers from the fixtures instead of Google.
+    Nearby searches return the recorded results re-keyed to the searched
+    location, so different areas never share place IDs; other place types and
+    later pages (REPLAY_PAGES per search, linked by next_page_token) get their
+    own IDs too. Details for unknown IDs reuse a recorded response chosen by hash.
+    """
+    from places_client import PlacesClient
+
+    nearby = load_fixture("places_nearbysearch.json")
+    details = load_fixture("places_details.json")
+    detail_ids = sorted(details)
+
+    class ReplayPlacesClient(PlacesClient):
+        calls = 0
+
+        def get_json(self, path, params):
+            ReplayPlacesClient.calls += 1
+            if latency:
+                time.sleep(latency)
+            if path == "nearbysearch":
+                if "pagetoken" in params:
+                    area, place_type, page = params["pagetoken"].rsplit("|", 2)
+                    page = int(page)
+                else:
+                    area, place_type, page = params.get("location", ""), params.get("type", "restaurant"), 0
+                suffix = "" if (place_type, page) == ("restaurant", 0) else f"/{place_type}/{page}"
+                results = [dict(r, place_id=f"{r['place_id']}@{area}{suffix}") for r in nearby["results"]]
+                answer = {"status": "OK", "results": results}
+                if page + 1 < REPLAY_PAGES:
+                    answer["next_page_token"] = f"{area}|{place_type}|{page + 1}"
+                return answer
+            place_id = params["placeid"]
+            recorded = details.get(place_id) or details[detail_ids[zlib.crc32(place_id.encode()) % len(detail_ids)]]
+            return json.loads(json.dumps(recorded))
+
+    return ReplayPlacesClient(None)
+
+class ReplayGemini:
+    """
+    Stands in for genai.Client: answers every flavor-profile call with the
+    recorded profiles, matched by name (or chosen by hash for unknown names).
+    """
+
+    def __init__(self, latency=0.0):
+        recorded = load_fixture("gemini_flavor_profiles.json")["args"]["profiles"]
+        self.profiles = recorded
+        self.names = sorted(recorded)
+        self.latency = latency
+        self.calls = 0
+        self.models = self
+
+    def _profile(self, name):
+        base = name.split(" #", 1)[0]
+        if base in self.profiles:
+            return self.profiles[base]
+        return self.profiles[self.names[zlib.crc32(name.encode()) % len(self.names)]]
+
+    def generate_content(self, model, contents, config):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        names = re.findall(r"^- (.+)$", contents, flags=re.MULTILINE)
+        call = _Obj(name="generate_flavor_profiles", args={"profiles": {n: self._profile(n) for n in names}})
+        return _Obj(candidates=[_Obj(content=_Obj(parts=[_Obj(function_call=call)]))])
+
+class _Obj:
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+def scaled_candidates(n):
+    """
+    n Nearby Search results built from the recorded ones, each with its own
+    place_id, name and location.
+    """
+    recorded = load_fixture("places_nearbysearch.json")["results"]
+    candidates = []
+    for i in range(n):
+        base = recorded[i % len(recorded)]
+        copy = json.loads(json.dumps(base))
+        round_ = i // len(recorded)
+        if round_:
+            copy["place_id"] = f"{base['place_id']}-{round_}"
+            copy["name"] = f"{base['name']} #{round_}"
+            location = copy["geometry"]["location"]
+            location["lat"] += (round_ % 97) * 1e-4
+            location["lng"] += (round_ // 97) * 1e-4
+        candidates.append(copy)
+    return candidates
+
+def write_history(path, entries):
+    """
+    Writes a Takeout timeline with `entries` entries (visits and activities,
+    like the recorded sample) over entries / VISITS_PER_PLACE unique places.
+    Each pass over the sample is shifted a week later, so times keep increasing.
+    """
+    sample = load_fixture("location_history_sample.json")
+    visit_ids = sorted({e["visit"]["topCandidate"]["placeID"] for e in sample if "visit" in e})
+    unique_places = max(1, entries // VISITS_PER_PLACE)
+    with open(path, "w") as f:
+        f.write("[")
+        for i in range(entries):
+            entry = json.loads(json.dumps(sample[i % len(sample)]))
+            shift = timedelta(weeks=i // len(sample))
+            for field in ("startTime", "endTime"):
+                entry[field] = (datetime.fromisoformat(entry[field]) + shift).isoformat(timespec="milliseconds")
+            if "visit" in entry:
+                place = i % unique_places
+                base = visit_ids[place % len(visit_ids)]
+                entry["visit"]["topCandidate"]["placeID"] = base if place < len(visit_ids) else f"{base}-{place}"
+            f.write(("," if i else "") + json.dumps(entry))
+        f.write("]")
+
+###############################################################################
+# 2. Recording Fixtures
+###############################################################################
+def record(lat, lon, radius_meters):
+    """
+    Calls the live APIs once and stores the responses as fixtures.
+    """
+    import app
+    from api_keys import GEMINI_KEY_ENV, GOOGLE_MAPS_KEY_ENV, geminiapi_key, othersapi_key
+    from places_client import PlacesClient
+
+    if not othersapi_key or not geminiapi_key:
+        sys.exit(f"Recording needs live keys: APIkey.py or {GOOGLE_MAPS_KEY_ENV} and {GEMINI_KEY_ENV}.")
+
+    client = PlacesClient(othersapi_key)
+    nearby = client.nearby_search(lat, lon, radius_meters, place_type="restaurant")
+    fields = ("name,types,geometry,vicinity,formatted_address,formatted_phone_number,website,"
+              "opening_hours,utc_offset,reviews")
+    responses = client.details_many([r["place_id"] for r in nearby.get("results", [])], fields)
+    details = {pid: data for pid, data in responses.items() if not isinstance(data, Exception)}
+    names = [r["name"] for r in nearby.get("results", [])]
+    profiles = app.request_flavor_profiles([{"name": n} for n in names])
+
+    for name, payload in (("places_nearbysearch.json", nearby), ("places_details.json", details),
+                          ("gemini_flavor_profiles.json", {"name": "generate_flavor_profiles",
+                                                           "args": {"profiles": profiles}})):
+        with open(os.path.join(FIXTURE_DIR, name), "w") as f:
+            json.dump(payload, f, indent=1)
+    print(f"Recorded {len(nearby.get('results', []))} places, {len(details)} details, "
+          f"{len(profiles)} flavor profiles into {FIXTURE_DIR}")
+
+###############################################################################
+# 3. Scenarios
+###############################################################################
+def repeats_for(items):
+    # Small cases are repeated often enough for a stable p99; large ones a few times
+    return max(3, min(200, int(20000 / max(items, 1))))
+
+def measure(op, repeat, setup=None, budget=TARGET_SECONDS):
+    """
+    Runs op() up to `repeat` times (fewer once `budget` seconds are spent, but
+    at least 3), calling setup() untimed before each run. Pipeline output is
+    silenced. Returns per-run latencies in seconds.
+    """
+    latencies = []
+    spent_since = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i in range(repeat):
+            state = setup() if setup else None
+            start = time.perf_counter()
+            op(state)
+            latencies.append(time.perf_counter() - start)
+            if len(latencies) >= 3 and time.perf_counter() - spent_since > budget:
+                break
+    return latencies
+
+def user_profile(user_id):
+    return {"user_id": user_id,
+            "favorite_tastes": {"salty": 0.6, "umami": 0.7, "spicy": 0.4, "sweet": 0.3, "sour": 0.2},
+            "texture_preferences": ["crispy"], "dietary_restrictions": [], "allergies": [], "tried_foods": []}
+
+def write_taste_history(history, users, events_per_user, start=1.6e9):
+    """
+    Fills a TasteHistory with one base event and then hourly feedback events
+    per user, cycling through a fixed set of signals.
+    """
+    from taste_history import EVENT_BASE, EVENT_FEEDBACK
+    signals = [(-1.0, 0.0, 1.0, 0.0, 0.0), (0.0, 1.0, 0.0, -1.0, 0.0), (1.0, 0.0, 0.0, 0.0, -1.0)]
+    for u in range(users):
+        events = [(start, EVENT_BASE, (0.5, 0.5, 0.5, 0.5, 0.5), 0)]
+        events += [(start + 3600 * i, EVENT_FEEDBACK, signals[(u + i) % len(signals)], 0)
+                   for i in range(1, events_per_user)]
+        history.append(f"bench-{u}", events)
+
+def feedback_comments(n):
+    """
+    N feedback comments in the shapes users write them; about one in ten is
+    distinct, the rest repeat.
+    """
+    shapes = ["Too salty and not spicy enough", "way too sweet", "It wasn't too sour, loved it",
+              "not quite umami enough", "Great service, the food was good", "a bit too spicy for me"]
+    return [f"{shapes[i % len(shapes)]} (table {i % (n // 10 + 1)})" for i in range(n)]
+
+def scenarios(scale, scratch):
+    """
+    Yields (scenario, N, items per run, run) for every scenario at this scale;
+    run() measures it and returns the latencies.
+    """
+    import app
+    from appService import RESTAURANT_INFO_FIELDS, restaurant_info
+    from cache import flavor_profile_cache, place_details_cache
+    from feedback import record_feedback, recompute_tastes
+    from nearby_cache import nearby_search_cache
+    from profile_store import get_profile_store
+    from taste_history import TasteHistory, recompute_all
+    sys.path.insert(0, os.path.join(BACKEND_DIR, "utils"))
+    import parseTakeoutData
+
+    config = SCALES[scale]
+    places = app.places = replay_places_client()
+    app._gemini_client = ReplayGemini()
+    store = get_profile_store()
+    store.save(user_profile("bench-user"))
+
+    calls = config["calls"]
+    counter = iter(range(10 ** 9))
+    yield ("nearby_search", calls, 20, lambda: measure(
+        lambda _: app.find_nearby_restaurants(-60 + next(counter) * 0.05, 10.0, 2, "miles"), calls))
+
+    def cached_run():
+        app.find_nearby_restaurants(38.6488, -90.3108, 2, "miles")
+        return measure(lambda _: app.find_nearby_restaurants(38.6488, -90.3108, 2, "miles"), calls)
+    yield ("nearby_search_cached", calls, 20, cached_run)
+
+    for n in config["candidates"]:
+        candidates = scaled_candidates(n)
+        copies = lambda: [dict(c) for c in candidates]
+
+        def cold_setup():
+            flavor_profile_cache.clear()
+            return copies()
+
+        def warm(op):
+            # Prime the flavor cache so only the local work is measured
+            app.generate_flavor_profiles(copies())
+            return measure(op, repeats_for(n), setup=copies)
+
+        profile = user_profile("bench-user")
+        yield ("flavor_profiles_cold", n, n,
+               lambda: measure(app.generate_flavor_profiles, repeats_for(n), setup=cold_setup))
+        yield ("flavor_profiles_warm", n, n, lambda: warm(app.generate_flavor_profiles))
+        yield ("recommendations", n, n,
+               lambda: warm(lambda restaurants: app.generate_recommendations(profile, restaurants, [], 5)))
+
+    def expanded_run():
+        # Replayed page tokens are valid at once; the real wait would only measure sleep()
+        app.NEARBY_PAGE_TOKEN_DELAY = 0.0
+        profile = user_profile("bench-user")
+        return measure(lambda _: app.generate_expanded_recommendations(
+            profile, 60 - next(counter) * 0.05, 10.0, 2, "miles", [], 5), calls // 4)
+    yield ("recommendations_expanded", calls // 4, 240, expanded_run)
+
+    def open_card(place_id):
+        restaurant_info(app.get_place_details(place_id, RESTAURANT_INFO_FIELDS)["result"])
+        app.get_reviews(place_id)
+    yield ("restaurant_card", calls, 1, lambda: measure(lambda _: open_card(f"bench-card-{next(counter)}"), calls))
+
+    def cached_card_run():
+        open_card("bench-card")
+        return measure(lambda _: open_card("bench-card"), calls)
+    yield ("restaurant_card_cached", calls, 1, cached_card_run)
+
+    profile = user_profile("bench-user")
+    yield ("profile_load", calls, 1, lambda: measure(lambda _: app.get_user_profile("bench-user"), calls))
+    yield ("profile_update", calls, 1, lambda: measure(
+        lambda _: app.update_user_profile(profile, 3, "Too salty and not spicy enough", "bench-user"), calls))
+    yield ("feedback_record", calls, 1, lambda: measure(
+        lambda _: record_feedback("bench-user", "Bench Kitchen", 0.5, "Too salty and not spicy enough"), calls))
+
+    def as_of_run():
+        # 10k events of history; each read lands at a different point in it
+        app.taste_history = TasteHistory(os.path.join(scratch, "as-of-history"))
+        write_taste_history(app.taste_history, 1, 10000)
+        store.save(user_profile("bench-0"))
+        return measure(lambda _: app.get_user_profile_as_of("bench-0", 1.6e9 + 3600 * (next(counter) % 10000)),
+                       calls)
+    yield ("profile_as_of", calls, 1, as_of_run)
+
+    for events in config["taste_events"]:
+        history = TasteHistory(os.path.join(scratch, f"taste-history-{events}"))
+
+        def recompute_run():
+            write_taste_history(history, TASTE_HISTORY_USERS, events // TASTE_HISTORY_USERS)
+            return measure(lambda _: recompute_all(step=0.05, history=history), repeats_for(events))
+        yield ("history_recompute", events, events, recompute_run)
+
+        comments = feedback_comments(events)
+        per_user = events // TASTE_HISTORY_USERS
+        by_user = {f"bench-{u}": comments[u * per_user:(u + 1) * per_user] for u in range(TASTE_HISTORY_USERS)}
+        yield ("feedback_recompute", events, events, lambda: measure(
+            lambda _: recompute_tastes(by_user, step=0.05), repeats_for(events)))
+
+    for entries in config["history"]:
+        history = os.path.join(scratch, f"history-{entries}.json")
+        output_dir = os.path.join(scratch, f"takeout-{entries}")
+
+        def ingestion_setup(cold=True):
+            if not os.path.exists(history):
+                write_history(history, entries)
+            if cold:
+                place_details_cache.clear()
+                shutil.rmtree(output_dir, ignore_errors=True)
+
+        def reingestion_run():
+            # Everything ingested once; each run re-reads an unchanged upload
+            ingestion_setup()
+            with contextlib.redirect_stdout(io.StringIO()):
+                ingest(None)
+            return measure(ingest, repeats_for(entries), setup=lambda: ingestion_setup(cold=False))
+
+        ingest = lambda _: parseTakeoutData.run_ingestion(history, output_dir, "bench-user", rate=0, client=places)
+        yield ("takeout_ingestion", entries, entries, lambda: measure(ingest, repeats_for(entries),
+                                                                      setup=ingestion_setup))
+        yield ("takeout_reingestion", entries, entries, reingestion_run)
+
+    nearby_search_cache.clear()
+
+###############################################################################
+# 4. Reporting & Baseline
+###############################################################################
+def reference_workload(_=None):
+    """
+    Fixed work in the pipeline's mix (JSON, dicts, sorting, SQLite) that
+    touches none of the service code, so its timing measures only the machine.
+    """
+    data = json.dumps([{"place_id": f"p{i}", "name": f"Kitchen {i}", "rating": i % 5,
+                        "types": ["restaurant", "food"]} for i in range(2000)])
+    places = json.loads(data)
+    places.sort(key=lambda p: (p["rating"], p["name"]))
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE t (k TEXT PRIMARY KEY, v TEXT)")
+    conn.executemany("INSERT INTO t VALUES (?, ?)", ((p["place_id"], json.dumps(p)) for p in places))
+    conn.execute("SELECT COUNT(*) FROM t").fetchone()
+    conn.close()
+
+def reference_time():
+    return statistics.median(measure(reference_workload, REFERENCE_RUNS))
+
+def summarize(scenario, n, items, latencies):
+    ordered = sorted(latencies)
+    p50 = statistics.median(ordered)
+    p99 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+    return {"key": f"{scenario}@{n}", "runs": len(ordered), "p50_s": p50, "p99_s": p99,
+            "throughput_per_s": items / p50 if p50 else float("inf")}
+
+def compare(result, baseline, tolerance, speed=1.0):
+    """
+    Returns (status, baseline p50 scaled to this machine) for one result.
+
+    Args:
+        speed (float): This run's reference time over the baseline's
+    """
+    previous = baseline.get(result["key"])
+    if previous is None:
+        return "new", None
+    expected = previous["p50_s"] * speed
+    limit = max(expected * (1 + tolerance), expected + NOISE_FLOOR_S * speed)
+    return ("REGRESSION" if result["p50_s"] > limit else "ok"), expected
+
+def confirm(scenario, n, items, measure_run, result, baseline, tolerance, baseline_reference):
+    """
+    Re-measures a scenario that compare() flagged until there are
+    CONFIRM_RUNS results, each next to a fresh reference timing, and compares
+    the median result against the median speed. A slow stretch of a noisy
+    machine during one measurement is then not reported as a regression.
+
+    Returns:
+        tuple: (median result, status, scaled baseline p50) as from compare
+    """
+    runs = [(result, reference_time())]
+    while len(runs) < CONFIRM_RUNS:
+        reference = reference_time()
+        runs.append((summarize(scenario, n, items, measure_run()), reference))
+    result = sorted((r for r, _ in runs), key=lambda r: r["p50_s"])[len(runs) // 2]
+    reference = statistics.median(ref for _, ref in runs)
+    speed = reference / baseline_reference if baseline_reference else 1.0
+    status, previous = compare(result, baseline, tolerance, speed)
+    return result, status, previous
+
+def run(args):
+    # Scratch caches and profiles; set before the service modules are imported
+    scratch = tempfile.mkdtemp(prefix="flavorai-bench-")
+    os.chdir(scratch)
+    os.environ["FLAVORAI_CACHE_DB"] = os.path.join(scratch, "cache.db")
+    os.environ["FLAVORAI_PROFILE_DB"] = os.path.join(scratch, "profiles.db")
+    os.environ["FLAVORAI_FEEDBACK_DB"] = os.path.join(scratch, "feedback.db")
+    os.environ["FLAVORAI_HISTORY_DIR"] = os.path.join(scratch, "taste_history")
+
+    baseline, baseline_reference = {}, None
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            stored = json.load(f)
+        baseline, baseline_reference = stored.get("results", {}), stored.get("reference_s")
+
+    reference = reference_time()
+    speed = reference / baseline_reference if baseline_reference else 1.0
+    print(f"Reference workload {reference * 1000:.2f} ms; baseline timings scaled by {speed:.2f}")
+    print(f"{'scenario':34s} {'runs':>5s} {'p50 ms':>10s} {'p99 ms':>10s} {'items/s':>12s} {'base p50':>10s}  status")
+    results, regressions = {}, []
+    for scenario, n, items, measure_run in scenarios(args.scale, scratch):
+        if args.only and scenario not in args.only:
+            continue
+        result = summarize(scenario, n, items, measure_run())
+        status, previous = compare(result, baseline, args.tolerance, speed)
+        if status == "REGRESSION":
+            result, status, previous = confirm(scenario, n, items, measure_run, result, baseline,
+                                               args.tolerance, baseline_reference)
+        if status == "REGRESSION":
+            regressions.append(result["key"])
+        results[result["key"]] = {k: v for k, v in result.items() if k != "key"}
+        base = f"{previous * 1000:10.2f}" if previous is not None else f"{'-':>10s}"
+        print(f"{result['key']:34s} {result['runs']:5d} {result['p50_s'] * 1000:10.2f} "
+              f"{result['p99_s'] * 1000:10.2f} {result['throughput_per_s']:12.0f} {base}  {status}", flush=True)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump({"machine": platform.platform(), "python": platform.python_version(),
+                       "scale": args.scale, "reference_s": reference, "results": results},
+                      f, indent=1, sort_keys=True)
+        print(f"Baseline written to {args.baseline}")
+    if regressions:
+        print(f"Regressions against {args.baseline}: {', '.join(regressions)}")
+    return 1 if regressions else 0
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    sub = parser.add_subparsers(dest="command")
+    rec = sub.add_parser("record", help="Record fixtures from the live APIs")
+    rec.add_argument("--lat", type=float, required=True)
+    rec.add_argument("--lon", type=float, required=True)
+    rec.add_argument("--radius", type=float, default=3000, help="Meters")
+    parser.add_argument("--scale", choices=sorted(SCALES), default="default")
+    parser.add_argument("--only", nargs="*", help="Scenario names to run")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=REGRESSION_TOLERANCE,
+                        help="Allowed p50 slowdown versus the baseline (0.5 = 50%%)")
+    args = parser.parse_args()
+
+    sys.path.insert(0, BACKEND_DIR)
+    if args.command == "record":
+        record(args.lat, args.lon, args.radius)
+        return
+    sys.exit(run(args))
+
+if __name__ == "__main__":
+    main()
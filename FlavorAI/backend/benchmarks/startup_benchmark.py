@@ -0,0 +1,92 @@
+"""
+Startup-time benchmark for the Flask service.
+
+Each run happens in a fresh interpreter so nothing is pre-imported. It measures
+importing appService, building the app with create_app(), and the first
+/health and /userprofile requests, then asserts them against latency budgets.
+It also checks that none of the heavy modules were loaded along the way.
+
+Usage:
+    python benchmarks/startup_benchmark.py [--runs 5]
+
+Exits with status 1 if any median exceeds its budget.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+# Seconds, compared against the median of all runs
+BUDGETS = {
+    "import_s": 0.60,
+    "create_app_s": 0.05,
+    "first_health_s": 0.05,
+    "first_userprofile_s": 0.10,
+}
+
+# Must not be imported just to start the service and serve profiles
+HEAVY_MODULES = ["pandas", "numpy", "google.genai", "plyer"]
+
+_PROBE = r"""
+import json, sys, time
+t0 = time.perf_counter()
+import appService
+t1 = time.perf_counter()
+flask_app = appService.create_app()
+t2 = time.perf_counter()
+client = flask_app.test_client()
+assert client.get("/health").status_code == 200
+t3 = time.perf_counter()
+client.get("/userprofile/startup-benchmark-user")
+t4 = time.perf_counter()
+print(json.dumps({
+    "import_s": t1 - t0,
+    "create_app_s": t2 - t1,
+    "first_health_s": t3 - t2,
+    "first_userprofile_s": t4 - t3,
+    "heavy_loaded": [m for m in HEAVY_MODULES if m in sys.modules],
+}))
+"""
+
+def run_once():
+    """
+    Runs the probe in a fresh interpreter, inside a scratch working directory
+    so the benchmark never touches real profile data.
+    """
+    probe = f"HEAVY_MODULES = {HEAVY_MODULES!r}\n" + _PROBE
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [BACKEND_DIR, os.environ.get("PYTHONPATH")])))
+    with tempfile.TemporaryDirectory() as scratch:
+        out = subprocess.run(
+            [sys.executable, "-c", probe],
+            cwd=scratch, env=env, capture_output=True, text=True, check=True,
+        )
+    # The service prints diagnostics; the measurements are the last line
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    samples = [run_once() for _ in range(args.runs)]
+    failed = False
+    for metric, budget in BUDGETS.items():
+        median = statistics.median(s[metric] for s in samples)
+        status = "ok" if median <= budget else "OVER BUDGET"
+        failed |= median > budget
+        print(f"{metric:22s} median {median * 1000:8.1f} ms   budget {budget * 1000:6.0f} ms   {status}")
+
+    heavy = sorted({m for s in samples for m in s["heavy_loaded"]})
+    if heavy:
+        failed = True
+        print(f"Heavy modules loaded at startup: {', '.join(heavy)}")
+
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
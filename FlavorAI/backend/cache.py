@@ -0,0 +1,282 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+from metrics import record_cache
+
+###############################################################################
+# Setup & Configuration
+###############################################################################
+# All persistent caches share one SQLite file, one table per namespace.
+CACHE_DB_PATH = os.environ.get("FLAVORAI_CACHE_DB", os.path.join("personaldata", "cache.db"))
+
+FLAVOR_PROFILE_TTL = 30 * 24 * 3600   # Flavor profiles almost never change
+FLAVOR_PROFILE_LRU_SIZE = 2048        # Hot restaurants kept in memory
+
+PLACE_DETAILS_TTL = 30 * 24 * 3600    # Names and types of a place rarely change
+PLACE_DETAILS_LRU_SIZE = 4096
+
+PLACE_CARD_TTL = 30 * 24 * 3600       # Longest per-field TTL in place_details.py
+PLACE_CARD_LRU_SIZE = 4096            # Restaurant cards opened recently
+
+CATALOG_TTL = 90 * 24 * 3600          # Catalog entries not re-seen for this long are dropped
+
+CACHE_PURGE_INTERVAL = 6 * 3600       # Seconds between sweeps of stale rows from every cache
+
+###############################################################################
+# 1. In-Memory LRU Layer
+###############################################################################
+class LRUCache:
+    """
+    Thread-safe, size-bounded LRU mapping with optional per-entry expiry.
+    """
+
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            value, stored_at = entry
+            if self.ttl is not None and time.time() - stored_at > self.ttl:
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, stored_at=None):
+        with self._lock:
+            self._data[key] = (value, stored_at if stored_at is not None else time.time())
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+###############################################################################
+# 2. Persistent SQLite Cache with LRU Front Layer
+###############################################################################
+class PersistentCache:
+    """
+    Key/value cache stored on local disk in SQLite, with TTL-based expiry
+    and an in-memory LRU in front of it. Values must be JSON-serializable.
+
+    Args:
+        namespace (str): Table name for this cache (letters, digits, underscores)
+        ttl (float): Seconds before an entry is considered stale
+        lru_size (int): Number of entries kept in the in-memory layer
+        db_path (str): SQLite file path, defaults to CACHE_DB_PATH
+    """
+
+    def __init__(self, namespace, ttl, lru_size=1024, db_path=None):
+        if not namespace.replace("_", "").isalnum():
+            raise ValueError(f"Invalid cache namespace: {namespace!r}")
+        self.namespace = namespace
+        self.ttl = ttl
+        self.db_path = db_path or CACHE_DB_PATH
+        self.memory = LRUCache(maxsize=lru_size, ttl=ttl)
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+        self._initialized = False
+        _caches.add(self)
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            db_dir = os.path.dirname(self.db_path)
+            if db_dir:
+                os.makedirs(db_dir, exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        if not self._initialized:
+            with self._init_lock:
+                conn.execute(
+                    f"CREATE TABLE IF NOT EXISTS {self.namespace} ("
+                    "key TEXT PRIMARY KEY, value TEXT NOT NULL, stored_at REAL NOT NULL)"
+                )
+                conn.commit()
+                self._initialized = True
+        return conn
+
+    def get(self, key):
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys):
+        """
+        Looks up several keys at once, memory first and then SQLite.
+
+        Args:
+            keys (iterable): Cache keys
+
+        Returns:
+            dict: key -> value for every fresh hit; misses and stale entries are omitted
+        """
+        found = {}
+        missing = []
+        for key in keys:
+            value = self.memory.get(key)
+            if value is not None:
+                found[key] = value
+            else:
+                missing.append(key)
+        if not missing:
+            record_cache(self.namespace, len(found), 0)
+            return found
+
+        memory_hits = len(found)
+        cutoff = time.time() - self.ttl
+        conn = self._conn()
+        # Stay well below SQLite's bound-parameter limit
+        for start in range(0, len(missing), 500):
+            chunk = missing[start:start + 500]
+            placeholders = ",".join("?" for _ in chunk)
+            rows = conn.execute(
+                f"SELECT key, value, stored_at FROM {self.namespace} "
+                f"WHERE key IN ({placeholders}) AND stored_at >= ?",
+                (*chunk, cutoff),
+            ).fetchall()
+            for key, raw, stored_at in rows:
+                value = json.loads(raw)
+                self.memory.set(key, value, stored_at=stored_at)
+                found[key] = value
+        record_cache(self.namespace, len(found), len(missing) - (len(found) - memory_hits))
+        return found
+
+    def set(self, key, value):
+        self.set_many({key: value})
+
+    def set_many(self, items):
+        """
+        Stores several key/value pairs in one transaction.
+
+        Args:
+            items (dict): key -> JSON-serializable value
+        """
+        if not items:
+            return
+        now = time.time()
+        conn = self._conn()
+        with conn:
+            conn.executemany(
+                f"INSERT OR REPLACE INTO {self.namespace} (key, value, stored_at) VALUES (?, ?, ?)",
+                [(key, json.dumps(value), now) for key, value in items.items()],
+            )
+        for key, value in items.items():
+            self.memory.set(key, value, stored_at=now)
+
+    def delete(self, key):
+        self.memory.delete(key)
+        conn = self._conn()
+        with conn:
+            conn.execute(f"DELETE FROM {self.namespace} WHERE key = ?", (key,))
+
+    def clear(self):
+        """
+        Drops every entry, in memory and on disk.
+        """
+        self.memory.clear()
+        conn = self._conn()
+        with conn:
+            conn.execute(f"DELETE FROM {self.namespace}")
+
+    def items(self):
+        """
+        Yields (key, value) for every fresh entry on disk, without touching the LRU layer.
+        """
+        cutoff = time.time() - self.ttl
+        rows = self._conn().execute(
+            f"SELECT key, value FROM {self.namespace} WHERE stored_at >= ?", (cutoff,)
+        )
+        for key, raw in rows:
+            yield key, json.loads(raw)
+
+    def purge_expired(self):
+        """
+        Removes stale rows from disk. Returns the number of rows deleted.
+        """
+        conn = self._conn()
+        with conn:
+            cur = conn.execute(
+                f"DELETE FROM {self.namespace} WHERE stored_at < ?", (time.time() - self.ttl,)
+            )
+        return cur.rowcount
+
+###############################################################################
+# 3. Expiry Sweeps
+###############################################################################
+# Stale rows are never served, but they stay on disk until purged
+_caches = weakref.WeakSet()
+_purger = None
+_purger_lock = threading.Lock()
+
+def purge_all_expired():
+    """
+    Removes stale rows from every PersistentCache in the process.
+
+    Returns:
+        dict: namespace -> rows deleted
+    """
+    purged = {}
+    for cache in list(_caches):
+        try:
+            purged[cache.namespace] = purged.get(cache.namespace, 0) + cache.purge_expired()
+        except sqlite3.Error as e:
+            print(f"Error purging the {cache.namespace} cache:", e)
+    return purged
+
+def _purge_forever(interval):
+    while True:
+        purge_all_expired()
+        time.sleep(interval)
+
+def start_cache_purger(interval=CACHE_PURGE_INTERVAL):
+    """
+    Starts a background thread, once per process, that purges every cache
+    now and then every `interval` seconds.
+    """
+    global _purger
+    with _purger_lock:
+        if _purger is None:
+            _purger = threading.Thread(target=_purge_forever, args=(interval,), name="cache-purger", daemon=True)
+            _purger.start()
+
+###############################################################################
+# 4. Shared Cache Instances
+###############################################################################
+# Gemini flavor profiles keyed by Google place_id
+flavor_profile_cache = PersistentCache(
+    "flavor_profiles", ttl=FLAVOR_PROFILE_TTL, lru_size=FLAVOR_PROFILE_LRU_SIZE
+)
+
+# Place Details results keyed by place_id, shared across users' Takeout ingestion
+place_details_cache = PersistentCache(
+    "place_details", ttl=PLACE_DETAILS_TTL, lru_size=PLACE_DETAILS_LRU_SIZE
+)
+
+# Restaurant-card Place Details keyed by place_id, with per-field fetch times (see place_details.py)
+place_card_cache = PersistentCache(
+    "place_card_details", ttl=PLACE_CARD_TTL, lru_size=PLACE_CARD_LRU_SIZE
+)
+
+# Local restaurant catalog entries keyed by place_id (see catalog.py)
+catalog_cache = PersistentCache("restaurant_catalog", ttl=CATALOG_TTL, lru_size=1)
@@ -0,0 +1,127 @@
+import re
+import unicodedata
+
+###############################################################################
+# Setup & Configuration
+###############################################################################
+# Restaurant attributes (Google types) that conflict with a dietary
+# restriction or allergy. Keys are matched case-insensitively against the
+# user's profile entries.
+CONFLICTING_ATTRIBUTES = {
+    "gluten-free": set(),
+    "vegetarian": {"steak_house", "barbecue_restaurant"},
+    "vegan": {"steak_house", "barbecue_restaurant"},
+    "shellfish": {"seafood_restaurant"},
+    "fish": {"seafood_restaurant", "sushi_restaurant"},
+    "peanuts": set(),
+    "nuts": set(),
+}
+
+# Terms that conflict when they occur anywhere in the lowercased name, as the
+# original gluten-free filter did: "burger" excludes "BurgerFi" and
+# "Hamburger Mary's" as well as "Five Guys Burgers and Fries"
+CONFLICTING_NAME_TERMS = {
+    "gluten-free": {"burger"},
+    "vegetarian": {"steak", "bbq", "barbecue", "barbeque"},
+    "vegan": {"steak", "bbq", "barbecue", "barbeque"},
+    "shellfish": {"seafood", "oyster", "crab", "lobster", "shrimp"},
+    "fish": {"seafood", "sushi", "fish"},
+    "peanuts": {"peanut"},
+    "nuts": {"peanut"},
+}
+_NAME_TERMS = set().union(*CONFLICTING_NAME_TERMS.values())
+
+_NON_WORD = re.compile(r"[^\w\s]+")
+_SPACES = re.compile(r"\s+")
+
+###############################################################################
+# 1. Name Normalization
+###############################################################################
+def normalize_name(name):
+    """
+    Normalizes a restaurant name for matching: Unicode-folded, case-folded,
+    punctuation dropped and whitespace collapsed ("Joe's  Diner" -> "joes diner").
+    """
+    name = unicodedata.normalize("NFKD", name or "")
+    name = "".join(ch for ch in name if not unicodedata.combining(ch))
+    name = _NON_WORD.sub("", name.casefold())
+    return _SPACES.sub(" ", name).strip()
+
+def tried_set(*name_lists):
+    """
+    Builds one set of normalized names from any number of lists of tried restaurants.
+    """
+    return {normalize_name(n) for names in name_lists for n in (names or []) if n}
+
+def merge_tried_foods(profile, names):
+    """
+    Adds names to profile['tried_foods'], skipping ones already present after
+    normalization. Returns the number of names added.
+    """
+    tried = profile.setdefault("tried_foods", [])
+    seen = tried_set(tried)
+    added = 0
+    for name in names:
+        key = normalize_name(name)
+        if key and key not in seen:
+            seen.add(key)
+            tried.append(name)
+            added += 1
+    return added
+
+###############################################################################
+# 2. Candidate Index
+###############################################################################
+class CandidateIndex:
+    """
+    Precomputed view over one candidate list: normalized names plus an inverted
+    index from attribute (Google type, or a conflicting name term found in the
+    name) to the candidates that carry it. Filtering a user is then a handful
+    of set lookups instead of a scan per tried entry.
+
+    Args:
+        restaurants (list): Nearby Search results
+    """
+
+    def __init__(self, restaurants):
+        self.restaurants = restaurants
+        self.names = [normalize_name(r.get("name", "")) for r in restaurants]
+        self.open_now = [r.get("opening_hours", {}).get("open_now") == True for r in restaurants]
+        self.by_attribute = {}
+        for i, r in enumerate(restaurants):
+            name = r.get("name", "").lower()
+            attributes = {term for term in _NAME_TERMS if term in name}
+            attributes.update(t.casefold() for t in r.get("types", []))
+            for attribute in attributes:
+                self.by_attribute.setdefault(attribute, set()).add(i)
+
+    def conflicting(self, user_profile):
+        """
+        Indices of candidates conflicting with the user's dietary restrictions or allergies.
+        """
+        excluded = set()
+        for entry in [*user_profile.get("dietary_restrictions", []), *user_profile.get("allergies", [])]:
+            key = entry.strip().casefold()
+            for attribute in CONFLICTING_ATTRIBUTES.get(key, set()) | CONFLICTING_NAME_TERMS.get(key, set()):
+                excluded |= self.by_attribute.get(attribute, set())
+        return excluded
+
+    def eligible(self, user_profile, tried):
+        """
+        Per-candidate booleans: open now, not tried, no dietary or allergy conflict.
+
+        Args:
+            user_profile (dict): The user's profile
+            tried (set): Normalized names from tried_set()
+        """
+        excluded = self.conflicting(user_profile)
+        return [
+            self.open_now[i] and i not in excluded and self.names[i] not in tried
+            for i in range(len(self.restaurants))
+        ]
+
+    def filter(self, user_profile, tried):
+        """
+        The eligible candidates themselves, in their original order.
+        """
+        return [r for r, ok in zip(self.restaurants, self.eligible(user_profile, tried)) if ok]
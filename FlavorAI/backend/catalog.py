@@ -0,0 +1,361 @@
+import heapq
+import math
+import threading
+import time
+
+import numpy as np
+
+from cache import catalog_cache
+from nearby_cache import NEARBY_OPEN_NOW_TTL, refresh_open_now_many
+
+###############################################################################
+# Setup & Configuration
+###############################################################################
+CATALOG_LEAF_SIZE = 16           # Points per KD-tree leaf, scanned with NumPy
+CATALOG_CANDIDATE_LIMIT = 300    # Most candidates a catalog query hands to the scorer
+CATALOG_MIN_CANDIDATES = 20      # Fewer than this locally and Google fills the gap
+CATALOG_REBUILD_THRESHOLD = 2048 # Places scanned outside the KD-tree before it is rebuilt
+
+_EARTH_RADIUS_M = 6371008.8
+
+# Fields kept from Places responses; everything else is dropped
+CATALOG_FIELDS = ["place_id", "name", "vicinity", "types", "geometry", "opening_hours",
+                  "utc_offset", "rating", "user_ratings_total", "price_level"]
+
+###############################################################################
+# 1. Coordinates
+###############################################################################
+def to_unit_xyz(lat, lon):
+    """
+    Projects coordinates onto the unit sphere. Straight-line (chord) distance
+    there grows monotonically with great-circle distance, so a KD-tree over
+    these points answers radius and nearest queries with no projection error.
+    """
+    lat = np.radians(np.asarray(lat, dtype=np.float64))
+    lon = np.radians(np.asarray(lon, dtype=np.float64))
+    cos_lat = np.cos(lat)
+    return np.stack([cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)], axis=-1)
+
+def meters_to_chord(meters):
+    return 2.0 * math.sin(min(meters / _EARTH_RADIUS_M, math.pi) / 2.0)
+
+def chord_to_meters(chord):
+    return 2.0 * _EARTH_RADIUS_M * np.arcsin(np.clip(chord / 2.0, 0.0, 1.0))
+
+###############################################################################
+# 2. KD-Tree
+###############################################################################
+class KDTree:
+    """
+    Static KD-tree over 3-D points. Nodes are split at the median of their
+    widest axis; leaves hold up to CATALOG_LEAF_SIZE points and are scanned
+    with one vectorized distance computation.
+
+    Args:
+        points (np.ndarray): (n, 3) float64 coordinates
+    """
+
+    def __init__(self, points, leaf_size=CATALOG_LEAF_SIZE):
+        self.points = np.ascontiguousarray(points, dtype=np.float64)
+        self.order = np.arange(len(self.points))
+        self.leaf_size = leaf_size
+        # Node arrays: start, end, split axis (-1 for leaves), split value, children
+        self._start, self._end, self._axis, self._split = [], [], [], []
+        self._left, self._right = [], []
+        self._lo, self._hi = [], []
+        if len(self.points):
+            self._build(0, len(self.points))
+
+    def _new_node(self, start, end):
+        self._start.append(start)
+        self._end.append(end)
+        self._axis.append(-1)
+        self._split.append(0.0)
+        self._left.append(-1)
+        self._right.append(-1)
+        block = self.points[self.order[start:end]]
+        # Plain float tuples: per-node bounds checks are cheaper without NumPy
+        self._lo.append(tuple(block.min(axis=0).tolist()))
+        self._hi.append(tuple(block.max(axis=0).tolist()))
+        return len(self._start) - 1
+
+    def _build(self, start, end):
+        root = self._new_node(start, end)
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            start, end = self._start[node], self._end[node]
+            if end - start <= self.leaf_size:
+                continue
+            spans = [h - l for h, l in zip(self._hi[node], self._lo[node])]
+            axis = spans.index(max(spans))
+            segment = self.order[start:end]
+            mid = (end - start) // 2
+            part = np.argpartition(self.points[segment, axis], mid)
+            self.order[start:end] = segment[part]
+            self._axis[node] = axis
+            self._split[node] = float(self.points[self.order[start + mid], axis])
+            self._left[node] = self._new_node(start, start + mid)
+            self._right[node] = self._new_node(start + mid, end)
+            stack.extend([self._left[node], self._right[node]])
+
+    def _box_distance(self, node, point):
+        total = 0.0
+        for p, lo, hi in zip(point, self._lo[node], self._hi[node]):
+            gap = lo - p if p < lo else (p - hi if p > hi else 0.0)
+            total += gap * gap
+        return math.sqrt(total)
+
+    def query_radius(self, point, radius):
+        """
+        Indices and distances of every point within radius of point, nearest first.
+        """
+        if not len(self.points):
+            return np.empty(0, dtype=np.intp), np.empty(0)
+        point = np.asarray(point, dtype=np.float64)
+        bounds_point = tuple(point.tolist())
+        hits, dists = [], []
+        stack = [0]
+        while stack:
+            node = stack.pop()
+            if self._box_distance(node, bounds_point) > radius:
+                continue
+            if self._axis[node] < 0:
+                idx = self.order[self._start[node]:self._end[node]]
+                d = np.sqrt(((self.points[idx] - point) ** 2).sum(axis=1))
+                keep = d <= radius
+                hits.append(idx[keep])
+                dists.append(d[keep])
+            else:
+                stack.extend([self._left[node], self._right[node]])
+        if not hits:
+            return np.empty(0, dtype=np.intp), np.empty(0)
+        hits, dists = np.concatenate(hits), np.concatenate(dists)
+        nearest_first = np.argsort(dists, kind="stable")
+        return hits[nearest_first], dists[nearest_first]
+
+    def query_knn(self, point, k, max_distance=np.inf):
+        """
+        Indices and distances of the k points nearest to point, nearest first.
+        """
+        if not len(self.points) or k <= 0:
+            return np.empty(0, dtype=np.intp), np.empty(0)
+        point = np.asarray(point, dtype=np.float64)
+        bounds_point = tuple(point.tolist())
+        best = []  # Max-heap of (-distance, index)
+        frontier = [(self._box_distance(0, bounds_point), 0)]
+        while frontier:
+            bound, node = heapq.heappop(frontier)
+            worst = -best[0][0] if len(best) == k else max_distance
+            if bound > worst:
+                break
+            if self._axis[node] < 0:
+                idx = self.order[self._start[node]:self._end[node]]
+                d = np.sqrt(((self.points[idx] - point) ** 2).sum(axis=1))
+                for i, dist in zip(idx.tolist(), d.tolist()):
+                    if dist > max_distance:
+                        continue
+                    if len(best) < k:
+                        heapq.heappush(best, (-dist, i))
+                    elif dist < -best[0][0]:
+                        heapq.heapreplace(best, (-dist, i))
+            else:
+                for child in (self._left[node], self._right[node]):
+                    heapq.heappush(frontier, (self._box_distance(child, bounds_point), child))
+        best.sort(reverse=True)
+        return (np.array([i for _, i in best], dtype=np.intp),
+                np.array([-d for d, _ in best], dtype=np.float64))
+
+###############################################################################
+# 3. Restaurant Catalog
+###############################################################################
+def with_open_now(place, refreshed, now=None):
+    """
+    A catalog entry as a candidate: open_now recomputed from opening-hours
+    periods when they are known (`refreshed`, from refresh_open_now), and
+    otherwise kept only while the Places response that carried it is younger
+    than NEARBY_OPEN_NOW_TTL. Entries can be months old and Takeout ones
+    never had the flag, so a dropped flag leaves the place ineligible rather
+    than wrongly open.
+    """
+    if refreshed is not None:
+        return refreshed
+    place = dict(place)
+    hours = place.get("opening_hours")
+    now = now if now is not None else time.time()
+    if hours and "open_now" in hours and now - place.get("seen_at", 0) > NEARBY_OPEN_NOW_TTL:
+        place["opening_hours"] = {k: v for k, v in hours.items() if k != "open_now"}
+    return place
+
+class RestaurantCatalog:
+    """
+    Local catalog of every restaurant seen in Places responses or Takeout place
+    details, persisted in the shared cache database and indexed with a KD-tree
+    for radius and k-nearest queries.
+
+    Places added since the tree was built sit in a small delta that queries
+    scan with NumPy alongside the tree. Once the delta holds more than
+    rebuild_threshold places, a new tree is built on a background thread and
+    swapped in, so neither add() nor a query ever waits for a rebuild.
+
+    Args:
+        store (PersistentCache): Where the catalog entries live
+        rebuild_threshold (int): Delta size that triggers a background rebuild
+    """
+
+    def __init__(self, store=catalog_cache, rebuild_threshold=CATALOG_REBUILD_THRESHOLD):
+        self.store = store
+        self.rebuild_threshold = rebuild_threshold
+        self._places = None
+        self._ids = []                   # Tree row -> place_id
+        self._tree_ids = set()
+        self._tree = KDTree(np.empty((0, 3)))
+        self._delta = {}                 # place_id -> (unit point, sequence number)
+        self._delta_view = None          # (ids, points, ids also in the tree), built on demand
+        self._seq = 0
+        self._rebuilding = False
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._places is None:
+            self._places = dict(self.store.items())
+            # Everything starts in the delta; the first tree is built in the background
+            self._stage(list(self._places))
+
+    def __len__(self):
+        with self._lock:
+            self._load()
+            return len(self._places)
+
+    def snapshot(self):
+        """
+        A place_id -> entry copy of the whole catalog.
+        """
+        with self._lock:
+            self._load()
+            return dict(self._places)
+
+    def add(self, places):
+        """
+        Adds or refreshes places (Nearby Search results or Place Details 'result'
+        objects). Entries without a place_id or coordinates are ignored.
+
+        Returns:
+            int: Number of places stored
+        """
+        fresh = {}
+        for place in places:
+            location = place.get("geometry", {}).get("location", {})
+            if not place.get("place_id") or "lat" not in location or "lng" not in location:
+                continue
+            entry = {k: place[k] for k in CATALOG_FIELDS if k in place}
+            entry["seen_at"] = time.time()
+            fresh[place["place_id"]] = entry
+        if not fresh:
+            return 0
+        with self._lock:
+            self._load()
+            for place_id, entry in fresh.items():
+                previous = self._places.get(place_id)
+                # Keep fields a richer earlier response had (e.g. opening periods)
+                self._places[place_id] = dict(previous, **entry) if previous else entry
+            self.store.set_many({pid: self._places[pid] for pid in fresh})
+            self._stage(list(fresh))
+        return len(fresh)
+
+    def _stage(self, place_ids):
+        # Called with the lock held: puts places in the delta and, once it is
+        # large, starts a rebuild
+        if place_ids:
+            coords = [self._places[pid]["geometry"]["location"] for pid in place_ids]
+            points = to_unit_xyz([c["lat"] for c in coords], [c["lng"] for c in coords])
+            for place_id, point in zip(place_ids, points):
+                self._seq += 1
+                self._delta[place_id] = (point, self._seq)
+            self._delta_view = None
+        if len(self._delta) > self.rebuild_threshold and not self._rebuilding:
+            self._rebuilding = True
+            threading.Thread(target=self._rebuild, daemon=True).start()
+
+    def _rebuild(self):
+        try:
+            with self._lock:
+                seq = self._seq
+                places = dict(self._places)
+            ids = list(places)
+            coords = [places[pid]["geometry"]["location"] for pid in ids]
+            points = to_unit_xyz([c["lat"] for c in coords], [c["lng"] for c in coords]) \
+                if coords else np.empty((0, 3))
+            tree = KDTree(points)
+            with self._lock:
+                self._ids, self._tree_ids, self._tree = ids, set(ids), tree
+                # Places added while the tree was being built stay in the delta
+                self._delta = {pid: v for pid, v in self._delta.items() if v[1] > seq}
+                self._delta_view = None
+        except Exception as e:
+            print("Error rebuilding the restaurant catalog index:", e)
+        finally:
+            with self._lock:
+                self._rebuilding = False
+
+    def _view(self):
+        # Called with the lock held: the delta as (ids, points, how many of
+        # them are also in the tree)
+        if self._delta_view is None:
+            ids = list(self._delta)
+            points = np.array([self._delta[pid][0] for pid in ids]) if ids else np.empty((0, 3))
+            self._delta_view = (ids, points, sum(pid in self._tree_ids for pid in ids))
+        return self._delta_view
+
+    def _scan_delta(self, point, max_chord):
+        # Called with the lock held: (chord, place_id) pairs from the delta
+        ids, points, _ = self._view()
+        d = np.sqrt(((points - point) ** 2).sum(axis=1))
+        keep = np.flatnonzero(d <= max_chord)
+        return [(chord, ids[i]) for i, chord in zip(keep.tolist(), d[keep].tolist())]
+
+    def _merge(self, idx, chords, point, max_chord, limit):
+        # Called with the lock held: tree hits whose place was not re-staged,
+        # plus the delta, nearest first
+        hits = [(chord, self._ids[i]) for i, chord in zip(idx.tolist(), chords.tolist())
+                if self._ids[i] not in self._delta]
+        hits.extend(self._scan_delta(point, max_chord))
+        hits.sort(key=lambda hit: hit[0])
+        if limit is not None:
+            hits = hits[:limit]
+        return [(self._places[pid], chord) for chord, pid in hits]
+
+    def _results(self, hits):
+        places = [place for place, _ in hits]
+        refreshed = refresh_open_now_many(places)
+        now = time.time()
+        return [dict(with_open_now(place, r, now), distance_m=float(chord_to_meters(chord)))
+                for (place, chord), r in zip(hits, refreshed)]
+
+    def within(self, lat, lon, radius_meters, limit=None):
+        """
+        Catalog places within radius_meters of (lat, lon), nearest first.
+        """
+        point = to_unit_xyz(lat, lon)
+        max_chord = meters_to_chord(radius_meters)
+        with self._lock:
+            self._load()
+            idx, chords = self._tree.query_radius(point, max_chord)
+            hits = self._merge(idx, chords, point, max_chord, limit)
+        return self._results(hits)
+
+    def nearest(self, lat, lon, k, max_radius_meters=None):
+        """
+        The k catalog places nearest to (lat, lon), optionally within a radius.
+        """
+        point = to_unit_xyz(lat, lon)
+        max_chord = meters_to_chord(max_radius_meters) if max_radius_meters is not None else np.inf
+        with self._lock:
+            self._load()
+            # Tree rows re-staged in the delta are skipped, so ask for that many more
+            idx, chords = self._tree.query_knn(point, k + self._view()[2], max_chord)
+            hits = self._merge(idx, chords, point, max_chord, k)
+        return self._results(hits)
+
+# Shared instance, filled by find_nearby_restaurants and Takeout ingestion
+restaurant_catalog = RestaurantCatalog()
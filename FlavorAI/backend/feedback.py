@@ -0,0 +1,419 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from profile_store import TASTE_KEYS, get_profile_store
+from taste_history import DEFAULT_STEP, EVENT_FEEDBACK, as_taste_dict, replay_batch, taste_history
+
+###############################################################################
+# Setup & Configuration
+###############################################################################
+FEEDBACK_DB_PATH = os.environ.get("FLAVORAI_FEEDBACK_DB", os.path.join("personaldata", "feedback.db"))
+
+# Seconds between applier passes; feedback reaches profiles within about this long
+FEEDBACK_APPLY_INTERVAL = float(os.environ.get("FLAVORAI_FEEDBACK_INTERVAL", "2.0"))
+FEEDBACK_BATCH_SIZE = 5000         # Events read per applier pass
+FEEDBACK_RETENTION = 7 * 24 * 3600 # Applied events are kept this long, then purged
+FEEDBACK_MAX_ATTEMPTS = 5          # Failed updates of a user's events before they are dropped
+FEEDBACK_MAX_BACKOFF = 60.0        # Longest wait between passes after repeated failures
+
+###############################################################################
+# 1. Feedback Rules
+###############################################################################
+# Words that scale a rule's signal ("way too salty", "not quite sweet enough")
+FEEDBACK_INTENSITY = {
+    "way": 1.5, "much": 1.5, "far": 1.5, "very": 1.5, "really": 1.5, "extremely": 1.5,
+    "super": 1.5, "overly": 1.5,
+    "a bit": 0.5, "a little": 0.5, "a tad": 0.5, "slightly": 0.5, "somewhat": 0.5,
+    "kind of": 0.5, "quite": 0.5, "nearly": 0.5,
+}
+# ...and what they scale by after a negation instead: "nearly too salty" is
+# mild, "not nearly salty enough" is strong
+FEEDBACK_NEGATED_INTENSITY = {"nearly": 1.5}
+FEEDBACK_MAX_SIGNAL = 1.5  # Per taste and comment, however many rules match
+
+FEEDBACK_NEGATIONS = {"not", "never", "hardly"}  # Also any word ending in "n't"
+
+# The rules, each a pattern starting with a literal so the regex engine can
+# skip ahead between matches: "too <taste>", and "enough" (which only counts
+# after a negated taste, "not <taste> enough")
+TOO_PATTERN = re.compile(rf"too\s+({'|'.join(TASTE_KEYS)})\b")
+ENOUGH_PATTERN = re.compile(r"enough\b")
+_TASTE_INDEX = {taste: i for i, taste in enumerate(TASTE_KEYS)}
+_MODIFIER_WINDOW = 40  # Characters before a rule searched for the words it applies to
+
+def _preceding_words(text, end):
+    # Up to the last few words before `end`, stopping at the start of the comment
+    start = max(0, end - _MODIFIER_WINDOW)
+    window = text[start:end]
+    cut = window.rfind("\0")
+    words = window[cut + 1:].split()
+    if cut < 0 and start > 0 and words and not text[start - 1].isspace():
+        words = words[1:]  # Partial first word
+    return words
+
+def _modifiers(words):
+    """
+    (negated, intensity) from the words just before a rule, e.g.
+    ["wasn't", "way"] -> (True, 1.5).
+    """
+    modifier = None
+    if len(words) >= 2 and " ".join(words[-2:]) in FEEDBACK_INTENSITY:
+        modifier, words = " ".join(words[-2:]), words[:-2]
+    elif words and words[-1] in FEEDBACK_INTENSITY:
+        modifier, words = words[-1], words[:-1]
+    negated = bool(words) and (words[-1] in FEEDBACK_NEGATIONS or words[-1].endswith("n't"))
+    if modifier is None:
+        return negated, 1.0
+    if negated and modifier in FEEDBACK_NEGATED_INTENSITY:
+        return negated, FEEDBACK_NEGATED_INTENSITY[modifier]
+    return negated, FEEDBACK_INTENSITY[modifier]
+
+def comment_signals(comments):
+    """
+    Per-taste feedback signals for many comments at once: -1 for "too
+    <taste>", +1 for "not <taste> enough", scaled by an intensity word just
+    before (FEEDBACK_INTENSITY). A negation cancels a "too" rule ("not too
+    salty"), and "<taste> enough" only counts when negated. Each unit moves
+    the taste by taste_history.DEFAULT_STEP.
+
+    Distinct comments are joined and each rule scans them all in one regex
+    pass; the matches are accumulated with NumPy and mapped back to every
+    comment, so repeated comments cost nothing extra.
+
+    Args:
+        comments (list): Feedback comments
+
+    Returns:
+        ndarray: (len(comments), 5) signals in TASTE_KEYS order
+    """
+    import numpy as np
+
+    index = {}
+    positions = [index.setdefault(comment, len(index)) for comment in comments]
+    unique = list(index)
+    # NUL never occurs in a comment and \s does not match it, so no match spans two comments
+    text = "\0".join(unique).lower()
+    offsets = np.cumsum([0] + [len(c) + 1 for c in unique[:-1]])
+
+    starts, cols, weights = [], [], []
+    for match in TOO_PATTERN.finditer(text):
+        start = match.start()
+        if start and text[start - 1].isalnum():
+            continue  # "tattoo salty" is not a rule
+        negated, intensity = _modifiers(_preceding_words(text, start))
+        if not negated:
+            starts.append(start)
+            cols.append(_TASTE_INDEX[match[1]])
+            weights.append(-intensity)
+    for match in ENOUGH_PATTERN.finditer(text):
+        start = match.start()
+        words = _preceding_words(text, start)
+        if not words or words[-1] not in _TASTE_INDEX:
+            continue
+        negated, intensity = _modifiers(words[:-1])
+        if negated:
+            starts.append(start)
+            cols.append(_TASTE_INDEX[words[-1]])
+            weights.append(intensity)
+
+    signals = np.zeros((len(unique), len(TASTE_KEYS)))
+    if starts:
+        rows = np.searchsorted(offsets, starts, side="right") - 1
+        np.add.at(signals, (rows, cols), weights)
+        np.clip(signals, -FEEDBACK_MAX_SIGNAL, FEEDBACK_MAX_SIGNAL, out=signals)
+    return signals[positions] if unique else signals
+
+def feedback_signals(comment):
+    """
+    Signals of one comment (see comment_signals), as a tuple in TASTE_KEYS order.
+    """
+    return tuple(comment_signals([comment])[0].tolist())
+
+def apply_feedback(profile, comments, times=None, signals=None, event_ids=None):
+    """
+    Appends feedback comments to the user's taste history (taste_history.py)
+    and sets the profile's tastes to the result. Call inside the profile
+    store's update, so the profile and its history move together.
+
+    Args:
+        profile (dict): The stored profile, updated in place
+        comments (list): Feedback comments, oldest first
+        times (list): When each comment was given (epoch seconds), default now
+        signals (ndarray): The comments' signals, if already computed
+        event_ids (list): FeedbackLog ids of the comments; ids already in the
+                          history are not recorded again
+
+    Returns:
+        dict: taste -> (old value, new value) for every taste that changed
+    """
+    if signals is None:
+        signals = comment_signals(comments)
+    before = dict(profile["favorite_tastes"])
+    tastes = taste_history.record_feedback(
+        profile["user_id"], before, [tuple(row) for row in signals.tolist()], times, event_ids)
+    profile["favorite_tastes"].update(tastes)
+    return {k: (before.get(k), v) for k, v in tastes.items() if before.get(k) != v}
+
+def recompute_tastes(comments_by_user, base_tastes=None, step=DEFAULT_STEP):
+    """
+    Re-applies historical feedback for many users in one pass, e.g. after a
+    rule change: every comment is analyzed in one comment_signals call, then
+    all users are replayed together (taste_history.replay_batch).
+
+    Args:
+        comments_by_user (dict): user_id -> feedback comments, oldest first
+        base_tastes (dict): user_id -> tastes before the feedback, default neutral 0.5
+        step (float | sequence): Change per unit of signal, or one per taste
+
+    Returns:
+        dict: user_id -> tastes dict
+    """
+    import numpy as np
+
+    users = list(comments_by_user)
+    if not users:
+        return {}
+    comments = [c for user_id in users for c in comments_by_user[user_id]]
+    signals = comment_signals(comments)
+    kinds = np.full(len(comments), EVENT_FEEDBACK, dtype=np.uint8)
+    base_tastes = base_tastes or {}
+    start = [[float(base_tastes.get(user_id, {}).get(k, 0.5)) for k in TASTE_KEYS] for user_id in users]
+    tastes = replay_batch([len(comments_by_user[u]) for u in users], kinds, signals, step, start)
+    return {user_id: as_taste_dict(row) for user_id, row in zip(users, tastes.tolist())}
+
+###############################################################################
+# 2. Feedback Log (SQLite, WAL mode)
+###############################################################################
+class FeedbackLog:
+    """
+    Append-only log of feedback events. Appending is one small insert, so
+    request threads never wait on a profile read-modify-write; the
+    FeedbackApplier folds pending events into profiles later.
+    """
+
+    def __init__(self, db_path=FEEDBACK_DB_PATH):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._initialized = False
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            db_dir = os.path.dirname(self.db_path)
+            if db_dir:
+                os.makedirs(db_dir, exist_ok=True)
+            # Autocommit mode; every append is durable on its own
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        if not self._initialized:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS feedback_events ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, user_id TEXT NOT NULL, restaurant TEXT, "
+                "favorability REAL, comment TEXT NOT NULL, created_at REAL NOT NULL, applied_at REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS feedback_pending ON feedback_events (applied_at, id)")
+            # Taste history skips event ids it has already recorded, so ids must
+            # keep increasing even if this database is deleted and recreated:
+            # a new log starts counting from the current time in milliseconds
+            conn.execute(
+                "INSERT INTO sqlite_sequence (name, seq) SELECT 'feedback_events', ? "
+                "WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = 'feedback_events')",
+                (int(time.time() * 1000),),
+            )
+            self._initialized = True
+        return conn
+
+    def append(self, user_id, restaurant, favorability, comment):
+        """
+        Records one feedback event. Returns its id.
+        """
+        cur = self._conn().execute(
+            "INSERT INTO feedback_events (user_id, restaurant, favorability, comment, created_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (user_id, restaurant, favorability, comment, time.time()),
+        )
+        return cur.lastrowid
+
+    def pending(self, limit=FEEDBACK_BATCH_SIZE):
+        """
+        The oldest events not yet applied, as (id, user_id, comment, created_at)
+        tuples in log order.
+        """
+        return self._conn().execute(
+            "SELECT id, user_id, comment, created_at FROM feedback_events WHERE applied_at IS NULL ORDER BY id LIMIT ?",
+            (limit,),
+        ).fetchall()
+
+    def pending_count(self):
+        return self._conn().execute(
+            "SELECT COUNT(*) FROM feedback_events WHERE applied_at IS NULL").fetchone()[0]
+
+    def mark_applied(self, event_ids):
+        conn = self._conn()
+        now = time.time()
+        ids = list(event_ids)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Stay well below SQLite's bound-parameter limit
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                conn.execute(
+                    f"UPDATE feedback_events SET applied_at = ? WHERE id IN ({','.join('?' * len(chunk))})",
+                    (now, *chunk),
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def purge_applied(self, max_age=FEEDBACK_RETENTION):
+        cur = self._conn().execute(
+            "DELETE FROM feedback_events WHERE applied_at < ?", (time.time() - max_age,))
+        return cur.rowcount
+
+###############################################################################
+# 3. Background Applier (write-behind)
+###############################################################################
+class FeedbackApplier:
+    """
+    Every `interval` seconds, reads the pending events and applies each
+    user's events, in order, in one profile update. A burst of feedback from
+    one user therefore costs one read-modify-write, not one per event.
+
+    Events are marked applied after their profile update commits; a crash in
+    between applies that user's batch again on restart. Every applied event
+    is also kept in the user's taste history, which records each event id
+    once, so a batch applied again does not count twice.
+
+    A user's events whose update fails are retried on later passes and
+    dropped after FEEDBACK_MAX_ATTEMPTS failures. A pass that fails as a
+    whole is logged and the thread keeps going, waiting longer (up to
+    FEEDBACK_MAX_BACKOFF) after each consecutive failure.
+    """
+
+    def __init__(self, log, interval=FEEDBACK_APPLY_INTERVAL):
+        self.log = log
+        self.interval = interval
+        self._wake = threading.Event()
+        self._stopping = False
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._apply_lock = threading.Lock()
+        self._attempts = {}  # event id -> failed updates so far
+
+    def apply_pending(self):
+        """
+        Applies every pending event now. Returns the number of events applied.
+        """
+        applied = 0
+        with self._apply_lock:
+            while True:
+                events = self.log.pending()
+                if not events:
+                    return applied
+                # Every comment of the pass is analyzed in one batch
+                signals = comment_signals([comment for _, _, comment, _ in events])
+                by_user = {}
+                for row, (event_id, user_id, comment, created_at) in enumerate(events):
+                    by_user.setdefault(user_id, []).append((event_id, comment, created_at, row))
+
+                store = get_profile_store()
+                progress = 0
+                for user_id, user_events in by_user.items():
+                    comments = [comment for _, comment, _, _ in user_events]
+                    times = [created_at for _, _, created_at, _ in user_events]
+                    rows = signals[[row for _, _, _, row in user_events]]
+                    event_ids = [event_id for event_id, _, _, _ in user_events]
+
+                    def apply_all(profile, comments=comments, times=times, rows=rows, event_ids=event_ids):
+                        apply_feedback(profile, comments, times, rows, event_ids)
+
+                    try:
+                        if store.update(user_id, apply_all) is None:
+                            print(f"Dropping {len(comments)} feedback events for unknown user {user_id}.")
+                    except Exception as e:
+                        print(f"Error applying feedback for user {user_id}:", e)
+                        if not self._failed(event_ids):
+                            continue  # Left pending; retried on the next pass
+                        print(f"Dropping {len(event_ids)} feedback events for user {user_id} "
+                              f"after {FEEDBACK_MAX_ATTEMPTS} failed attempts.")
+                    else:
+                        applied += len(user_events)
+                    self.log.mark_applied(event_ids)
+                    for event_id in event_ids:
+                        self._attempts.pop(event_id, None)
+                    progress += len(user_events)
+                # Events left pending would only be read again right away
+                if len(events) < FEEDBACK_BATCH_SIZE or not progress:
+                    return applied
+
+    def _failed(self, event_ids):
+        """
+        Counts a failed update of these events. Returns True once they have
+        failed FEEDBACK_MAX_ATTEMPTS times.
+        """
+        attempts = 0
+        for event_id in event_ids:
+            self._attempts[event_id] = self._attempts.get(event_id, 0) + 1
+            attempts = max(attempts, self._attempts[event_id])
+        return attempts >= FEEDBACK_MAX_ATTEMPTS
+
+    def _run(self):
+        try:
+            self.log.purge_applied()
+        except Exception as e:
+            print("Error purging applied feedback:", e)
+        failures = 0
+        while not self._stopping:
+            self._wake.wait(min(self.interval * 2 ** failures, max(self.interval, FEEDBACK_MAX_BACKOFF)))
+            self._wake.clear()
+            try:
+                self.apply_pending()
+                failures = 0
+            except Exception as e:
+                failures = min(failures + 1, 16)
+                print(f"Error applying feedback (attempt {failures}):", e)
+
+    def start(self):
+        """
+        Starts the applier thread, once per process and again if it has died.
+        """
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopping = False
+                self._thread = threading.Thread(target=self._run, name="feedback-applier", daemon=True)
+                self._thread.start()
+
+    def flush(self):
+        """
+        Applies everything pending right away (e.g. before shutdown).
+        """
+        return self.apply_pending()
+
+    def stop(self):
+        self._stopping = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+###############################################################################
+# 4. Shared Instances
+###############################################################################
+feedback_log = FeedbackLog()
+feedback_applier = FeedbackApplier(feedback_log)
+
+def record_feedback(user_id, restaurant, favorability, comment):
+    """
+    Non-blocking feedback intake: logs the event and returns its id. The
+    user's profile changes on the applier's next pass.
+    """
+    event_id = feedback_log.append(user_id, restaurant, favorability, comment)
+    feedback_applier.start()
+    return event_id
@@ -0,0 +1,372 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+###############################################################################
+# Setup & Configuration
+###############################################################################
+JOB_DB_PATH = os.environ.get("FLAVORAI_JOB_DB", os.path.join("personaldata", "jobs.db"))
+UPLOAD_DIR = os.path.join("personaldata", "uploads")   # Takeout files waiting for ingestion
+
+JOB_WORKERS = int(os.environ.get("FLAVORAI_JOB_WORKERS", "4"))  # Worker threads per process
+JOB_MAX_PENDING = 1000        # Queued + running jobs before submissions are refused
+JOB_MAX_ATTEMPTS = 3          # Runs of a failing job before it is marked failed
+JOB_LEASE_SECONDS = 30 * 60   # A running job not finished by then is assumed lost and rerun
+JOB_POLL_INTERVAL = 1.0       # Idle workers re-check the table this often (jobs from other processes)
+JOB_RETENTION = 7 * 24 * 3600 # Finished jobs older than this are purged at start
+
+class QueueFullError(Exception):
+    """
+    Raised by JobQueue.submit when JOB_MAX_PENDING jobs are already waiting.
+    """
+
+###############################################################################
+# 1. Persistent Job Queue (SQLite, WAL mode)
+###############################################################################
+class JobQueue:
+    """
+    Background jobs stored in SQLite and run by a pool of worker threads.
+
+    A job is claimed inside a BEGIN IMMEDIATE transaction, so several server
+    processes can share one database without running a job twice. Claims are
+    leases: a job still 'running' after JOB_LEASE_SECONDS (its process died)
+    is claimed again. Each job kind has its own concurrency limit per process,
+    so slow kinds cannot take every worker.
+
+    Submissions carry an optional idempotency key; submitting a key again
+    returns the existing job instead of queueing a duplicate (a failed job is
+    queued again).
+    """
+
+    def __init__(self, db_path=JOB_DB_PATH, workers=JOB_WORKERS, max_pending=JOB_MAX_PENDING):
+        self.db_path = db_path
+        self.workers = workers
+        self.max_pending = max_pending
+        self._handlers = {}          # kind -> (handler, concurrency, cleanup)
+        self._running = {}           # kind -> jobs of that kind running in this process
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._wake = threading.Condition(self._lock)
+        self._claim_lock = threading.Lock()  # One worker of this process claims at a time
+        self._threads = []
+        self._stopping = False
+        self._initialized = False
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            db_dir = os.path.dirname(self.db_path)
+            if db_dir:
+                os.makedirs(db_dir, exist_ok=True)
+            # Autocommit mode; transactions are opened explicitly
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        if not self._initialized:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, kind TEXT NOT NULL, job_key TEXT UNIQUE, user_id TEXT, "
+                "payload TEXT NOT NULL, status TEXT NOT NULL, result TEXT, error TEXT, "
+                "attempts INTEGER NOT NULL DEFAULT 0, created_at REAL NOT NULL, "
+                "started_at REAL, finished_at REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_user ON jobs (user_id, created_at)")
+            self._initialized = True
+        return conn
+
+    @staticmethod
+    def _row_to_job(row):
+        if row is None:
+            return None
+        job_id, kind, user_id, status, result, error, attempts, created, started, finished = row
+        return {
+            "job_id": job_id,
+            "kind": kind,
+            "user_id": user_id,
+            "status": status,
+            "attempts": attempts,
+            "created_at": created,
+            "started_at": started,
+            "finished_at": finished,
+            "result": json.loads(result) if result else None,
+            "error": error,
+        }
+
+    _JOB_COLUMNS = "id, kind, user_id, status, result, error, attempts, created_at, started_at, finished_at"
+
+    def register(self, kind, handler, concurrency=1, cleanup=None):
+        """
+        Registers handler(payload) -> JSON-serializable result for a job kind.
+
+        Args:
+            concurrency (int): Jobs of this kind run at once in this process
+            cleanup (callable): Called with the payload once a job of this kind
+                                is done or has failed for good
+        """
+        self._handlers[kind] = (handler, concurrency, cleanup)
+        self._running.setdefault(kind, 0)
+
+    def submit(self, kind, payload, key=None, user_id=None):
+        """
+        Queues a job, or returns the existing job with the same key.
+
+        Args:
+            kind (str): A registered job kind
+            payload (dict): JSON-serializable arguments for the handler
+            key (str): Idempotency key, e.g. 'onboarding:<user_id>:<request hash>'
+            user_id (str): Owner, for listing a user's jobs
+
+        Returns:
+            dict: The job (see get)
+
+        Raises:
+            QueueFullError: JOB_MAX_PENDING jobs are already queued or running
+        """
+        if kind not in self._handlers:
+            raise ValueError(f"Unknown job kind: {kind!r}")
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if key is not None:
+                row = conn.execute("SELECT id, status FROM jobs WHERE job_key = ?", (key,)).fetchone()
+                if row is not None and row[1] != "failed":
+                    conn.execute("COMMIT")
+                    return self.get(row[0])
+                if row is not None:
+                    # A failed job is retried under the same id
+                    conn.execute(
+                        "UPDATE jobs SET status = 'queued', attempts = 0, error = NULL, payload = ?, "
+                        "created_at = ?, started_at = NULL, finished_at = NULL WHERE id = ?",
+                        (json.dumps(payload), time.time(), row[0]),
+                    )
+                    conn.execute("COMMIT")
+                    self._notify()
+                    return self.get(row[0])
+
+            pending = conn.execute("SELECT COUNT(*) FROM jobs WHERE status IN ('queued', 'running')").fetchone()[0]
+            if pending >= self.max_pending:
+                raise QueueFullError(f"{pending} jobs are already pending")
+            job_id = uuid.uuid4().hex
+            conn.execute(
+                "INSERT INTO jobs (id, kind, job_key, user_id, payload, status, created_at) "
+                "VALUES (?, ?, ?, ?, ?, 'queued', ?)",
+                (job_id, kind, key, user_id, json.dumps(payload), time.time()),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        self._notify()
+        return self.get(job_id)
+
+    def find(self, key):
+        """
+        Returns the job submitted with idempotency key `key`, or None.
+        """
+        row = self._conn().execute(f"SELECT {self._JOB_COLUMNS} FROM jobs WHERE job_key = ?", (key,)).fetchone()
+        return self._row_to_job(row)
+
+    def get(self, job_id):
+        """
+        Returns the job as a dict (job_id, kind, user_id, status, attempts,
+        created_at, started_at, finished_at, result, error), or None.
+        Status is one of queued, running, done, failed.
+        """
+        row = self._conn().execute(f"SELECT {self._JOB_COLUMNS} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row_to_job(row)
+
+    def list(self, user_id=None, limit=50):
+        """
+        Returns the most recent jobs, newest first, optionally for one user.
+        """
+        if user_id is None:
+            rows = self._conn().execute(
+                f"SELECT {self._JOB_COLUMNS} FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,))
+        else:
+            rows = self._conn().execute(
+                f"SELECT {self._JOB_COLUMNS} FROM jobs WHERE user_id = ? ORDER BY created_at DESC LIMIT ?",
+                (user_id, limit))
+        return [self._row_to_job(row) for row in rows]
+
+    def counts(self):
+        """
+        status -> number of jobs.
+        """
+        return dict(self._conn().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+
+    def purge_finished(self, max_age=JOB_RETENTION):
+        conn = self._conn()
+        cur = conn.execute(
+            "DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?", (time.time() - max_age,))
+        return cur.rowcount
+
+    ###########################################################################
+    # Workers
+    ###########################################################################
+    def _notify(self):
+        self.start()
+        with self._wake:
+            self._wake.notify()
+
+    def _claim(self):
+        """
+        Claims the oldest runnable job whose kind is below its concurrency
+        limit. Returns (job_id, kind, payload, attempts) or None.
+        """
+        # The slot counts are read and taken under one claim lock, so two
+        # workers cannot both take the last slot of a kind. Claims are
+        # serialized by BEGIN IMMEDIATE anyway.
+        with self._claim_lock:
+            with self._lock:
+                kinds = [k for k, (_, limit, _) in self._handlers.items() if self._running[k] < limit]
+            if not kinds:
+                return None
+            now = time.time()
+            conn = self._conn()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    f"SELECT id, kind, payload, attempts FROM jobs "
+                    f"WHERE kind IN ({','.join('?' * len(kinds))}) "
+                    "AND (status = 'queued' OR (status = 'running' AND started_at < ?)) "
+                    "ORDER BY created_at LIMIT 1",
+                    (*kinds, now - JOB_LEASE_SECONDS),
+                ).fetchone()
+                if row is None:
+                    conn.execute("COMMIT")
+                    return None
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', attempts = attempts + 1, started_at = ? WHERE id = ?",
+                    (now, row[0]),
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            with self._lock:
+                self._running[row[1]] += 1
+            return row[0], row[1], json.loads(row[2]), row[3] + 1
+
+    def _finish(self, job_id, status, result=None, error=None):
+        self._conn().execute(
+            "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? WHERE id = ?",
+            (status, json.dumps(result) if result is not None else None, error,
+             time.time() if status in ("done", "failed") else None, job_id),
+        )
+
+    def _run(self, job_id, kind, payload, attempts):
+        handler, _, cleanup = self._handlers[kind]
+        status = "done"
+        try:
+            self._finish(job_id, status, result=handler(payload))
+        except Exception as e:
+            print(f"Job {job_id} ({kind}) failed on attempt {attempts}: {e}")
+            status = "failed" if attempts >= JOB_MAX_ATTEMPTS else "queued"
+            self._finish(job_id, status, error=str(e))
+        finally:
+            if cleanup is not None and status != "queued":
+                try:
+                    cleanup(payload)
+                except Exception as e:
+                    print(f"Error cleaning up job {job_id} ({kind}):", e)
+            with self._wake:
+                self._running[kind] -= 1
+                self._wake.notify()  # A slot of this kind is free again
+
+    def _work(self, purge=False):
+        if purge:
+            try:
+                self.purge_finished()
+            except sqlite3.Error as e:
+                print("Error purging finished jobs:", e)
+        while not self._stopping:
+            try:
+                claimed = self._claim()
+            except sqlite3.Error as e:
+                print("Error claiming a job:", e)
+                claimed = None
+            if claimed is None:
+                with self._wake:
+                    if not self._stopping:
+                        self._wake.wait(JOB_POLL_INTERVAL)
+                continue
+            self._run(*claimed)
+
+    def start(self):
+        """
+        Starts the worker threads once per process; also called by submit.
+        Jobs left by earlier processes are picked up as their leases expire.
+        """
+        if self._threads:
+            return
+        with self._lock:
+            if self._threads:
+                return
+            self._stopping = False
+            self._threads = [
+                threading.Thread(target=self._work, args=(i == 0,), name=f"job-worker-{i}", daemon=True)
+                for i in range(self.workers)
+            ]
+            for thread in self._threads:
+                thread.start()
+
+    def stop(self, timeout=None):
+        """
+        Stops the workers after their current jobs.
+        """
+        with self._wake:
+            self._stopping = True
+            self._wake.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+###############################################################################
+# 2. Job Kinds
+###############################################################################
+job_queue = JobQueue()
+
+def run_onboarding_job(payload):
+    """
+    Builds a user's initial taste profile (one Gemini call) from the
+    /onboarding request body.
+    """
+    import pandas as pd
+    from app import build_onboarding_profile
+
+    favorites_df = pd.DataFrame({"food_name": payload.get("favorites", [])})
+    return build_onboarding_profile(
+        payload["user_id"], favorites_df,
+        dietary_list=payload.get("dietary_restrictions", []),
+        allergies_list=payload.get("allergies", []),
+    )
+
+def run_takeout_job(payload):
+    """
+    Ingests an uploaded Takeout timeline for a user (see parseTakeoutData.py).
+    """
+    from utils.parseTakeoutData import OUTPUT_DIR, run_ingestion
+
+    visits = run_ingestion(payload["path"], OUTPUT_DIR, user_id=payload["user_id"])
+    if visits is None:
+        raise RuntimeError("The location history could not be read")
+    return {"restaurants": len(visits), "visits": sum(visits.values())}
+
+def remove_upload(payload):
+    """
+    Deletes a Takeout job's upload once the job is done or has failed for
+    good; uploading the file again is how a failed ingestion is retried.
+    """
+    try:
+        os.remove(payload["path"])
+    except FileNotFoundError:
+        pass
+
+# Onboarding waits on Gemini; ingestion is rate limited by Places, so one at a time
+job_queue.register("onboarding", run_onboarding_job, concurrency=4)
+job_queue.register("takeout", run_takeout_job, concurrency=1, cleanup=remove_upload)
@@ -0,0 +1,209 @@
+import contextvars
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+###############################################################################
+# Setup & Configuration
+###############################################################################
+# Server-Timing headers on every response; a client can also ask for them on
+# one request with the SERVER_TIMING_REQUEST_HEADER header
+SERVER_TIMING = os.environ.get("FLAVORAI_SERVER_TIMING", "0") == "1"
+SERVER_TIMING_REQUEST_HEADER = "X-FlavorAI-Timing"
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+###############################################################################
+# 1. Counters & Histograms
+###############################################################################
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+def _format_labels(key, extra=()):
+    pairs = [*key, *extra]
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"') for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+class Counter:
+    """
+    Monotonic counter with labels, e.g. upstream calls by service and outcome.
+    """
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(_label_key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            return dict(self._values)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(self.samples().items()):
+            lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+class Histogram:
+    """
+    Cumulative-bucket latency histogram with labels, in Prometheus layout.
+    """
+
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = buckets
+        self._series = {}   # label key -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {key: list(values) for key, values in self._series.items()}
+        for key, values in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(key, [('le', bound)])} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(key, [('le', '+Inf')])} {values[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {values[-2]}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {values[-1]}")
+        return lines
+
+###############################################################################
+# 2. Shared Metrics
+###############################################################################
+stage_seconds = Histogram(
+    "flavorai_stage_seconds", "Time spent in each recommendation pipeline stage.")
+upstream_requests = Counter(
+    "flavorai_upstream_requests_total", "Calls to Google Places and Gemini by endpoint and outcome.")
+upstream_seconds = Histogram(
+    "flavorai_upstream_seconds", "Latency of single upstream calls, retries counted separately.")
+cache_requests = Counter(
+    "flavorai_cache_requests_total", "Cache lookups by cache and result (hit or miss).")
+
+def record_upstream(service, endpoint, outcome, seconds):
+    upstream_requests.inc(service=service, endpoint=endpoint, outcome=outcome)
+    upstream_seconds.observe(seconds, service=service, endpoint=endpoint)
+
+def record_cache(cache, hits, misses):
+    if hits:
+        cache_requests.inc(hits, cache=cache, result="hit")
+    if misses:
+        cache_requests.inc(misses, cache=cache, result="miss")
+
+###############################################################################
+# 3. Stage Spans & Server-Timing
+###############################################################################
+# Spans of the request being served: a list while one is being collected
+_request_spans = contextvars.ContextVar("flavorai_request_spans", default=None)
+
+@contextmanager
+def span(stage):
+    """
+    Times a pipeline stage into flavorai_stage_seconds and, while a request is
+    collecting spans (see start_request_spans), into its Server-Timing header.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        stage_seconds.observe(elapsed, stage=stage)
+        spans = _request_spans.get()
+        if spans is not None:
+            spans.append((stage, elapsed))
+
+def start_request_spans():
+    """
+    Starts collecting spans for the current request. Returns a token for
+    finish_request_spans.
+    """
+    return _request_spans.set([])
+
+def finish_request_spans(token):
+    """
+    Stops collecting and returns the Server-Timing header value for the spans
+    recorded since start_request_spans (same-named stages are summed).
+    """
+    spans = _request_spans.get() or []
+    _request_spans.reset(token)
+    totals = {}
+    for stage, elapsed in spans:
+        totals[stage] = totals.get(stage, 0.0) + elapsed
+    return ", ".join(f"{stage};dur={elapsed * 1000:.2f}" for stage, elapsed in totals.items())
+
+def wants_server_timing(header_value):
+    """
+    Whether to send Server-Timing for a request whose
+    SERVER_TIMING_REQUEST_HEADER header has this value (None if absent).
+    """
+    return SERVER_TIMING or header_value == "1"
+
+###############################################################################
+# 4. Prometheus Exposition
+###############################################################################
+def cache_hit_ratios():
+    """
+    cache name -> hits / lookups since start.
+    """
+    totals = {}
+    for key, value in cache_requests.samples().items():
+        labels = dict(key)
+        hits, lookups = totals.get(labels["cache"], (0, 0))
+        totals[labels["cache"]] = (hits + (value if labels["result"] == "hit" else 0), lookups + value)
+    return {cache: hits / lookups for cache, (hits, lookups) in totals.items() if lookups}
+
+def render_prometheus():
+    """
+    Every metric in the Prometheus text format, including the single-flight
+    counters and per-cache hit ratios.
+    """
+    from singleflight import all_stats
+
+    lines = []
+    for metric in (stage_seconds, upstream_requests, upstream_seconds, cache_requests):
+        lines.extend(metric.render())
+
+    lines += ["# HELP flavorai_cache_hit_ratio Cache hits divided by lookups since start.",
+              "# TYPE flavorai_cache_hit_ratio gauge"]
+    for cache, ratio in sorted(cache_hit_ratios().items()):
+        lines.append(f'flavorai_cache_hit_ratio{{cache="{cache}"}} {ratio:.6f}')
+
+    flights = all_stats()
+    for field, kind, help_text in (
+        ("executions", "counter", "Upstream calls made by each single-flight group."),
+        ("coalesced", "counter", "Callers served by another caller's in-flight call."),
+        ("in_flight", "gauge", "Calls currently in flight per single-flight group."),
+    ):
+        name = f"flavorai_singleflight_{field}" + ("_total" if kind == "counter" else "")
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+        for flight in flights:
+            lines.append(f'{name}{{flight="{flight["name"]}"}} {flight[field]}')
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,302 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+from cache import place_card_cache
+from metrics import record_cache
+
+###############################################################################
+# Setup & Configuration
+###############################################################################
+NEARBY_CACHE_TTL = 3600          # Seconds a fetched tile is served locally
+NEARBY_TILE_PRECISION = 6        # Geohash length; ~1.2 km x 0.6 km cells
+NEARBY_MAX_ENTRIES_PER_TILE = 8  # Oldest searches in a tile are evicted first
+NEARBY_MAX_TILES = 20000         # Least recently used tiles are evicted beyond this
+NEARBY_PURGE_INTERVAL = 300      # Seconds between sweeps of expired entries
+
+# Cached open_now flags that cannot be recomputed from opening-hours periods
+# are trusted for this long; after that the search is fetched again
+NEARBY_OPEN_NOW_TTL = 600
+
+# Google returns at most this many places per Nearby Search page, ranked by
+# prominence. A full page (or one with a next_page_token) is not everything in
+# the circle, so it cannot answer a smaller circle inside it...
+NEARBY_PAGE_SIZE = 20
+# ...unless the smaller circle is nearly the same search
+NEARBY_CONTAINED_RATIO = 0.8
+# Statuses of a Nearby Search that actually answered; any other (REQUEST_DENIED,
+# INVALID_REQUEST, OVER_QUERY_LIMIT, ...) says nothing about the circle
+NEARBY_ANSWER_STATUS = ("OK", "ZERO_RESULTS")
+
+_GEOHASH_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+_EARTH_RADIUS_M = 6371008.8
+
+###############################################################################
+# 1. Geohash & Distance Helpers
+###############################################################################
+def geohash_encode(lat, lon, precision=NEARBY_TILE_PRECISION):
+    """
+    Encodes a coordinate as a geohash string of the given length.
+    """
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(chars) < precision:
+        rng, val = (lon_range, lon) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        if val >= mid:
+            bits = (bits << 1) | 1
+            rng[0] = mid
+        else:
+            bits <<= 1
+            rng[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(_GEOHASH_BASE32[bits])
+            bits = 0
+            bit_count = 0
+    return "".join(chars)
+
+def geohash_cell_size(precision=NEARBY_TILE_PRECISION):
+    """
+    Returns the (lat_degrees, lon_degrees) size of a geohash cell.
+    """
+    total_bits = precision * 5
+    lon_bits = (total_bits + 1) // 2
+    lat_bits = total_bits // 2
+    return 180.0 / (2 ** lat_bits), 360.0 / (2 ** lon_bits)
+
+def geohash_neighborhood(lat, lon, precision=NEARBY_TILE_PRECISION):
+    """
+    Returns the geohash of the cell containing (lat, lon) and its 8 neighbours.
+    """
+    dlat, dlon = geohash_cell_size(precision)
+    tiles = set()
+    for i in (-1, 0, 1):
+        for j in (-1, 0, 1):
+            nlat = max(-90.0, min(90.0, lat + i * dlat))
+            nlon = (lon + j * dlon + 180.0) % 360.0 - 180.0
+            tiles.add(geohash_encode(nlat, nlon, precision))
+    return tiles
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    """
+    Great-circle distance in meters between two coordinates.
+    """
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * _EARTH_RADIUS_M * math.asin(math.sqrt(a))
+
+###############################################################################
+# 2. Opening Hours
+###############################################################################
+def is_open_at(opening_hours, utc_offset_minutes, now=None):
+    """
+    Decides whether a place is open from its Google 'periods' list.
+
+    Args:
+        opening_hours (dict): Google 'opening_hours' object with a 'periods' list
+        utc_offset_minutes (int): The place's 'utc_offset' in minutes
+        now (datetime): Aware UTC datetime, defaults to the current time
+
+    Returns:
+        bool | None: Open or closed, or None when the periods are unavailable
+    """
+    periods = (opening_hours or {}).get("periods")
+    if not periods or utc_offset_minutes is None:
+        return None
+
+    now = now or datetime.now(timezone.utc)
+    local = now + timedelta(minutes=utc_offset_minutes)
+    google_day = (local.weekday() + 1) % 7  # Google counts Sunday as day 0
+    minute_of_week = google_day * 1440 + local.hour * 60 + local.minute
+
+    def to_minutes(point):
+        hhmm = point.get("time", "0000")
+        return point.get("day", 0) * 1440 + int(hhmm[:2]) * 60 + int(hhmm[2:])
+
+    for period in periods:
+        open_point = period.get("open")
+        close_point = period.get("close")
+        if open_point is None:
+            continue
+        if close_point is None:
+            return True  # Google's encoding for "open 24 hours"
+        start, end = to_minutes(open_point), to_minutes(close_point)
+        if start <= end:
+            if start <= minute_of_week < end:
+                return True
+        elif minute_of_week >= start or minute_of_week < end:
+            return True  # Period wraps past Saturday midnight
+    return False
+
+def refresh_open_now(place, now=None, card=None):
+    """
+    Returns a copy of a cached Nearby Search result with 'open_now' recomputed
+    from opening-hours periods, or None when they are unknown. Nearby Search
+    results carry no periods; they are taken from the place's cached
+    restaurant card (place_details.py) when there is one.
+
+    Args:
+        place (dict): A cached Nearby Search result
+        now (datetime): Aware UTC datetime, defaults to the current time
+        card (dict): The place's place_card_cache record, if any
+    """
+    opening_hours = place.get("opening_hours")
+    utc_offset = place.get("utc_offset")
+    if card is not None and not (opening_hours or {}).get("periods"):
+        opening_hours = card["values"].get("opening_hours")
+        utc_offset = card["values"].get("utc_offset", utc_offset)
+    open_now = is_open_at(opening_hours, utc_offset, now)
+    if open_now is None:
+        return None
+    refreshed = dict(place)
+    refreshed["opening_hours"] = dict(place.get("opening_hours") or {}, open_now=open_now)
+    return refreshed
+
+def refresh_open_now_many(places, now=None):
+    """
+    refresh_open_now for many places, loading their cached cards in one go.
+
+    Returns:
+        list: One refreshed place per input, or None where open_now is unknown
+    """
+    cards = place_card_cache.get_many([p["place_id"] for p in places if p.get("place_id")])
+    return [refresh_open_now(p, now, cards.get(p.get("place_id"))) for p in places]
+
+def is_complete_answer(data):
+    """
+    Whether a Nearby Search response holds every place in its circle rather
+    than the first page of a longer list. Failed searches answer nothing.
+    """
+    if data.get("status") not in NEARBY_ANSWER_STATUS:
+        return False
+    return len(data.get("results", [])) < NEARBY_PAGE_SIZE and not data.get("next_page_token")
+
+###############################################################################
+# 3. Tile-Indexed Nearby Search Cache
+###############################################################################
+class NearbySearchCache:
+    """
+    In-memory cache of Nearby Search results indexed by geohash tile.
+
+    A stored search covers the circle (center, radius) it was fetched with.
+    A later query is served locally when its own circle lies entirely inside
+    a fresh stored circle and the stored answer can stand for it: either it
+    was complete (fewer than a page of places, no next page), or the query
+    radius is at least NEARBY_CONTAINED_RATIO of the stored one. The cached
+    places are then filtered down to the query radius.
+
+    open_now is recomputed from opening-hours periods where they are known;
+    when some are not, the entry is only served for NEARBY_OPEN_NOW_TTL.
+    At most NEARBY_MAX_TILES tiles are kept, least recently used first out,
+    and expired entries are swept every NEARBY_PURGE_INTERVAL seconds.
+
+    Args:
+        ttl (float): Freshness window in seconds
+        precision (int): Geohash length used for tiles
+    """
+
+    def __init__(self, ttl=NEARBY_CACHE_TTL, precision=NEARBY_TILE_PRECISION):
+        self.ttl = ttl
+        self.precision = precision
+        self._tiles = OrderedDict()
+        self._lock = threading.Lock()
+        self._last_purge = time.time()
+
+    def lookup(self, lat, lon, radius_meters, place_type="restaurant"):
+        """
+        Returns cached places within radius_meters of (lat, lon), or None on a miss.
+        """
+        now = time.time()
+        best = None
+        with self._lock:
+            for tile in geohash_neighborhood(lat, lon, self.precision):
+                for entry in self._tiles.get(tile, []):
+                    if entry["type"] != place_type or now - entry["fetched_at"] > self.ttl:
+                        continue
+                    offset = haversine_m(lat, lon, entry["lat"], entry["lon"])
+                    if offset + radius_meters > entry["radius"]:
+                        continue
+                    if not entry["complete"] and radius_meters < entry["radius"] * NEARBY_CONTAINED_RATIO:
+                        continue  # A top-20 answer says little about a much smaller circle
+                    if best is None or entry["fetched_at"] > best["fetched_at"]:
+                        best = entry
+            if best is not None:
+                self._tiles.move_to_end(best["tile"])
+        results = None if best is None else self._serve(best, lat, lon, radius_meters, now)
+        record_cache("nearby_search", int(results is not None), int(results is None))
+        return results
+
+    def _serve(self, entry, lat, lon, radius_meters, now):
+        # The entry's places within the query circle, with open_now brought up to date
+        places = []
+        for place in entry["results"]:
+            location = place.get("geometry", {}).get("location", {})
+            plat, plon = location.get("lat"), location.get("lng")
+            if plat is not None and plon is not None and haversine_m(lat, lon, plat, plon) > radius_meters:
+                continue
+            places.append(place)
+        refreshed = refresh_open_now_many(places)
+        if None in refreshed and now - entry["fetched_at"] > NEARBY_OPEN_NOW_TTL:
+            return None  # Some cached open_now flags are too old to trust
+        return [r if r is not None else p for p, r in zip(places, refreshed)]
+
+    def store(self, lat, lon, radius_meters, results, place_type="restaurant", complete=False):
+        """
+        Records the results of a Nearby Search fetched at (lat, lon, radius_meters).
+
+        Args:
+            complete (bool): The results are every place in the circle (see
+                             is_complete_answer), not just the top of a list
+        """
+        now = time.time()
+        tile = geohash_encode(lat, lon, self.precision)
+        entry = {
+            "tile": tile,
+            "lat": lat,
+            "lon": lon,
+            "radius": radius_meters,
+            "type": place_type,
+            "results": results,
+            "complete": complete,
+            "fetched_at": now,
+        }
+        with self._lock:
+            entries = [e for e in self._tiles.get(tile, []) if now - e["fetched_at"] <= self.ttl]
+            entries.append(entry)
+            self._tiles[tile] = entries[-NEARBY_MAX_ENTRIES_PER_TILE:]
+            self._tiles.move_to_end(tile)
+            while len(self._tiles) > NEARBY_MAX_TILES:
+                self._tiles.popitem(last=False)
+        if now - self._last_purge > NEARBY_PURGE_INTERVAL:
+            self.purge_expired()
+
+    def purge_expired(self):
+        now = time.time()
+        with self._lock:
+            self._last_purge = now
+            for tile in list(self._tiles):
+                fresh = [e for e in self._tiles[tile] if now - e["fetched_at"] <= self.ttl]
+                if fresh:
+                    self._tiles[tile] = fresh
+                else:
+                    del self._tiles[tile]
+
+    def __len__(self):
+        return len(self._tiles)
+
+    def clear(self):
+        with self._lock:
+            self._tiles.clear()
+
+# Shared instance used by find_nearby_restaurants
+nearby_search_cache = NearbySearchCache()
@@ -0,0 +1,182 @@
+import time
+
+from cache import place_card_cache
+from singleflight import async_details_flight, details_flight
+
+###############################################################################
+# Setup & Configuration
+###############################################################################
+# Seconds each Place Details field is served from the cache before it is
+# fetched again; fields not listed use PLACE_DETAILS_DEFAULT_TTL
+PLACE_DETAILS_FIELD_TTLS = {
+    "name": 30 * 24 * 3600,
+    "formatted_address": 30 * 24 * 3600,
+    "geometry": 30 * 24 * 3600,
+    "types": 30 * 24 * 3600,
+    "vicinity": 30 * 24 * 3600,
+    "formatted_phone_number": 7 * 24 * 3600,
+    "website": 7 * 24 * 3600,
+    "opening_hours": 24 * 3600,      # Weekly hours; open_now is not served from here
+    "utc_offset": 24 * 3600,
+    "rating": 6 * 3600,
+    "user_ratings_total": 6 * 3600,
+    "reviews": 6 * 3600,             # New reviews arrive all the time
+}
+PLACE_DETAILS_DEFAULT_TTL = 24 * 3600
+
+# Everything a restaurant card needs (the /restaurant response and its
+# reviews), plus utc_offset so the cached opening-hours periods can answer
+# "open now" for the nearby cache. Any miss fetches whichever of these are
+# missing or stale, so opening a card after a recommendation costs at most
+# one request.
+PLACE_CARD_FIELDS = ["name", "formatted_address", "formatted_phone_number", "website",
+                     "opening_hours", "utc_offset", "geometry", "reviews"]
+
+# Review keys kept in the cache; photos and profile URLs are dropped
+REVIEW_FIELDS = ["author_name", "rating", "text", "time", "relative_time_description"]
+
+###############################################################################
+# 1. Cached Records
+###############################################################################
+def split_fields(fields):
+    # Accepts the Places "a,b,c" form as well as a list
+    if isinstance(fields, str):
+        fields = fields.split(",")
+    return [f.strip() for f in fields if f.strip()]
+
+def field_ttl(field):
+    return PLACE_DETAILS_FIELD_TTLS.get(field, PLACE_DETAILS_DEFAULT_TTL)
+
+def stale_fields(record, fields, now=None):
+    """
+    The fields of `fields` that the cached record lacks or holds past their TTL.
+    """
+    if record is None:
+        return list(fields)
+    now = now if now is not None else time.time()
+    fetched_at = record["fetched_at"]
+    return [f for f in fields if f not in fetched_at or now - fetched_at[f] > field_ttl(f)]
+
+def normalize_result(result, fields):
+    """
+    Keeps only the requested fields of a Place Details result, with reviews
+    trimmed to REVIEW_FIELDS.
+    """
+    values = {f: result[f] for f in fields if f in result}
+    if "reviews" in values:
+        values["reviews"] = [{k: r[k] for k in REVIEW_FIELDS if k in r} for r in values["reviews"]]
+    return values
+
+def merge_record(record, result, fields, now=None):
+    """
+    A new record with the fetched fields replacing the cached ones. Fields
+    Google left out (a place without a website) are remembered as absent.
+    """
+    now = now if now is not None else time.time()
+    values = dict(record["values"]) if record else {}
+    fetched_at = dict(record["fetched_at"]) if record else {}
+    for field in fields:
+        values.pop(field, None)
+        fetched_at[field] = now
+    values.update(normalize_result(result, fields))
+    return {"values": values, "fetched_at": fetched_at}
+
+def project(record, fields):
+    """
+    The record as a Place Details response with only `fields`, so callers
+    parse it exactly as they would Google's answer.
+    """
+    values = record["values"]
+    return {"status": "OK", "result": {f: values[f] for f in fields if f in values}}
+
+###############################################################################
+# 2. Place Details Service
+###############################################################################
+class PlaceDetailsService:
+    """
+    Place Details shared by every caller that needs them (restaurant cards,
+    reviews). A request for any fields is answered from the cache when they
+    are all fresh; otherwise one Places request fetches every field of
+    `fetch_fields` (plus the requested ones) that is missing or stale, and
+    the result is merged into the cached record. Concurrent misses for the
+    same place share that request.
+
+    Args:
+        cache (PersistentCache): Where the per-place records live
+        fetch_fields (list): Fields fetched together on any miss
+    """
+
+    def __init__(self, cache, fetch_fields=PLACE_CARD_FIELDS):
+        self.cache = cache
+        self.fetch_fields = list(fetch_fields)
+
+    def _to_fetch(self, record, fields):
+        """
+        The fields to request for a miss, or [] when `fields` are all fresh.
+        """
+        now = time.time()
+        if not stale_fields(record, fields, now):
+            return []
+        wanted = list(dict.fromkeys(self.fetch_fields + fields))
+        return stale_fields(record, wanted, now)
+
+    def _store(self, place_id, record, data, fetch):
+        # Only definitive answers are cached; errors are handed back as they are
+        if data.get("status") != "OK":
+            return None
+        record = merge_record(record, data.get("result", {}), fetch)
+        self.cache.set(place_id, record)
+        return record
+
+    def get(self, place_id, fields, client):
+        """
+        Place Details for one place, in the Places response shape.
+
+        Args:
+            place_id (str): Google Place ID
+            fields (str | list): Fields wanted, e.g. 'reviews'
+            client (PlacesClient): Used on a miss
+
+        Returns:
+            dict: {'status': ..., 'result': {...}}
+
+        Raises:
+            requests.RequestException: When Google could not be reached
+        """
+        fields = split_fields(fields)
+        record = self.cache.get(place_id)
+        fetch = self._to_fetch(record, fields)
+        if not fetch:
+            return project(record, fields)
+
+        def fetch_and_store():
+            data = client.details(place_id, ",".join(fetch))
+            return data, self._store(place_id, record, data, fetch)
+
+        data, record = details_flight.do((place_id, tuple(fetch)), fetch_and_store)
+        return project(record, fields) if record else data
+
+    async def get_async(self, place_id, fields, client):
+        """
+        get() for the ASGI service, fetching through an AsyncPlacesClient.
+
+        Raises:
+            httpx.HTTPError: When Google could not be reached
+        """
+        fields = split_fields(fields)
+        record = self.cache.get(place_id)
+        fetch = self._to_fetch(record, fields)
+        if not fetch:
+            return project(record, fields)
+
+        async def fetch_and_store():
+            data = await client.details(place_id, ",".join(fetch))
+            return data, self._store(place_id, record, data, fetch)
+
+        data, record = await async_details_flight.do((place_id, tuple(fetch)), fetch_and_store)
+        return project(record, fields) if record else data
+
+###############################################################################
+# 3. Shared Instance
+###############################################################################
+place_details = PlaceDetailsService(place_card_cache)
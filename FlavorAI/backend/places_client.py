@@ -0,0 +1,291 @@
+import asyncio
+import itertools
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import record_upstream
+
+###############################################################################
+# Setup & Configuration
+###############################################################################
+PLACES_BASE_URL = "https://maps.googleapis.com/maps/api/place"
+
+PLACES_MAX_CONCURRENCY = 8        # Simultaneous in-flight Places requests
+PLACES_TIMEOUT = (3.05, 10)       # (connect, read) seconds per request
+PLACES_MAX_RETRIES = 3            # Extra attempts after the first failure
+PLACES_BACKOFF_BASE = 0.25        # Seconds; doubled on every retry, then jittered
+PLACES_ASYNC_MAX_CONCURRENCY = 128 # In-flight requests for the async client (no threads held)
+# httpcore rescans every connection in a pool for each queued request, so CPU
+# per request grows with pool size; many small pools keep that scan short
+PLACES_ASYNC_POOL_SIZE = 8
+
+# HTTP statuses and Places API statuses that are worth retrying
+RETRYABLE_HTTP_STATUS = {429, 500, 502, 503, 504}
+RETRYABLE_API_STATUS = {"OVER_QUERY_LIMIT", "UNKNOWN_ERROR"}
+
+###############################################################################
+# 1. Places Client
+###############################################################################
+class PlacesClient:
+    """
+    Google Places client with a pooled keep-alive session, bounded concurrency,
+    per-request timeouts and retry with full jitter. Blocking calls can be fanned
+    out over a shared thread pool with map().
+
+    Args:
+        api_key (str): Google Maps Platform key
+        max_concurrency (int): Upper bound on simultaneous requests
+        timeout (float | tuple): requests-style timeout for every call
+        max_retries (int): Retries after the first failed attempt
+    """
+
+    def __init__(self, api_key, max_concurrency=PLACES_MAX_CONCURRENCY,
+                 timeout=PLACES_TIMEOUT, max_retries=PLACES_MAX_RETRIES):
+        self.api_key = api_key
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.max_concurrency = max_concurrency
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max_concurrency, pool_maxsize=max_concurrency)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    def _pool(self):
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.max_concurrency, thread_name_prefix="places"
+                    )
+        return self._executor
+
+    def get_json(self, path, params):
+        """
+        GETs PLACES_BASE_URL/<path>/json and returns the decoded body, retrying
+        transient failures.
+
+        Args:
+            path (str): Endpoint name, e.g. 'nearbysearch' or 'details'
+            params (dict): Query parameters without the key
+
+        Returns:
+            dict: Decoded JSON response
+
+        Raises:
+            requests.RequestException: When every attempt failed
+        """
+        url = f"{PLACES_BASE_URL}/{path}/json"
+        query = dict(params, key=self.api_key)
+        attempt = 0
+        while True:
+            started = time.perf_counter()
+            response = None
+            try:
+                with self._slots:
+                    response = self.session.get(url, params=query, timeout=self.timeout)
+                record_upstream("places", path, str(response.status_code), time.perf_counter() - started)
+                if response.status_code in RETRYABLE_HTTP_STATUS and attempt < self.max_retries:
+                    raise requests.HTTPError(f"Retryable status {response.status_code}", response=response)
+                response.raise_for_status()
+                data = response.json()
+                if data.get("status") in RETRYABLE_API_STATUS and attempt < self.max_retries:
+                    raise requests.HTTPError(f"Retryable Places status {data.get('status')}")
+                return data
+            except (requests.ConnectionError, requests.Timeout, requests.HTTPError) as e:
+                if response is None:  # Calls with a response were counted by status above
+                    record_upstream("places", path, type(e).__name__, time.perf_counter() - started)
+                retryable = not isinstance(e, requests.HTTPError) or e.response is None \
+                    or e.response.status_code in RETRYABLE_HTTP_STATUS
+                if not retryable or attempt >= self.max_retries:
+                    raise
+                # Full jitter: sleep anywhere in [0, base * 2^attempt]
+                time.sleep(random.uniform(0, PLACES_BACKOFF_BASE * (2 ** attempt)))
+                attempt += 1
+
+    def nearby_search(self, lat, lon, radius_meters, place_type="restaurant", page_token=None):
+        """
+        Calls Nearby Search. With a page_token only the token is sent, as Google requires.
+        """
+        if page_token:
+            return self.get_json("nearbysearch", {"pagetoken": page_token})
+        return self.get_json("nearbysearch", {
+            "location": f"{lat},{lon}",
+            "radius": radius_meters,
+            "type": place_type,
+        })
+
+    def details(self, place_id, fields):
+        """
+        Calls Place Details for one place.
+
+        Args:
+            place_id (str): The Google Place ID
+            fields (str | list): Comma-separated field mask or a list of fields
+        """
+        if not isinstance(fields, str):
+            fields = ",".join(fields)
+        return self.get_json("details", {"placeid": place_id, "fields": fields})
+
+    def map(self, fn, items):
+        """
+        Runs fn over items on the client's thread pool and returns the results
+        in input order. Exceptions are returned in place of results so one bad
+        item does not fail the whole batch.
+        """
+        items = list(items)
+        if len(items) <= 1:
+            return [self._call(fn, item) for item in items]
+        return list(self._pool().map(lambda item: self._call(fn, item), items))
+
+    @staticmethod
+    def _call(fn, item):
+        try:
+            return fn(item)
+        except Exception as e:
+            return e
+
+    def details_many(self, place_ids, fields):
+        """
+        Fetches Place Details for many places in parallel.
+
+        Returns:
+            dict: place_id -> decoded response, or the exception raised for it
+        """
+        place_ids = list(place_ids)
+        results = self.map(lambda pid: self.details(pid, fields), place_ids)
+        return dict(zip(place_ids, results))
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+        self.session.close()
+
+###############################################################################
+# 2. Async Places Client
+###############################################################################
+class AsyncPlacesClient:
+    """
+    asyncio counterpart of PlacesClient on httpx.AsyncClient: same retry
+    policy, with concurrency bounded by semaphores instead of threads, so
+    hundreds of waiting requests cost no worker threads. Requests are spread
+    round-robin over several small connection pools (PLACES_ASYNC_POOL_SIZE
+    each). httpx is imported on first use, keeping it off the synchronous
+    service's startup path.
+
+    Args:
+        api_key (str): Google Maps Platform key
+        max_concurrency (int): Upper bound on simultaneous requests
+        timeout (float | tuple): (connect, read) seconds for every call
+        max_retries (int): Retries after the first failed attempt
+        base_url (str): Defaults to PLACES_BASE_URL (override for fake upstreams)
+    """
+
+    def __init__(self, api_key, max_concurrency=PLACES_ASYNC_MAX_CONCURRENCY,
+                 timeout=PLACES_TIMEOUT, max_retries=PLACES_MAX_RETRIES, base_url=None):
+        self.api_key = api_key
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.max_concurrency = max_concurrency
+        self.base_url = base_url
+        self._pools = None
+        self._next_pool = itertools.count()
+
+    def _pool(self):
+        """
+        Picks the next (client, semaphore) pair, creating the pools inside the
+        running loop on first use.
+        """
+        if self._pools is None:
+            import ssl
+            import httpx
+            connect, read = self.timeout if isinstance(self.timeout, tuple) else (self.timeout, self.timeout)
+            size = min(PLACES_ASYNC_POOL_SIZE, self.max_concurrency)
+            tls = ssl.create_default_context()  # Loaded once, shared by every pool
+            self._pools = [
+                (httpx.AsyncClient(timeout=httpx.Timeout(read, connect=connect), verify=tls,
+                                   limits=httpx.Limits(max_connections=size, max_keepalive_connections=size)),
+                 asyncio.Semaphore(size))
+                for _ in range(max(1, self.max_concurrency // size))
+            ]
+        return self._pools[next(self._next_pool) % len(self._pools)]
+
+    async def get_json(self, path, params):
+        """
+        GETs <base_url>/<path>/json and returns the decoded body, retrying
+        transient failures.
+
+        Raises:
+            httpx.HTTPError: When every attempt failed
+        """
+        import httpx
+
+        client, slots = self._pool()
+        url = f"{self.base_url or PLACES_BASE_URL}/{path}/json"
+        query = dict(params, key=self.api_key)
+        attempt = 0
+        while True:
+            started = time.perf_counter()
+            response = None
+            try:
+                async with slots:
+                    response = await client.get(url, params=query)
+                record_upstream("places", path, str(response.status_code), time.perf_counter() - started)
+                if response.status_code in RETRYABLE_HTTP_STATUS and attempt < self.max_retries:
+                    raise httpx.HTTPStatusError(f"Retryable status {response.status_code}",
+                                                request=response.request, response=response)
+                response.raise_for_status()
+                data = response.json()
+                if data.get("status") in RETRYABLE_API_STATUS and attempt < self.max_retries:
+                    raise httpx.TransportError(f"Retryable Places status {data.get('status')}")
+                return data
+            except httpx.HTTPError as e:
+                if response is None:
+                    record_upstream("places", path, type(e).__name__, time.perf_counter() - started)
+                retryable = not isinstance(e, httpx.HTTPStatusError) \
+                    or e.response.status_code in RETRYABLE_HTTP_STATUS
+                if not retryable or attempt >= self.max_retries:
+                    raise
+                await asyncio.sleep(random.uniform(0, PLACES_BACKOFF_BASE * (2 ** attempt)))
+                attempt += 1
+
+    async def nearby_search(self, lat, lon, radius_meters, place_type="restaurant", page_token=None):
+        if page_token:
+            return await self.get_json("nearbysearch", {"pagetoken": page_token})
+        return await self.get_json("nearbysearch", {
+            "location": f"{lat},{lon}",
+            "radius": radius_meters,
+            "type": place_type,
+        })
+
+    async def details(self, place_id, fields):
+        if not isinstance(fields, str):
+            fields = ",".join(fields)
+        return await self.get_json("details", {"placeid": place_id, "fields": fields})
+
+    async def details_many(self, place_ids, fields):
+        """
+        Fetches Place Details for many places concurrently.
+
+        Returns:
+            dict: place_id -> decoded response, or the exception raised for it
+        """
+        place_ids = list(place_ids)
+        results = await asyncio.gather(*(self.details(pid, fields) for pid in place_ids),
+                                       return_exceptions=True)
+        return dict(zip(place_ids, results))
+
+    async def aclose(self):
+        if self._pools is not None:
+            for client, _ in self._pools:
+                await client.aclose()
+            self._pools = None
@@ -0,0 +1,298 @@
+import csv
+import glob
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+###############################################################################
+# Setup & Configuration
+###############################################################################
+PROFILE_DIR = "personaldata"
+PROFILE_STORE = os.environ.get("FLAVORAI_PROFILE_STORE", "sqlite")   # 'sqlite' or 'csv'
+PROFILE_DB_PATH = os.environ.get("FLAVORAI_PROFILE_DB", os.path.join(PROFILE_DIR, "profiles.db"))
+
+TASTE_KEYS = ["salty", "umami", "spicy", "sweet", "sour"]
+LIST_FIELDS = ["texture_preferences", "dietary_restrictions", "allergies"]
+# Restaurants the user has already tried; names may contain commas, so this
+# list is stored as JSON rather than comma-joined
+TRIED_FIELD = "tried_foods"
+CSV_COLUMNS = ["user_id", *TASTE_KEYS, *LIST_FIELDS, TRIED_FIELD]
+STORED_LIST_FIELDS = [*LIST_FIELDS, TRIED_FIELD]
+
+###############################################################################
+# 1. Profile <-> Row Conversion
+###############################################################################
+def parse_list(val):
+    """
+    Splits a comma-separated CSV cell into a list of trimmed strings.
+    """
+    if val is None:
+        return []
+    return [x.strip() for x in str(val).split(",") if x.strip()]
+
+def profile_from_csv_row(row):
+    """
+    Builds the in-memory profile dict from one row of a <user_id>_profile.csv file.
+    """
+    def to_float(val):
+        try:
+            return float(val)
+        except (TypeError, ValueError):
+            return 0
+    return {
+        "user_id": row.get("user_id"),
+        "favorite_tastes": {k: to_float(row.get(k, 0)) for k in TASTE_KEYS},
+        "texture_preferences": parse_list(row.get("texture_preferences", "")),
+        "dietary_restrictions": parse_list(row.get("dietary_restrictions", "")),
+        "allergies": parse_list(row.get("allergies", "")),
+        TRIED_FIELD: json.loads(row.get(TRIED_FIELD) or "[]"),
+    }
+
+def profile_to_csv_row(profile):
+    row = {"user_id": profile["user_id"]}
+    row.update({k: profile["favorite_tastes"][k] for k in TASTE_KEYS})
+    row.update({f: ", ".join(profile.get(f, [])) for f in LIST_FIELDS})
+    row[TRIED_FIELD] = json.dumps(list(profile.get(TRIED_FIELD, [])))
+    return row
+
+###############################################################################
+# 2. CSV Store (one file per user, legacy layout)
+###############################################################################
+class CSVProfileStore:
+    """
+    Profiles stored as personaldata/<user_id>_profile.csv. Updates are
+    serialized per process and written with an atomic rename.
+    """
+
+    def __init__(self, directory=PROFILE_DIR):
+        self.directory = directory
+        self._lock = threading.Lock()
+
+    def path(self, user_id):
+        return os.path.join(self.directory, f"{user_id}_profile.csv")
+
+    def get(self, user_id):
+        try:
+            with open(self.path(user_id), newline="") as f:
+                row = next(csv.DictReader(f), None)
+        except FileNotFoundError:
+            return None
+        return profile_from_csv_row(row) if row else None
+
+    def save(self, profile):
+        os.makedirs(self.directory, exist_ok=True)
+        csv_file = self.path(profile["user_id"])
+        tmp_file = f"{csv_file}.tmp"
+        with open(tmp_file, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=CSV_COLUMNS)
+            writer.writeheader()
+            writer.writerow(profile_to_csv_row(profile))
+        os.replace(tmp_file, csv_file)
+
+    def update(self, user_id, mutate):
+        """
+        Atomically applies mutate(profile) to a stored profile.
+
+        Returns:
+            dict | None: The updated profile, or None if the user does not exist
+        """
+        with self._lock:
+            profile = self.get(user_id)
+            if profile is None:
+                return None
+            mutate(profile)
+            self.save(profile)
+            return profile
+
+###############################################################################
+# 3. SQLite Store (WAL mode, keyed by user_id)
+###############################################################################
+class SQLiteProfileStore:
+    """
+    Profiles stored in one SQLite table in WAL mode, so reads never block on
+    writers. update() runs its read-modify-write inside a BEGIN IMMEDIATE
+    transaction, so concurrent feedback for one user cannot lose updates.
+
+    Users that only exist as legacy CSV files are imported on first read.
+    """
+
+    def __init__(self, db_path=PROFILE_DB_PATH, legacy_dir=PROFILE_DIR):
+        self.db_path = db_path
+        self.legacy = CSVProfileStore(legacy_dir) if legacy_dir else None
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+        self._initialized = False
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            db_dir = os.path.dirname(self.db_path)
+            if db_dir:
+                os.makedirs(db_dir, exist_ok=True)
+            # Autocommit mode; transactions are opened explicitly
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        if not self._initialized:
+            with self._init_lock:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS profiles ("
+                    "user_id TEXT PRIMARY KEY, "
+                    + ", ".join(f"{k} REAL NOT NULL" for k in TASTE_KEYS) + ", "
+                    + ", ".join(f"{f} TEXT NOT NULL DEFAULT '[]'" for f in STORED_LIST_FIELDS) + ", "
+                    "updated_at REAL NOT NULL)"
+                )
+                # Databases created before a column existed get it added in place
+                columns = {row[1] for row in conn.execute("PRAGMA table_info(profiles)")}
+                for field in STORED_LIST_FIELDS:
+                    if field not in columns:
+                        conn.execute(f"ALTER TABLE profiles ADD COLUMN {field} TEXT NOT NULL DEFAULT '[]'")
+                self._initialized = True
+        return conn
+
+    @staticmethod
+    def _row_to_profile(row):
+        return {
+            "user_id": row[0],
+            "favorite_tastes": dict(zip(TASTE_KEYS, row[1:6])),
+            "texture_preferences": json.loads(row[6]),
+            "dietary_restrictions": json.loads(row[7]),
+            "allergies": json.loads(row[8]),
+            TRIED_FIELD: json.loads(row[9]),
+        }
+
+    @staticmethod
+    def _profile_to_row(profile):
+        return (
+            profile["user_id"],
+            *(float(profile["favorite_tastes"].get(k, 0)) for k in TASTE_KEYS),
+            *(json.dumps(list(profile.get(f, []))) for f in STORED_LIST_FIELDS),
+            time.time(),
+        )
+
+    def _select(self, conn, user_id):
+        return conn.execute(
+            f"SELECT user_id, {', '.join(TASTE_KEYS)}, {', '.join(STORED_LIST_FIELDS)} "
+            "FROM profiles WHERE user_id = ?",
+            (user_id,),
+        ).fetchone()
+
+    def _upsert(self, conn, profile):
+        conn.execute(
+            f"INSERT OR REPLACE INTO profiles (user_id, {', '.join(TASTE_KEYS)}, "
+            f"{', '.join(STORED_LIST_FIELDS)}, updated_at) "
+            f"VALUES ({', '.join('?' * (len(TASTE_KEYS) + len(STORED_LIST_FIELDS) + 2))})",
+            self._profile_to_row(profile),
+        )
+
+    def get(self, user_id):
+        row = self._select(self._conn(), user_id)
+        if row is not None:
+            return self._row_to_profile(row)
+        if self.legacy is not None:
+            profile = self.legacy.get(user_id)
+            if profile is not None:
+                profile["user_id"] = user_id
+                self.save(profile)
+                return profile
+        return None
+
+    def save(self, profile):
+        self._upsert(self._conn(), profile)
+
+    def update(self, user_id, mutate):
+        """
+        Atomically applies mutate(profile) to a stored profile.
+
+        Returns:
+            dict | None: The updated profile, or None if the user does not exist
+        """
+        if self.get(user_id) is None:  # Imports a legacy CSV profile if needed
+            return None
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = self._select(conn, user_id)
+            if row is None:
+                conn.execute("ROLLBACK")
+                return None
+            profile = self._row_to_profile(row)
+            mutate(profile)
+            self._upsert(conn, profile)
+            conn.execute("COMMIT")
+            return profile
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def migrate_from_csv(self, directory=PROFILE_DIR):
+        """
+        Imports every <user_id>_profile.csv in directory in one transaction.
+
+        Returns:
+            int: Number of profiles imported
+        """
+        csv_store = CSVProfileStore(directory)
+        profiles = []
+        for csv_file in sorted(glob.glob(os.path.join(directory, "*_profile.csv"))):
+            user_id = os.path.basename(csv_file)[:-len("_profile.csv")]
+            profile = csv_store.get(user_id)
+            if profile is None:
+                print(f"Skipping empty profile file '{csv_file}'.")
+                continue
+            profile["user_id"] = user_id
+            profiles.append(profile)
+
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for profile in profiles:
+                self._upsert(conn, profile)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return len(profiles)
+
+###############################################################################
+# 4. Store Selection
+###############################################################################
+_store = None
+_store_lock = threading.Lock()
+
+def get_profile_store():
+    """
+    Returns the process-wide profile store selected by FLAVORAI_PROFILE_STORE.
+    """
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if PROFILE_STORE == "csv":
+                    _store = CSVProfileStore()
+                elif PROFILE_STORE == "sqlite":
+                    _store = SQLiteProfileStore()
+                else:
+                    raise ValueError(f"Unknown profile store: {PROFILE_STORE!r}")
+    return _store
+
+def set_profile_store(store):
+    """
+    Replaces the process-wide profile store (e.g. a store on another path).
+    """
+    global _store
+    _store = store
+
+if __name__ == "__main__":
+    # Usage: python profile_store.py migrate [csv_dir] [db_path]
+    if len(sys.argv) < 2 or sys.argv[1] != "migrate":
+        print("Usage: python profile_store.py migrate [csv_dir] [db_path]")
+        sys.exit(1)
+    source_dir = sys.argv[2] if len(sys.argv) > 2 else PROFILE_DIR
+    target_db = sys.argv[3] if len(sys.argv) > 3 else PROFILE_DB_PATH
+    count = SQLiteProfileStore(target_db, legacy_dir=None).migrate_from_csv(source_dir)
+    print(f"Migrated {count} profiles from '{source_dir}' into '{target_db}'.")
@@ -0,0 +1,91 @@
+import json
+
+try:
+    import orjson  # Optional; much faster serialization when installed
+except ImportError:
+    orjson = None
+
+###############################################################################
+# 1. Recommendation Records
+###############################################################################
+class Recommendation:
+    """
+    One recommended restaurant. A __slots__ record instead of a DataFrame row:
+    no per-request pandas objects, and it serializes straight to JSON.
+    """
+
+    __slots__ = ("restaurant_id", "name", "vicinity",
+                 "salty", "umami", "spicy", "sweet", "sour",
+                 "textures", "similarity")
+
+    FIELDS = __slots__
+
+    def __init__(self, restaurant_id, name, vicinity, salty=0, umami=0, spicy=0,
+                 sweet=0, sour=0, textures="", similarity=None):
+        self.restaurant_id = restaurant_id
+        self.name = name
+        self.vicinity = vicinity
+        self.salty = salty
+        self.umami = umami
+        self.spicy = spicy
+        self.sweet = sweet
+        self.sour = sour
+        self.textures = textures
+        self.similarity = similarity
+
+    @classmethod
+    def from_restaurant(cls, restaurant):
+        """
+        Flattens a restaurant with a 'flavor_profile' into a record.
+        """
+        flavor = restaurant.get("flavor_profile", {})
+        return cls(
+            restaurant.get("place_id"),
+            restaurant.get("name"),
+            restaurant.get("vicinity"),
+            flavor.get("salty", 0),
+            flavor.get("umami", 0),
+            flavor.get("spicy", 0),
+            flavor.get("sweet", 0),
+            flavor.get("sour", 0),
+            ", ".join(flavor.get("textures", [])),
+        )
+
+    def get(self, key, default=None):
+        # Lets records be passed anywhere a taste dict is expected (e.g. scoring.taste_matrix)
+        return getattr(self, key, default) if key in self.FIELDS else default
+
+    def with_similarity(self, similarity):
+        """
+        Returns a copy carrying the given similarity score, rounded to 6
+        places: scores are computed in float32 (scoring.py), and unrounded
+        they reach the API as e.g. 0.9800000190734863.
+        """
+        copy = Recommendation.__new__(Recommendation)
+        for field in self.FIELDS:
+            setattr(copy, field, getattr(self, field))
+        copy.similarity = round(float(similarity), 6) if similarity is not None else None
+        return copy
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+    def __repr__(self):
+        return f"Recommendation({self.name!r}, similarity={self.similarity!r})"
+
+###############################################################################
+# 2. JSON Serialization
+###############################################################################
+def _default(obj):
+    if isinstance(obj, Recommendation):
+        return obj.to_dict()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+def dumps(obj):
+    """
+    Serializes obj (which may contain Recommendation records) to JSON bytes,
+    using orjson when it is installed.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default)
+    return json.dumps(obj, default=_default, separators=(",", ":")).encode("utf-8")
@@ -0,0 +1,76 @@
+import numpy as np
+
+###############################################################################
+# Setup & Configuration
+###############################################################################
+TASTE_KEYS = ["salty", "umami", "spicy", "sweet", "sour"]
+BATCH_USER_CHUNK = 256  # Users scored per block in score_batch to bound memory
+
+###############################################################################
+# 1. Taste Vectors
+###############################################################################
+def taste_vector(tastes):
+    """
+    Converts a taste dict (e.g. a user's 'favorite_tastes') into a float32 vector
+    ordered like TASTE_KEYS. Missing keys count as 0.
+    """
+    return np.array([float(tastes.get(k, 0) or 0) for k in TASTE_KEYS], dtype=np.float32)
+
+def taste_matrix(rows):
+    """
+    Stacks taste dicts into a contiguous (len(rows), 5) float32 matrix.
+    """
+    matrix = np.empty((len(rows), len(TASTE_KEYS)), dtype=np.float32)
+    for i, row in enumerate(rows):
+        for j, k in enumerate(TASTE_KEYS):
+            matrix[i, j] = float(row.get(k, 0) or 0)
+    return matrix
+
+###############################################################################
+# 2. Similarity & Top-N Selection
+###############################################################################
+def score(candidates, user_vector):
+    """
+    L1 similarity of every candidate against one user, in one vectorized pass.
+    Equivalent to averaging (1 - |user - restaurant|) over the five tastes.
+
+    Args:
+        candidates (np.ndarray): (n, 5) float32 candidate matrix
+        user_vector (np.ndarray): (5,) user taste vector
+
+    Returns:
+        np.ndarray: (n,) float32 similarity scores in [0, 1]
+    """
+    return 1.0 - np.abs(candidates - user_vector).sum(axis=1) / len(TASTE_KEYS)
+
+def score_batch(candidates, user_matrix):
+    """
+    Scores many users against the same candidate matrix in one call.
+
+    Args:
+        candidates (np.ndarray): (n, 5) float32 candidate matrix
+        user_matrix (np.ndarray): (m, 5) float32 user taste matrix
+
+    Returns:
+        np.ndarray: (m, n) float32 similarity scores
+    """
+    scores = np.empty((len(user_matrix), len(candidates)), dtype=np.float32)
+    for start in range(0, len(user_matrix), BATCH_USER_CHUNK):
+        block = user_matrix[start:start + BATCH_USER_CHUNK]
+        diff = np.abs(candidates[None, :, :] - block[:, None, :]).sum(axis=2)
+        scores[start:start + len(block)] = 1.0 - diff / len(TASTE_KEYS)
+    return scores
+
+def top_n(scores, n):
+    """
+    Indices of the n highest scores, best first. Uses argpartition so only the
+    selected slice is sorted.
+    """
+    count = len(scores)
+    if n <= 0 or count == 0:
+        return np.empty(0, dtype=np.intp)
+    if n < count:
+        picked = np.argpartition(-scores, n - 1)[:n]
+    else:
+        picked = np.arange(count)
+    return picked[np.argsort(-scores[picked], kind="stable")]
@@ -0,0 +1,120 @@
+import asyncio
+import threading
+
+###############################################################################
+# 1. Single-Flight Call Coalescing
+###############################################################################
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key: the first caller runs the
+    function, every caller that arrives while it is in flight waits for and
+    receives the same result (or exception). Nothing is cached once the call
+    completes.
+
+    Args:
+        name (str): Label used in stats()
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.executions = 0   # Upstream calls actually made
+        self.coalesced = 0    # Callers served by another caller's in-flight call
+
+    def do(self, key, fn):
+        """
+        Runs fn() once per key among concurrent callers and returns its result.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.coalesced += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self.executions += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def stats(self):
+        """
+        Returns counters for this flight group, including the coalesce hit ratio.
+        """
+        with self._lock:
+            total = self.executions + self.coalesced
+            return {
+                "name": self.name,
+                "executions": self.executions,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._calls),
+                "coalesce_ratio": self.coalesced / total if total else 0.0,
+            }
+
+class AsyncSingleFlight(SingleFlight):
+    """
+    SingleFlight for coroutines on one event loop: followers await the
+    leader's future instead of blocking a thread.
+    """
+
+    async def do(self, key, fn):
+        """
+        Awaits fn() once per key among concurrent callers and returns its result.
+        """
+        call = self._calls.get(key)
+        if call is not None:
+            self.coalesced += 1
+            # shield: a cancelled follower must not cancel the shared call
+            return await asyncio.shield(call)
+
+        call = asyncio.ensure_future(fn())
+        self._calls[key] = call
+        self.executions += 1
+        try:
+            return await asyncio.shield(call)
+        finally:
+            if call.done():
+                self._calls.pop(key, None)
+            else:
+                call.add_done_callback(lambda _: self._calls.pop(key, None))
+
+###############################################################################
+# 2. Shared Flight Groups
+###############################################################################
+nearby_flight = SingleFlight("places_nearby_search")
+flavor_flight = SingleFlight("gemini_flavor_profiles")
+details_flight = SingleFlight("places_details")
+
+# Used by the ASGI service (see app_async.py)
+async_nearby_flight = AsyncSingleFlight("places_nearby_search_async")
+async_flavor_flight = AsyncSingleFlight("gemini_flavor_profiles_async")
+async_details_flight = AsyncSingleFlight("places_details_async")
+
+def all_stats():
+    return [nearby_flight.stats(), flavor_flight.stats(), details_flight.stats(),
+            async_nearby_flight.stats(), async_flavor_flight.stats(), async_details_flight.stats()]
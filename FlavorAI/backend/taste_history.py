@@ -0,0 +1,349 @@
+import fcntl
+import os
+import struct
+import time
+from contextlib import contextmanager
+from urllib.parse import quote, unquote
+
+from profile_store import TASTE_KEYS
+
+###############################################################################
+# Setup & Configuration
+###############################################################################
+HISTORY_DIR = os.environ.get("FLAVORAI_HISTORY_DIR", os.path.join("personaldata", "taste_history"))
+
+# One event: time (float64), feedback event id (int64, 0 if none), kind (uint8),
+# one float32 per taste; little-endian, packed
+EVENT_FORMAT = "<dqB5f"
+EVENT_SIZE = struct.calcsize(EVENT_FORMAT)   # 37 bytes
+# One snapshot: time, number of events it covers (uint64), highest event id
+# among them, tastes after them (float64)
+SNAPSHOT_FORMAT = "<dQq5d"
+SNAPSHOT_SIZE = struct.calcsize(SNAPSHOT_FORMAT)
+
+EVENT_FEEDBACK = 0   # Values are per-taste feedback signals (-1 = "too ...", +1 = "not ... enough")
+EVENT_BASE = 1       # Values are absolute tastes (onboarding, or the profile before its first feedback)
+
+SNAPSHOT_EVERY = 64  # Events between snapshots; a read replays fewer than this
+DEFAULT_STEP = 0.1   # Taste change per unit of feedback signal
+
+###############################################################################
+# 1. Replay
+###############################################################################
+def replay(tastes, events, step=DEFAULT_STEP):
+    """
+    Folds events into a taste list: base events replace the values, feedback
+    events move each taste by step * signal, clamped to [0, 1].
+
+    Args:
+        tastes (list): Five starting values in TASTE_KEYS order (None before any base event)
+        events (iterable): (time, kind, values, event_id) tuples
+        step (float): Change per unit of signal
+
+    Returns:
+        list | None: The resulting five values
+    """
+    for _, kind, values, _ in events:
+        if kind == EVENT_BASE:
+            tastes = list(values)
+            continue
+        if tastes is None:
+            tastes = [0.5] * len(TASTE_KEYS)  # Neutral, as for profiles without a base
+        tastes = [min(max(t + step * s, 0.0), 1.0) for t, s in zip(tastes, values)]
+    return tastes
+
+def as_taste_dict(values):
+    # Event values are float32; rounding hides the representation error
+    return {k: round(v, 6) for k, v in zip(TASTE_KEYS, values)}
+
+###############################################################################
+# 2. Per-User Event Log & Snapshots
+###############################################################################
+class TasteHistory:
+    """
+    Append-only history of every user's taste profile.
+
+    Each user has a binary file of fixed-size events (EVENT_FORMAT) and a
+    file of snapshots taken every SNAPSHOT_EVERY events. The current profile
+    is the latest snapshot plus the events after it; the profile as of any
+    time is the last snapshot before it (found by binary search) plus at most
+    SNAPSHOT_EVERY events. Both reads cost the same for any history length.
+
+    Writers hold an exclusive flock on the user's event file, so several
+    processes (web workers, the job worker) can append safely. Feedback
+    events carry their FeedbackLog id; ids at or below the highest one
+    already recorded are skipped, so a batch applied twice is recorded once.
+    """
+
+    def __init__(self, directory=HISTORY_DIR):
+        self.directory = directory
+
+    def _path(self, user_id, suffix):
+        return os.path.join(self.directory, quote(user_id, safe="") + suffix)
+
+    def users(self):
+        """
+        Every user with a history.
+        """
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(unquote(name[:-len(".events")]) for name in os.listdir(self.directory)
+                      if name.endswith(".events"))
+
+    def event_count(self, user_id):
+        try:
+            return os.path.getsize(self._path(user_id, ".events")) // EVENT_SIZE
+        except FileNotFoundError:
+            return 0
+
+    @contextmanager
+    def _locked(self, user_id):
+        # Exclusive lock on the user's event file, across threads and processes
+        # (each open() is its own lock holder)
+        os.makedirs(self.directory, exist_ok=True)
+        fd = os.open(self._path(user_id, ".events"), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield fd
+        finally:
+            os.close(fd)  # Releases the lock
+
+    def _read_events(self, user_id, start=0, stop=None):
+        try:
+            with open(self._path(user_id, ".events"), "rb") as f:
+                f.seek(start * EVENT_SIZE)
+                data = f.read() if stop is None else f.read((stop - start) * EVENT_SIZE)
+        except FileNotFoundError:
+            return []
+        data = data[:len(data) - len(data) % EVENT_SIZE]  # Ignore a partial trailing record
+        return [(t, kind, values, event_id) for t, event_id, kind, *values in struct.iter_unpack(EVENT_FORMAT, data)]
+
+    def _snapshot_count(self, user_id):
+        try:
+            return os.path.getsize(self._path(user_id, ".snapshots")) // SNAPSHOT_SIZE
+        except FileNotFoundError:
+            return 0
+
+    def _snapshot(self, f, index):
+        # (time, events covered, highest event id, tastes) of one snapshot, read in place
+        f.seek(index * SNAPSHOT_SIZE)
+        t, count, last_id, *values = struct.unpack(SNAPSHOT_FORMAT, f.read(SNAPSHOT_SIZE))
+        return t, count, last_id, values
+
+    def _latest_snapshot(self, user_id, when=None):
+        """
+        The last snapshot (taken at or before `when`, if given), or None.
+        Snapshots are in time order, so this is a binary search over the file.
+        """
+        n = self._snapshot_count(user_id)
+        if n == 0:
+            return None
+        with open(self._path(user_id, ".snapshots"), "rb") as f:
+            if when is None:
+                return self._snapshot(f, n - 1)
+            lo, hi = 0, n  # First snapshot after `when` is in [lo, hi]
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if self._snapshot(f, mid)[0] <= when:
+                    lo = mid + 1
+                else:
+                    hi = mid
+            return self._snapshot(f, lo - 1) if lo > 0 else None
+
+    def _state(self, user_id):
+        """
+        (event count, current taste values, highest event id, time of the last
+        event) from the latest snapshot plus the fewer than SNAPSHOT_EVERY
+        events after it.
+        """
+        snapshot = self._latest_snapshot(user_id)
+        last_t, start, last_id, tastes = snapshot if snapshot else (0.0, 0, 0, None)
+        tail = self._read_events(user_id, start)
+        last_id = max([last_id] + [event[3] for event in tail])
+        last_t = tail[-1][0] if tail else last_t
+        return start + len(tail), replay(tastes, tail), last_id, last_t
+
+    def events(self, user_id):
+        """
+        Every event of a user, oldest first, as (time, kind, values, event_id) tuples.
+        """
+        return self._read_events(user_id)
+
+    def append(self, user_id, events, base=None):
+        """
+        Appends (time, kind, values, event_id) events and snapshots the result
+        whenever a multiple of SNAPSHOT_EVERY events is crossed. Events whose
+        id is at or below the highest recorded id were recorded before and
+        are skipped (id 0 means none and is never skipped). An event older
+        than the one before it (e.g. feedback applied after a later profile
+        update) is stamped with that event's time, so the log stays in time
+        order for as_of and recompute_all.
+
+        Args:
+            events (list): The events, oldest first
+            base (list): Taste values to start from if the user has no history yet
+
+        Returns:
+            dict | None: The user's tastes after these events
+        """
+        with self._locked(user_id) as fd:
+            count, tastes, last_id, last_t = self._state(user_id)
+            events = [e for e in events if not (e[3] and e[3] <= last_id)]
+            if count == 0 and base is not None and events:
+                events.insert(0, (min(e[0] for e in events), EVENT_BASE, base, 0))
+            ordered = []
+            for t, kind, values, event_id in events:
+                last_t = max(t, last_t)
+                ordered.append((last_t, kind, values, event_id))
+            events = ordered
+            if events:
+                os.write(fd, b"".join(struct.pack(EVENT_FORMAT, t, event_id, kind, *values)
+                                      for t, kind, values, event_id in events))
+
+            snapshots = []
+            for i, event in enumerate(events, start=count + 1):
+                tastes = replay(tastes, [event])
+                last_id = max(last_id, event[3])
+                if i % SNAPSHOT_EVERY == 0:
+                    snapshots.append(struct.pack(SNAPSHOT_FORMAT, event[0], i, last_id, *tastes))
+            if snapshots:
+                snapshot_fd = os.open(self._path(user_id, ".snapshots"),
+                                      os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+                try:
+                    os.write(snapshot_fd, b"".join(snapshots))
+                finally:
+                    os.close(snapshot_fd)
+        return as_taste_dict(tastes) if tastes is not None else None
+
+    def current(self, user_id):
+        """
+        The user's tastes after every event, or None without a history.
+        """
+        tastes = self._state(user_id)[1]
+        return as_taste_dict(tastes) if tastes is not None else None
+
+    def as_of(self, user_id, when):
+        """
+        The user's tastes after every event up to `when` (epoch seconds), or
+        None if the history starts later.
+        """
+        snapshot = self._latest_snapshot(user_id, when)
+        _, start, _, tastes = snapshot if snapshot else (None, 0, 0, None)
+        events = self._read_events(user_id, start, start + SNAPSHOT_EVERY)
+        tastes = replay(tastes, [e for e in events if e[0] <= when])
+        return as_taste_dict(tastes) if tastes is not None else None
+
+    def record_feedback(self, user_id, current_tastes, signals, times=None, event_ids=None):
+        """
+        Appends feedback signals for a user. A user without a history first
+        gets a base event holding current_tastes, so their history starts
+        from the profile as it was.
+
+        Args:
+            current_tastes (dict): The profile's tastes now
+            signals (list): One five-value signal tuple per feedback event
+            times (list): Event times (epoch seconds), default now
+            event_ids (list): FeedbackLog ids of the events, increasing; default none
+
+        Returns:
+            dict: The tastes after the feedback
+        """
+        times = times or [time.time()] * len(signals)
+        event_ids = event_ids or [0] * len(signals)
+        base = [float(current_tastes.get(k, 0.5)) for k in TASTE_KEYS]
+        events = [(t, EVENT_FEEDBACK, s, i) for t, s, i in zip(times, signals, event_ids)]
+        tastes = self.append(user_id, events, base=base)
+        return tastes if tastes is not None else as_taste_dict(base)
+
+    def record_base(self, user_id, tastes, when=None):
+        """
+        Starts the user's profile over from absolute tastes (e.g. onboarding).
+        """
+        return self.append(user_id, [(when or time.time(), EVENT_BASE,
+                                      [float(tastes.get(k, 0.5)) for k in TASTE_KEYS], 0)])
+
+# Shared instance
+taste_history = TasteHistory()
+
+###############################################################################
+# 3. Vectorized Recomputation Across Users
+###############################################################################
+def replay_batch(counts, kinds, signals, step=DEFAULT_STEP, start=None):
+    """
+    Vectorized replay() for many users at once.
+
+    Users are ordered by event count; step j of the replay updates every
+    user with more than j events in one array operation, so the work is
+    one pass over all events plus one NumPy call per event position.
+
+    Args:
+        counts (sequence): Events per user
+        kinds (ndarray): Event kinds, every user's events concatenated in order
+        signals (ndarray): (events, 5) event values, concatenated the same way
+        step (float | sequence): Change per unit of signal, or one per taste
+        start (ndarray): (users, 5) starting tastes, default neutral 0.5
+
+    Returns:
+        ndarray: (users, 5) tastes after each user's events
+    """
+    import numpy as np
+
+    counts = np.asarray(counts, dtype=np.int64)
+    order = np.argsort(-counts, kind="stable")
+    offsets = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    sorted_counts = counts[order]
+    starts = offsets[order]
+    signals = np.asarray(signals, dtype=np.float64)
+    step = np.asarray(step, dtype=np.float64)
+    base = kinds == EVENT_BASE
+
+    tastes = np.full((len(counts), len(TASTE_KEYS)), 0.5)
+    if start is not None:
+        tastes[:] = np.asarray(start, dtype=np.float64)[order]
+    descending = -sorted_counts
+    for j in range(int(sorted_counts[0]) if len(counts) else 0):
+        active = int(np.searchsorted(descending, -j, side="left"))  # Users with more than j events
+        rows = starts[:active] + j
+        stepped = np.clip(tastes[:active] + step * signals[rows], 0.0, 1.0)
+        tastes[:active] = np.where(base[rows][:, None], signals[rows], stepped)
+
+    result = np.empty_like(tastes)
+    result[order] = tastes
+    return result
+
+def recompute_all(step=DEFAULT_STEP, as_of=None, users=None, history=None):
+    """
+    Replays every user's full history at once with NumPy (see replay_batch),
+    e.g. to try a different update rule over all historical feedback.
+    Snapshots are not used, so any step works.
+
+    Args:
+        step (float | sequence): Change per unit of signal, or one per taste
+        as_of (float): Only events up to this time (epoch seconds)
+        users (list): Users to include, default every user with a history
+        history (TasteHistory): Defaults to the shared taste_history
+
+    Returns:
+        dict: user_id -> tastes dict, for users with at least one event
+    """
+    import numpy as np
+
+    history = history or taste_history
+    dtype = np.dtype([("t", "<f8"), ("id", "<i8"), ("kind", "u1"), ("v", "<f4", (len(TASTE_KEYS),))])
+    users = list(users) if users is not None else history.users()
+    logs = []
+    for user_id in users:
+        try:
+            log = np.fromfile(history._path(user_id, ".events"), dtype=dtype)
+        except FileNotFoundError:
+            continue
+        if as_of is not None:
+            log = log[:np.searchsorted(log["t"], as_of, side="right")]
+        if len(log):
+            logs.append((user_id, log))
+    if not logs:
+        return {}
+
+    events = np.concatenate([log for _, log in logs])
+    tastes = replay_batch([len(log) for _, log in logs], events["kind"], events["v"], step)
+    return {user_id: as_taste_dict(row) for (user_id, _), row in zip(logs, tastes.tolist())}
@@ -0,0 +1,68 @@
+import json
+import os
+import sys
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+import pytest
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, BACKEND_DIR)
+
+# Scratch caches, profiles and logs; set before any service module is imported
+SCRATCH_DIR = tempfile.mkdtemp(prefix="flavorai-tests-")
+os.environ["FLAVORAI_CACHE_DB"] = os.path.join(SCRATCH_DIR, "cache.db")
+os.environ["FLAVORAI_PROFILE_DB"] = os.path.join(SCRATCH_DIR, "profiles.db")
+os.environ["FLAVORAI_FEEDBACK_DB"] = os.path.join(SCRATCH_DIR, "feedback.db")
+os.environ["FLAVORAI_HISTORY_DIR"] = os.path.join(SCRATCH_DIR, "taste_history")
+os.environ["FLAVORAI_JOB_DB"] = os.path.join(SCRATCH_DIR, "jobs.db")
+
+class StubPlacesServer(ThreadingHTTPServer):
+    """
+    Local stand-in for the Places web service. Every request is recorded in
+    `calls` as (endpoint, params); `nearby(params)` and `details(params)`
+    build the JSON answers and can be replaced per test.
+    """
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), StubPlacesHandler)
+        self.calls = []
+        self.nearby = lambda params: {"status": "OK", "results": []}
+        self.details = lambda params: {"status": "NOT_FOUND"}
+
+    def endpoint_calls(self, endpoint):
+        return [params for name, params in self.calls if name == endpoint]
+
+class StubPlacesHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlsplit(self.path)
+        params = dict(parse_qsl(url.query))
+        endpoint = url.path.strip("/").split("/")[0]
+        self.server.calls.append((endpoint, params))
+        answer = self.server.nearby(params) if endpoint == "nearbysearch" else self.server.details(params)
+        body = json.dumps(answer).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def places_server(monkeypatch):
+    """
+    A running StubPlacesServer that the shared Places clients talk to.
+    """
+    import places_client
+
+    server = StubPlacesServer()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(places_client, "PLACES_BASE_URL", f"http://127.0.0.1:{server.server_address[1]}")
+    yield server
+    server.shutdown()
+    server.server_close()
@@ -0,0 +1,44 @@
+import pytest
+
+import app
+from nearby_cache import nearby_search_cache
+
+TASTES = {"salty": 0.5, "umami": 0.5, "spicy": 0.5, "sweet": 0.5, "sour": 0.5}
+
+def nearby_around(params):
+    # A full page of open places within ~100 m of wherever the search is centered
+    lat, lon = (float(v) for v in params["location"].split(","))
+    return {"status": "OK", "results": [
+        {"place_id": f"{lat:.4f},{lon:.4f}-{i}", "name": f"Kitchen {lon:.4f} {i}", "types": ["restaurant"],
+         "opening_hours": {"open_now": True},
+         "geometry": {"location": {"lat": lat + 0.00005 * i, "lng": lon}}}
+        for i in range(20)
+    ]}
+
+@pytest.fixture
+def server(places_server, monkeypatch):
+    places_server.nearby = nearby_around
+    monkeypatch.setattr(app, "generate_flavor_profiles", lambda restaurants: [
+        dict(r, flavor_profile=dict(TASTES, textures=[])) for r in restaurants])
+    nearby_search_cache.clear()
+    yield places_server
+    nearby_search_cache.clear()
+
+def member(user_id, lat, lon, n=10):
+    profile = {"user_id": user_id, "favorite_tastes": TASTES, "texture_preferences": [],
+               "dietary_restrictions": [], "allergies": [], "tried_foods": []}
+    return {"user_id": user_id, "user_profile": profile, "lat": lat, "lon": lon,
+            "radius_meters": 1000, "tried_foods": [], "n": n}
+
+def test_grouped_members_get_the_candidates_of_their_own_search(server):
+    # 2.5 km apart: one group, but neither circle reaches the midpoint
+    batch = [member("west", 38.6488, -90.3253), member("east", 38.6488, -90.2966)]
+    assert len(app.group_batch_requests(batch)) == 1
+
+    west, east = app.generate_batch_recommendations(batch)
+    assert len(west) == len(east) == 10
+    assert all(r.name.startswith("Kitchen -90.3253") for r in west)
+    assert all(r.name.startswith("Kitchen -90.2966") for r in east)
+    # Each member searched its own circle, as a single request would
+    assert sorted(p["location"] for p in server.endpoint_calls("nearbysearch")) == \
+        sorted(f"{e['lat']},{e['lon']}" for e in batch)
@@ -0,0 +1,21 @@
+import time
+
+from cache import PersistentCache, purge_all_expired
+
+def test_purge_all_expired_sweeps_every_cache(tmp_path):
+    short = PersistentCache("purge_short", ttl=60, db_path=str(tmp_path / "cache.db"))
+    long = PersistentCache("purge_long", ttl=3600, db_path=str(tmp_path / "cache.db"))
+    for cache in (short, long):
+        cache.set("old", {"v": 1})
+        cache.set("new", {"v": 2})
+        cache._conn().execute(f"UPDATE {cache.namespace} SET stored_at = ? WHERE key = 'old'",
+                              (time.time() - 120,))
+        cache._conn().commit()
+
+    purged = purge_all_expired()
+    assert purged["purge_short"] == 1 and purged["purge_long"] == 0
+    def keys_on_disk(cache):
+        return sorted(key for (key,) in cache._conn().execute(f"SELECT key FROM {cache.namespace}"))
+
+    assert keys_on_disk(short) == ["new"]
+    assert keys_on_disk(long) == ["new", "old"]
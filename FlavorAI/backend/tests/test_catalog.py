@@ -0,0 +1,77 @@
+import random
+import time
+
+from cache import PersistentCache, place_card_cache
+from catalog import RestaurantCatalog
+from nearby_cache import haversine_m
+
+CENTER = (38.6488, -90.3108)
+
+def make_place(i, lat, lon, **extra):
+    place = {"place_id": f"cat{i}", "name": f"Place {i}",
+             "geometry": {"location": {"lat": lat, "lng": lon}}}
+    place.update(extra)
+    return place
+
+def random_places(rng, n, start=0):
+    return [make_place(start + i, CENTER[0] + rng.uniform(-0.1, 0.1), CENTER[1] + rng.uniform(-0.1, 0.1))
+            for i in range(n)]
+
+def new_catalog(name, threshold):
+    return RestaurantCatalog(PersistentCache(name, ttl=3600, lru_size=1), rebuild_threshold=threshold)
+
+def wait_for_rebuild(catalog, timeout=10):
+    deadline = time.time() + timeout
+    while catalog._rebuilding and time.time() < deadline:
+        time.sleep(0.01)
+
+def expected_within(places, lat, lon, radius):
+    located = {p["place_id"]: p["geometry"]["location"] for p in places}
+    dists = {pid: haversine_m(lat, lon, loc["lat"], loc["lng"]) for pid, loc in located.items()}
+    return sorted((pid for pid, d in dists.items() if d <= radius), key=dists.get)
+
+def test_queries_see_the_delta_and_the_rebuilt_tree():
+    rng = random.Random(3)
+    catalog = new_catalog("catalog_delta", threshold=50)
+    places = random_places(rng, 40)
+    catalog.add(places)
+    assert not catalog._rebuilding and len(catalog._tree_ids) == 0  # Below the threshold: delta only
+    assert [p["place_id"] for p in catalog.within(*CENTER, 5000)] == expected_within(places, *CENTER, 5000)
+
+    more = random_places(rng, 100, start=40)
+    catalog.add(more)
+    wait_for_rebuild(catalog)
+    assert len(catalog._tree_ids) == 140 and not catalog._delta
+    places += more
+    assert [p["place_id"] for p in catalog.within(*CENTER, 5000)] == expected_within(places, *CENTER, 5000)
+
+    nearest = [p["place_id"] for p in catalog.nearest(*CENTER, 7)]
+    assert nearest == expected_within(places, *CENTER, 1e9)[:7]
+
+def test_moved_place_is_found_at_its_new_location():
+    catalog = new_catalog("catalog_moved", threshold=2)
+    far = (CENTER[0] + 1.0, CENTER[1])
+    catalog.add([make_place(0, *far), make_place(1, *far), make_place(2, *far)])
+    wait_for_rebuild(catalog)
+    assert "cat0" in catalog._tree_ids
+
+    catalog.add([make_place(0, *CENTER)])  # Stays in the delta, shadowing its tree row
+    assert [p["place_id"] for p in catalog.within(*CENTER, 100)] == ["cat0"]
+    nearest = [p["place_id"] for p in catalog.nearest(*far, 3)]
+    assert set(nearest[:2]) == {"cat1", "cat2"} and nearest[2] == "cat0"
+
+def test_stale_open_now_is_dropped_and_periods_recompute_it():
+    catalog = new_catalog("catalog_open_now", threshold=100)
+    catalog.add([make_place(0, *CENTER, opening_hours={"open_now": True}),
+                 make_place(1, *CENTER, opening_hours={"open_now": True}),
+                 make_place(2, *CENTER)])
+    # A month-old Places response: its open_now says nothing about today
+    catalog._places["cat1"]["seen_at"] -= 30 * 24 * 3600
+    always_open = {"periods": [{"open": {"day": 0, "time": "0000"}}]}
+    place_card_cache.set("cat2", {"values": {"opening_hours": always_open, "utc_offset": 0},
+                                  "fetched_at": {}})
+
+    hours = {p["place_id"]: p.get("opening_hours", {}) for p in catalog.within(*CENTER, 100)}
+    assert hours["cat0"].get("open_now") is True   # Just seen
+    assert "open_now" not in hours["cat1"]
+    assert hours["cat2"].get("open_now") is True   # From the cached card's periods
@@ -0,0 +1,62 @@
+import pytest
+
+import app
+from app import NEARBY_EXPANDED_TYPES, NEARBY_MAX_PAGES, NEARBY_PAGE_WORKERS
+from nearby_cache import NEARBY_PAGE_SIZE, nearby_search_cache
+
+CENTER = (38.6488, -90.3108)
+
+def paged_nearby(params):
+    # NEARBY_MAX_PAGES full pages per type, chained with next_page_token
+    place_type, page = params.get("pagetoken", f"{params.get('type')}:0").split(":")
+    page = int(page)
+    results = [{"place_id": f"{place_type}-{page}-{i}", "name": f"{place_type} {page} {i}",
+                "geometry": {"location": {"lat": CENTER[0], "lng": CENTER[1]}}}
+               for i in range(NEARBY_PAGE_SIZE)]
+    answer = {"status": "OK", "results": results}
+    if page + 1 < NEARBY_MAX_PAGES:
+        answer["next_page_token"] = f"{place_type}:{page + 1}"
+    return answer
+
+@pytest.fixture
+def server(places_server, monkeypatch):
+    monkeypatch.setattr(app, "NEARBY_PAGE_TOKEN_DELAY", 0.0)
+    places_server.nearby = paged_nearby
+    nearby_search_cache.clear()
+    yield places_server
+    nearby_search_cache.clear()
+
+def expanded_places():
+    return [p for batch in app.iter_nearby_pages(CENTER[0], CENTER[1], 2000, budget=5) for p in batch]
+
+def first_pages(server):
+    return [params["type"] for params in server.endpoint_calls("nearbysearch") if "type" in params]
+
+def test_idle_pool_follows_every_type_and_page(server):
+    places = expanded_places()
+    assert sorted(first_pages(server)) == sorted(NEARBY_EXPANDED_TYPES)
+    assert len(places) == len(NEARBY_EXPANDED_TYPES) * NEARBY_MAX_PAGES * NEARBY_PAGE_SIZE
+    assert app._active_chains == 0
+
+def test_busy_pool_searches_fewer_types(server, monkeypatch):
+    monkeypatch.setattr(app, "_active_chains", NEARBY_PAGE_WORKERS - 2)
+    places = expanded_places()
+    assert sorted(first_pages(server)) == sorted(NEARBY_EXPANDED_TYPES[:2])
+    assert len(places) == 2 * NEARBY_MAX_PAGES * NEARBY_PAGE_SIZE
+    assert app._active_chains == NEARBY_PAGE_WORKERS - 2
+    # A partial fan-out is not the expanded answer and is not cached as one
+    assert nearby_search_cache.lookup(CENTER[0], CENTER[1], 2000, place_type="expanded") is None
+
+def test_full_pool_degrades_to_the_first_page(server, monkeypatch):
+    monkeypatch.setattr(app, "_active_chains", NEARBY_PAGE_WORKERS)
+    places = expanded_places()
+    calls = server.endpoint_calls("nearbysearch")
+    assert len(calls) == 1 and calls[0]["type"] == "restaurant"
+    assert len(places) == NEARBY_PAGE_SIZE
+
+def test_failed_chain_is_not_cached_as_the_expanded_answer(server):
+    server.nearby = lambda params: ({"status": "REQUEST_DENIED", "results": []} if params.get("type") == "bar"
+                                    else paged_nearby(params))
+    places = expanded_places()
+    assert len(places) == (len(NEARBY_EXPANDED_TYPES) - 1) * NEARBY_MAX_PAGES * NEARBY_PAGE_SIZE
+    assert nearby_search_cache.lookup(CENTER[0], CENTER[1], 2000, place_type="expanded") is None
@@ -0,0 +1,19 @@
+import pytest
+
+from feedback import comment_signals
+from profile_store import TASTE_KEYS
+
+SALTY = TASTE_KEYS.index("salty")
+
+@pytest.mark.parametrize("comment, signal", [
+    ("too salty", -1.0),
+    ("way too salty", -1.5),
+    ("nearly too salty", -0.5),
+    ("not too salty", 0.0),
+    ("not salty enough", 1.0),
+    ("not nearly salty enough", 1.5),
+    ("wasn't nearly salty enough", 1.5),
+    ("nearly salty enough", 0.0),
+])
+def test_salty_signal(comment, signal):
+    assert comment_signals([comment])[0, SALTY] == signal
@@ -0,0 +1,84 @@
+import time
+
+import pytest
+
+import feedback
+import profile_store
+from feedback import FEEDBACK_MAX_ATTEMPTS, FeedbackApplier, FeedbackLog
+
+class FlakyStore:
+    """
+    Profile store whose updates fail for the users in `failing`.
+    """
+
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+        self.profiles = {}
+
+    def update(self, user_id, mutate):
+        if user_id in self.failing:
+            raise RuntimeError(f"store unavailable for {user_id}")
+        profile = self.profiles.setdefault(
+            user_id, {"user_id": user_id, "favorite_tastes": dict.fromkeys(profile_store.TASTE_KEYS, 0.5)})
+        mutate(profile)
+        return profile
+
+@pytest.fixture
+def store(monkeypatch):
+    store = FlakyStore()
+    monkeypatch.setattr(feedback, "get_profile_store", lambda: store)
+    return store
+
+def new_log(tmp_path):
+    return FeedbackLog(str(tmp_path / "feedback.db"))
+
+def test_failing_user_is_dropped_after_max_attempts(tmp_path, store):
+    store.failing.add("bad")
+    log = new_log(tmp_path)
+    applier = FeedbackApplier(log)
+    log.append("bad", "Diner", 1.0, "too salty")
+    log.append("good", "Diner", 1.0, "too sweet")
+
+    assert applier.apply_pending() == 1
+    assert store.profiles["good"]["favorite_tastes"]["sweet"] < 0.5
+    for _ in range(FEEDBACK_MAX_ATTEMPTS - 2):
+        applier.apply_pending()
+        assert log.pending_count() == 1
+    applier.apply_pending()
+    assert log.pending_count() == 0 and "bad" not in store.profiles
+
+def test_thread_survives_unexpected_errors(tmp_path, store, monkeypatch):
+    log = new_log(tmp_path)
+    applier = FeedbackApplier(log, interval=0.01)
+    real_pending = log.pending
+    failures = []
+
+    def broken_pending(*args, **kwargs):
+        if len(failures) < 2:
+            failures.append(1)
+            raise ValueError("corrupt row")
+        return real_pending(*args, **kwargs)
+
+    monkeypatch.setattr(log, "pending", broken_pending)
+    log.append("good", "Diner", 1.0, "too spicy")
+    applier.start()
+    try:
+        deadline = time.time() + 5
+        while log.pending_count() and time.time() < deadline:
+            time.sleep(0.01)
+        assert len(failures) == 2 and log.pending_count() == 0
+        assert applier._thread.is_alive()
+    finally:
+        applier.stop()
+
+def test_start_restarts_a_dead_thread(tmp_path, store):
+    applier = FeedbackApplier(new_log(tmp_path), interval=0.01)
+    applier.start()
+    applier._stopping = True
+    applier._wake.set()
+    applier._thread.join()
+    applier.start()
+    try:
+        assert applier._thread.is_alive()
+    finally:
+        applier.stop()
@@ -0,0 +1,103 @@
+import asyncio
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from app import FLAVOR_CHUNK_SIZE, FLAVOR_MAX_ATTEMPTS, request_flavor_profiles, validate_flavor_profile
+
+VALID = {"salty": 0.4, "umami": 0.6, "spicy": 0.1, "sweet": 0.3, "sour": 0.2, "textures": ["crispy"]}
+
+class FakeGemini:
+    """
+    Stand-in for genai.Client. Each generate_content call reads the names
+    from the prompt, records them in `calls`, and answers with a
+    generate_flavor_profiles function call whose 'profiles' come from
+    `answer(names, call_index)` (by default a valid profile per name).
+    """
+
+    def __init__(self, answer=None):
+        self.answer = answer or (lambda names, call: {name: dict(VALID) for name in names})
+        self.calls = []
+        self._lock = threading.Lock()
+        self.models = SimpleNamespace(generate_content=self._generate)
+        self.aio = SimpleNamespace(models=SimpleNamespace(generate_content=self._generate_async))
+
+    def _generate(self, model, contents, config):
+        names = [line[2:] for line in contents.splitlines() if line.startswith("- ")]
+        with self._lock:
+            call = len(self.calls)
+            self.calls.append(names)
+        fn_call = SimpleNamespace(name="generate_flavor_profiles", args={"profiles": self.answer(names, call)})
+        part = SimpleNamespace(function_call=fn_call)
+        return SimpleNamespace(candidates=[SimpleNamespace(content=SimpleNamespace(parts=[part]))])
+
+    async def _generate_async(self, model, contents, config):
+        return self._generate(model, contents, config)
+
+def restaurants(n):
+    return [{"name": f"Restaurant {i}"} for i in range(n)]
+
+def test_names_are_sent_in_chunks():
+    gemini = FakeGemini()
+    profiles = request_flavor_profiles(restaurants(25) + restaurants(3), gemini)
+
+    assert sorted(len(names) for names in gemini.calls) == [5, FLAVOR_CHUNK_SIZE, FLAVOR_CHUNK_SIZE]
+    asked = [name for names in gemini.calls for name in names]
+    assert sorted(asked) == sorted(f"Restaurant {i}" for i in range(25))  # Duplicates asked once
+    assert len(profiles) == 25 and profiles["Restaurant 7"] == VALID
+
+def test_only_missing_or_malformed_names_are_retried():
+    def answer(names, call):
+        if call > 0:
+            return {name: dict(VALID) for name in names}
+        return {
+            "restaurant 0 ": dict(VALID),              # Key differs in case and whitespace
+            "Restaurant 1": dict(VALID, spicy=1.7),    # Out of range
+            "Restaurant 2": dict(VALID, sour="tart"),  # Not a number
+            # Restaurant 3 left out
+        }
+
+    gemini = FakeGemini(answer)
+    profiles = request_flavor_profiles(restaurants(4), gemini)
+
+    assert gemini.calls[1:] == [["Restaurant 1", "Restaurant 2", "Restaurant 3"]]
+    assert set(profiles) == {f"Restaurant {i}" for i in range(4)}
+
+def test_names_gemini_never_answers_are_left_out():
+    gemini = FakeGemini(lambda names, call: {name: dict(VALID) for name in names if name != "Restaurant 1"})
+    profiles = request_flavor_profiles(restaurants(3), gemini)
+
+    assert len(gemini.calls) == FLAVOR_MAX_ATTEMPTS
+    assert all(names == ["Restaurant 1"] for names in gemini.calls[1:])
+    assert set(profiles) == {"Restaurant 0", "Restaurant 2"}
+
+def test_async_requests_retry_the_same_way():
+    from app_async import request_flavor_profiles_async
+
+    # The second chunk's first answer is out of range
+    gemini = FakeGemini(lambda names, call: {name: dict(VALID, sweet=-0.1 if call < 2 and "Restaurant 11" in names
+                                                        else 0.3) for name in names})
+    profiles = asyncio.run(request_flavor_profiles_async(restaurants(12), gemini))
+
+    assert sorted(len(names) for names in gemini.calls) == [2, 2, FLAVOR_CHUNK_SIZE]
+    assert gemini.calls[-1] == ["Restaurant 10", "Restaurant 11"]
+    assert len(profiles) == 12
+
+@pytest.mark.parametrize("raw", [
+    dict(VALID, salty=1.01),
+    dict(VALID, umami=-0.5),
+    dict(VALID, sweet=float("nan")),
+    dict(VALID, spicy=float("inf")),
+    dict(VALID, sour=None),
+    {k: v for k, v in VALID.items() if k != "umami"},
+    dict(VALID, textures={"crispy": True}),
+    ["not", "a", "dict"],
+    None,
+])
+def test_malformed_profiles_are_rejected(raw):
+    assert validate_flavor_profile(raw) is None
+
+def test_valid_profile_is_normalized():
+    profile = validate_flavor_profile(dict(VALID, salty="0", sour=1, textures="chewy"))
+    assert profile == dict(VALID, salty=0.0, sour=1.0, textures=["chewy"])
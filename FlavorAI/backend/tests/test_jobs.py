@@ -0,0 +1,119 @@
+import os
+import threading
+import time
+
+import pytest
+
+import appService
+import jobs
+from jobs import JOB_MAX_ATTEMPTS, JobQueue, remove_upload
+
+def wait_for(queue, job_id, statuses=("done", "failed"), timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = queue.get(job_id)
+        if job["status"] in statuses:
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"job {job_id} still {queue.get(job_id)['status']}")
+
+def write_upload(tmp_path, name):
+    path = tmp_path / "uploads" / name
+    path.parent.mkdir(exist_ok=True)
+    path.write_bytes(b"{}")
+    return str(path)
+
+def test_cleanup_runs_when_a_job_finishes_or_fails_for_good(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.db"), workers=1)
+    runs = []
+
+    def handler(payload):
+        runs.append(payload["path"])
+        if payload["fail"]:
+            assert os.path.exists(payload["path"])  # Kept between attempts
+            raise RuntimeError("unreadable")
+        return {}
+
+    queue.register("takeout", handler, cleanup=remove_upload)
+    try:
+        good = queue.submit("takeout", {"path": write_upload(tmp_path, "good"), "fail": False})
+        bad = queue.submit("takeout", {"path": write_upload(tmp_path, "bad"), "fail": True})
+        assert wait_for(queue, good["job_id"])["status"] == "done"
+        assert wait_for(queue, bad["job_id"])["status"] == "failed"
+    finally:
+        queue.stop()
+    assert runs.count(str(tmp_path / "uploads" / "bad")) == JOB_MAX_ATTEMPTS
+    assert os.listdir(tmp_path / "uploads") == []
+
+def test_workers_never_exceed_a_kinds_concurrency(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.db"), workers=4)
+    lock = threading.Lock()
+    running = [0]
+    peak = [0]
+
+    def handler(payload):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.005)
+        with lock:
+            running[0] -= 1
+        return {}
+
+    queue.register("takeout", handler, concurrency=1)
+    try:
+        submitted = [queue.submit("takeout", {"n": i}) for i in range(20)]
+        for job in submitted:
+            assert wait_for(queue, job["job_id"])["status"] == "done"
+    finally:
+        queue.stop()
+    assert peak[0] == 1
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    queue = JobQueue(str(tmp_path / "jobs.db"), workers=1)
+    ran = []
+    release = threading.Event()
+
+    def handler(payload):
+        ran.append(open(payload["path"], "rb").read())
+        release.wait(10)  # Held running until the test lets it finish
+        return {"restaurants": 0, "visits": 0}
+
+    queue.register("takeout", handler, cleanup=remove_upload)
+    monkeypatch.setattr(appService, "job_queue", queue)
+    monkeypatch.setattr(appService, "UPLOAD_DIR", str(tmp_path / "uploads"))
+    app = appService.Flask(__name__)
+    app.register_blueprint(appService.api)
+    yield app.test_client(), queue, ran, release, tmp_path / "uploads"
+    release.set()
+    queue.stop()
+
+def test_repeated_upload_keeps_one_file_and_finished_uploads_are_removed(client):
+    client, queue, ran, release, upload_dir = client
+
+    first = client.post("/takeout/u1", data=b'{"timelineObjects": []}')
+    second = client.post("/takeout/u1", data=b'{"timelineObjects": []}')
+    assert first.status_code == second.status_code == 202
+    assert first.get_json()["job"]["job_id"] == second.get_json()["job"]["job_id"]
+    assert len(os.listdir(upload_dir)) == 1
+
+    release.set()
+    wait_for(queue, first.get_json()["job"]["job_id"])
+    assert ran == [b'{"timelineObjects": []}']
+    assert os.listdir(upload_dir) == []
+
+    # Uploading an ingested file again answers with the finished job and keeps nothing
+    third = client.post("/takeout/u1", data=b'{"timelineObjects": []}')
+    assert third.get_json()["job"]["status"] == "done"
+    assert os.listdir(upload_dir) == [] and len(ran) == 1
+
+def test_refused_upload_is_removed(client, monkeypatch):
+    client, queue, _, _, upload_dir = client
+    monkeypatch.setattr(queue, "max_pending", 0)
+    response = client.post("/takeout/u2", data=b"{}")
+    assert response.status_code == 503
+    assert os.listdir(upload_dir) == []
+
+def test_takeout_kind_cleans_up_its_upload():
+    assert jobs.job_queue._handlers["takeout"][2] is remove_upload
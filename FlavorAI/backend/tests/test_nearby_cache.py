@@ -0,0 +1,131 @@
+from datetime import datetime, timezone
+
+import pytest
+
+import app
+from cache import place_card_cache
+from nearby_cache import (
+    NEARBY_OPEN_NOW_TTL,
+    NEARBY_PAGE_SIZE,
+    NearbySearchCache,
+    geohash_neighborhood,
+    nearby_search_cache,
+)
+import nearby_cache
+
+CENTER = (38.6488, -90.3108)
+
+def place(i, lat, lon, open_now=True):
+    return {
+        "place_id": f"place-{i}",
+        "name": f"Kitchen {i}",
+        "types": ["restaurant"],
+        "opening_hours": {"open_now": open_now},
+        "geometry": {"location": {"lat": lat, "lng": lon}},
+    }
+
+def ring(count):
+    # `count` places spread from the center out to ~1.8 km north
+    return [place(i, CENTER[0] + 0.0016 * i, CENTER[1]) for i in range(count)]
+
+@pytest.fixture(autouse=True)
+def empty_caches():
+    nearby_search_cache.clear()
+    place_card_cache.clear()
+    yield
+    nearby_search_cache.clear()
+
+def search(radius_km):
+    return app.find_nearby_restaurants(CENTER[0], CENTER[1], radius_km, "kilometers")
+
+def age_entries(seconds):
+    for entries in nearby_search_cache._tiles.values():
+        for entry in entries:
+            entry["fetched_at"] -= seconds
+
+def test_repeated_search_is_served_from_the_tile_cache(places_server):
+    places_server.nearby = lambda params: {"status": "OK", "results": ring(5)}
+    first = search(2)
+    second = search(2)
+    assert [p["place_id"] for p in first] == [p["place_id"] for p in second]
+    assert len(places_server.endpoint_calls("nearbysearch")) == 1
+
+def test_complete_answer_serves_a_smaller_circle_inside_it(places_server):
+    places_server.nearby = lambda params: {"status": "OK", "results": ring(5)}
+    search(2)
+    smaller = search(0.5)
+    assert len(places_server.endpoint_calls("nearbysearch")) == 1
+    # Only the places within 500 m: 0, 178 and 356 m north of the center
+    assert [p["place_id"] for p in smaller] == ["place-0", "place-1", "place-2"]
+
+def test_truncated_answer_does_not_serve_a_much_smaller_circle(places_server):
+    answers = {2000: ring(NEARBY_PAGE_SIZE), 500: ring(3)}
+    places_server.nearby = lambda params: {"status": "OK", "results": answers[int(float(params["radius"]))],
+                                           "next_page_token": "more"}
+    search(2)
+    smaller = search(0.5)
+    assert len(places_server.endpoint_calls("nearbysearch")) == 2
+    assert len(smaller) == 3
+
+def test_truncated_answer_serves_a_nearly_identical_circle(places_server):
+    places_server.nearby = lambda params: {"status": "OK", "results": ring(NEARBY_PAGE_SIZE)}
+    search(2)
+    search(1.9)
+    assert len(places_server.endpoint_calls("nearbysearch")) == 1
+
+def test_stale_open_now_without_periods_is_fetched_again(places_server):
+    places_server.nearby = lambda params: {"status": "OK", "results": ring(3)}
+    search(2)
+    age_entries(NEARBY_OPEN_NOW_TTL + 1)
+    search(2)
+    assert len(places_server.endpoint_calls("nearbysearch")) == 2
+
+def test_open_now_is_recomputed_from_cached_card_periods(places_server):
+    places_server.nearby = lambda params: {"status": "OK", "results": ring(2)}
+    search(2)
+    # Both places are cached as open; their cards say place-1 only opens two days from now
+    in_two_days = (datetime.now(timezone.utc).weekday() + 1 + 2) % 7  # Google counts Sunday as 0
+    hours = {
+        "place-0": {"periods": [{"open": {"day": 0, "time": "0000"}}]},  # Open 24 hours
+        "place-1": {"periods": [{"open": {"day": in_two_days, "time": "1200"},
+                                 "close": {"day": in_two_days, "time": "1300"}}]},
+    }
+    for place_id, opening_hours in hours.items():
+        place_card_cache.set(place_id, {"values": {"opening_hours": opening_hours, "utc_offset": 0},
+                                        "fetched_at": {"opening_hours": 0, "utc_offset": 0}})
+    age_entries(NEARBY_OPEN_NOW_TTL + 1)
+
+    results = search(2)
+    assert len(places_server.endpoint_calls("nearbysearch")) == 1
+    open_now = {p["place_id"]: p["opening_hours"]["open_now"] for p in results}
+    assert open_now == {"place-0": True, "place-1": False}
+
+def test_tile_count_is_bounded(monkeypatch):
+    monkeypatch.setattr(nearby_cache, "NEARBY_MAX_TILES", 3)
+    cache = NearbySearchCache()
+    for i in range(10):
+        cache.store(10.0 + i, 20.0, 1000.0, [], complete=True)
+    assert len(cache) == 3
+    # The most recent searches are the ones kept
+    assert cache.lookup(19.0, 20.0, 500.0) == []
+    assert cache.lookup(10.0, 20.0, 500.0) is None
+
+def test_expired_entries_are_swept():
+    cache = NearbySearchCache(ttl=60)
+    cache.store(10.0, 20.0, 1000.0, [], complete=True)
+    for entries in cache._tiles.values():
+        entries[0]["fetched_at"] -= 61
+    cache.purge_expired()
+    assert len(cache) == 0
+
+def test_neighborhood_covers_the_surrounding_tiles():
+    assert len(geohash_neighborhood(*CENTER)) == 9
+
+@pytest.mark.parametrize("status", ["REQUEST_DENIED", "INVALID_REQUEST", "OVER_QUERY_LIMIT"])
+def test_failed_search_is_not_cached(places_server, status):
+    places_server.nearby = lambda params: {"status": status, "results": [], "error_message": "no"}
+    assert search(2) == []
+    assert nearby_search_cache._tiles == {}
+    places_server.nearby = lambda params: {"status": "OK", "results": ring(5)}
+    assert len(search(2)) == 5
+    assert len(places_server.endpoint_calls("nearbysearch")) > 1
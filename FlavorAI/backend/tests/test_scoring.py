@@ -0,0 +1,22 @@
+import json
+
+from app import rank_candidates
+
+def restaurant(name, **tastes):
+    return {"name": name, "place_id": name, "flavor_profile": dict(tastes, textures=[])}
+
+def test_similarities_are_plain_rounded_floats():
+    user = {"favorite_tastes": {"salty": 0.3, "umami": 0.7, "spicy": 0.1, "sweet": 0.9, "sour": 0.2}}
+    candidates = [
+        restaurant("Near", salty=0.3, umami=0.7, spicy=0.1, sweet=0.8, sour=0.2),
+        restaurant("Far", salty=0.9, umami=0.1, spicy=0.7, sweet=0.1, sour=0.9),
+    ]
+    best, worst = rank_candidates(user, candidates, 2)
+
+    assert (best.name, worst.name) == ("Near", "Far")
+    assert type(best.similarity) is float
+    assert best.similarity == 0.98 and json.dumps(best.similarity) == "0.98"
+    # Python reference: mean of 1 - |user - restaurant| over the five tastes
+    reference = sum(1 - abs(user["favorite_tastes"][k] - candidates[1]["flavor_profile"][k])
+                    for k in user["favorite_tastes"]) / 5
+    assert abs(worst.similarity - reference) < 1e-6
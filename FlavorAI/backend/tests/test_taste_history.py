@@ -0,0 +1,27 @@
+from taste_history import EVENT_BASE, EVENT_FEEDBACK, TasteHistory, recompute_all
+
+TASTES = {"salty": 0.5, "umami": 0.5, "spicy": 0.5, "sweet": 0.5, "sour": 0.5}
+TOO_SALTY = [-1.0, 0.0, 0.0, 0.0, 0.0]
+
+def test_events_older_than_the_log_keep_it_in_time_order(tmp_path):
+    history = TasteHistory(str(tmp_path))
+    history.record_feedback("u1", TASTES, [TOO_SALTY], times=[1000.0], event_ids=[1])
+    history.record_base("u1", dict(TASTES, sweet=0.9), when=2000.0)
+    # Feedback created before the profile update but applied after it
+    history.record_feedback("u1", TASTES, [TOO_SALTY, TOO_SALTY], times=[1500.0, 2500.0], event_ids=[2, 3])
+
+    events = history.events("u1")
+    assert [(t, kind) for t, kind, _, _ in events] == [
+        (1000.0, EVENT_BASE), (1000.0, EVENT_FEEDBACK), (2000.0, EVENT_BASE),
+        (2000.0, EVENT_FEEDBACK), (2500.0, EVENT_FEEDBACK)]
+
+    before_update = history.as_of("u1", 1999.0)
+    assert before_update["salty"] < 0.5 and before_update["sweet"] == 0.5
+    after_late_feedback = history.as_of("u1", 2200.0)
+    assert after_late_feedback["sweet"] == 0.9 and after_late_feedback["salty"] < 0.5
+    assert history.as_of("u1", 999.0) is None
+
+    for when in (1999.0, 2200.0, 3000.0):
+        replayed = recompute_all(as_of=when, users=["u1"], history=history)["u1"]
+        assert replayed == history.as_of("u1", when)
+    assert history.as_of("u1", 3000.0) == history.current("u1")
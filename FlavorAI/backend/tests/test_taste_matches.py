@@ -0,0 +1,29 @@
+import app
+import taste_index
+from taste_index import TasteIndex
+
+TASTES = {"salty": 0.5, "umami": 0.5, "spicy": 0.5, "sweet": 0.5, "sour": 0.5}
+
+def entry(i, name, distance, types=("restaurant",)):
+    # The larger `distance`, the further the profile is from TASTES
+    profile = dict(TASTES, sweet=0.5 + distance, textures=[])
+    place = {"place_id": f"p{i}", "name": name, "types": list(types),
+             "geometry": {"location": {"lat": 38.6488, "lng": -90.3108}}}
+    return f"p{i}", profile, place
+
+def matches(monkeypatch, profile, k=3):
+    entries = [entry(i, f"Peanut Shack {i}", 0.01 * i) for i in range(5)] + \
+              [entry(5, "Ocean Catch", 0.055, types=("seafood_restaurant",))] + \
+              [entry(i, f"Noodle House {i}", 0.01 * i) for i in range(6, 12)]
+    monkeypatch.setattr(taste_index, "get_taste_index", lambda: TasteIndex(entries))
+    user = dict({"favorite_tastes": TASTES, "texture_preferences": [], "dietary_restrictions": [],
+                 "allergies": [], "tried_foods": []}, **profile)
+    return [r.name for r in app.find_taste_matches(user, k)]
+
+def test_matches_without_restrictions_are_the_closest_profiles(monkeypatch):
+    assert matches(monkeypatch, {}) == ["Peanut Shack 0", "Peanut Shack 1", "Peanut Shack 2"]
+
+def test_allergy_conflicts_are_skipped_but_k_matches_are_still_returned(monkeypatch):
+    assert matches(monkeypatch, {"allergies": ["Peanuts"]}) == ["Ocean Catch", "Noodle House 6", "Noodle House 7"]
+    assert matches(monkeypatch, {"allergies": ["peanuts", "shellfish"], "tried_foods": ["noodle house 6"]}) == \
+        ["Noodle House 7", "Noodle House 8", "Noodle House 9"]
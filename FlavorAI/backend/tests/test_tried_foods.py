@@ -0,0 +1,33 @@
+import pytest
+
+import appService
+from profile_store import get_profile_store
+
+@pytest.fixture
+def client(places_server):
+    app = appService.Flask(__name__)
+    app.register_blueprint(appService.api)
+    get_profile_store().save({
+        "user_id": "taster",
+        "favorite_tastes": {"salty": 0.5, "umami": 0.5, "spicy": 0.5, "sweet": 0.5, "sour": 0.5},
+        "texture_preferences": [], "dietary_restrictions": [], "allergies": [], "tried_foods": ["Pho Saigon"],
+    })
+    return app.test_client()
+
+def recommend(client, tried):
+    return client.post("/recommendations/taster", json={"lat": 38.6488, "lon": -90.3108, "triedFoods": tried})
+
+def test_tried_foods_are_persisted_once(client, monkeypatch):
+    store = get_profile_store()
+    updates = []
+    real_update = store.update
+    monkeypatch.setattr(store, "update", lambda user_id, mutate: updates.append(user_id) or real_update(user_id, mutate))
+
+    assert recommend(client, ["Joe's Diner", "pho  saigon"]).status_code == 200
+    assert store.get("taster")["tried_foods"] == ["Pho Saigon", "Joe's Diner"]
+    assert updates == ["taster"]
+
+    # Nothing new: the profile is not written again
+    assert recommend(client, ["joes diner"]).status_code == 200
+    assert recommend(client, []).status_code == 200
+    assert updates == ["taster"]
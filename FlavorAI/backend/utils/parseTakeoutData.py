@@ -1,20 +1,27 @@
+import gzip
+import io
 import json
 import requests
 import time
-import importlib.util
+import threading
 import sys
 import os
+import zipfile
 from collections import defaultdict
+from datetime import datetime, timezone
 
-# Because app.py is in /FlavorAI/backend, and APIkey.py is in /FlavorAI,
-# we go one level up to find APIkey.py
+# The shared Places client, caches and API keys live in /FlavorAI/backend
 current_dir = os.path.dirname(os.path.abspath(__file__))
-key_dir = os.path.abspath(os.path.join(current_dir, "..", ".."))
-if key_dir not in sys.path:
-    sys.path.insert(0, key_dir)
+backend_dir = os.path.abspath(os.path.join(current_dir, ".."))
+if backend_dir not in sys.path:
+    sys.path.insert(0, backend_dir)
 
-# Replace these with your own references or environment-based imports
-from APIkey import othersapi_key
+from api_keys import othersapi_key
+from cache import place_details_cache
+from candidates import merge_tried_foods
+from catalog import restaurant_catalog
+from places_client import PlacesClient
+from profile_store import get_profile_store
 
 # Example dictionary mapping
 CUISINE_MAPPING = {
@@ -40,6 +47,16 @@ CUISINE_MAPPING = {
     "sushi_restaurant": "Japanese"
 }
 
+RESTAURANT_TYPES = ["restaurant", "food", "cafe", "meal_takeaway", "bar"]
+
+# Only the fields the pipeline reads are requested from Place Details
+PLACE_DETAILS_FIELDS = "name,types,geometry,vicinity"
+
+DETAILS_RATE_LIMIT = 10       # Place Details requests per second, across all workers
+DETAILS_CONCURRENCY = 8       # Simultaneous Place Details requests
+CHECKPOINT_EVERY = 100        # Place IDs processed between state writes
+STREAM_CHUNK_SIZE = 64 * 1024 # Characters read per step when streaming the timeline
+
 # location_history.json is assumed to be in /FlavorAI/backend/sampledata
 location_history_path = os.path.join(
     os.path.dirname(__file__),  # /FlavorAI/backend/utils
@@ -54,129 +71,460 @@ OUTPUT_DIR = os.path.join(
     "..",                       # /FlavorAI/backend
     "personaldata"
 )
-os.makedirs(OUTPUT_DIR, exist_ok=True)
-print(f"Output directory set to: {OUTPUT_DIR}")
-
-data = None
-loaded_path = None
-
-try:
-    print(f"Trying to load location history from: {location_history_path}")
-    print(f"Current working directory: {os.getcwd()}")
-    if os.path.exists(location_history_path):
-        with open(location_history_path, "r") as f:
-            data = json.load(f)
-        loaded_path = location_history_path
-        print(f"Successfully loaded location history with {len(data)} entries")
-    else:
-        print("location-history.json not found at the expected path.")
-except Exception as e:
-    print(f"Error loading location history: {e}")
-
-
-# Dictionary to store restaurant visits (simplified to just count)
-restaurant_visits = defaultdict(lambda: {
-    "name": "",
-    "visit_count": 0,
-    "visits": []
-})
-
-# Collect all unique placeIDs from visit entries
-place_ids = {}
-for entry in data:
-    visit = entry.get("visit", {})
-    top = visit.get("topCandidate", {})
-    pid = top.get("placeID")
-    if pid:
-        place_ids[pid] = {
-            "start": entry.get("startTime"),
-            "end": entry.get("endTime"),
-            "placeLocation": top.get("placeLocation", ""),
+
+###############################################################################
+# 1. Streaming the Location History
+###############################################################################
+def open_location_history(path):
+    """
+    Opens a Takeout timeline for text reading. Accepts a plain JSON file, a
+    gzip-compressed file, or a zip archive (the first member whose name ends in
+    location-history.json, else the first .json member).
+    """
+    if zipfile.is_zipfile(path):
+        archive = zipfile.ZipFile(path)
+        members = [m for m in archive.namelist() if m.lower().endswith(".json")]
+        if not members:
+            archive.close()
+            raise ValueError(f"No JSON file found in archive {path}")
+        preferred = [m for m in members if m.lower().endswith("location-history.json")]
+        member = (preferred or members)[0]
+        return io.TextIOWrapper(archive.open(member), encoding="utf-8")
+
+    with open(path, "rb") as f:
+        magic = f.read(2)
+    if magic == b"\x1f\x8b":
+        return gzip.open(path, "rt", encoding="utf-8")
+    return open(path, "r", encoding="utf-8")
+
+def iter_json_array(fp, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    Yields the elements of a top-level JSON array one at a time, reading the
+    file in fixed-size chunks so memory stays bounded by the largest element.
+    """
+    decoder = json.JSONDecoder()
+    buf = ""
+    pos = 0
+    eof = False
+    started = False
+
+    def fill():
+        nonlocal buf, pos, eof
+        chunk = fp.read(chunk_size)
+        if not chunk:
+            eof = True
+        buf = buf[pos:] + chunk
+        pos = 0
+
+    while True:
+        # Skip whitespace, commas and the opening bracket
+        while pos < len(buf) and (buf[pos].isspace() or buf[pos] == "," or (not started and buf[pos] == "[")):
+            if buf[pos] == "[":
+                started = True
+            pos += 1
+        if pos >= len(buf):
+            if eof:
+                return
+            fill()
+            continue
+        if not started:
+            raise ValueError("Location history must be a JSON array")
+        if buf[pos] == "]":
+            return
+        try:
+            element, end = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            fill()
+            continue
+        if end == len(buf) and not eof:
+            fill()  # A scalar may continue in the next chunk; decode it again
+            continue
+        yield element
+        pos = end
+
+def iter_visits(path):
+    """
+    Streams the Takeout timeline and yields only the visit fields the pipeline
+    needs, one dict per visit: {'placeID', 'startTime', 'endTime', 'placeLocation'}.
+    """
+    with open_location_history(path) as fp:
+        for entry in iter_json_array(fp):
+            if not isinstance(entry, dict):
+                continue
+            top = entry.get("visit", {}).get("topCandidate", {})
+            pid = top.get("placeID")
+            if pid:
+                yield {
+                    "placeID": pid,
+                    "startTime": entry.get("startTime"),
+                    "endTime": entry.get("endTime"),
+                    "placeLocation": top.get("placeLocation", ""),
+                }
+
+def collect_place_ids(visits):
+    """
+    Collects all unique placeIDs from the visits yielded by iter_visits.
+
+    Returns:
+        dict: place_id -> {'start', 'end', 'placeLocation'} of its visit
+    """
+    place_ids = {}
+    for visit in visits:
+        place_ids[visit["placeID"]] = {
+            "start": visit["startTime"],
+            "end": visit["endTime"],
+            "placeLocation": visit["placeLocation"],
         }
+    return place_ids
+
+###############################################################################
+# 2. Concurrent, Rate-Limited Place Details
+###############################################################################
+class RateLimiter:
+    """
+    Thread-safe limiter that spaces calls evenly at `rate` per second.
+    """
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+def get_place_details(place_id, client=None, limiter=None):
+    """
+    Returns the Place Details result for one place, served from the shared
+    place-details cache when possible.
+
+    Returns:
+        dict | None: {'status': ..., 'result': {...}} or None on a network error
+    """
+    cached = place_details_cache.get(place_id)
+    if cached is not None:
+        return cached
+
+    client = client or PlacesClient(othersapi_key)
+    if limiter is not None:
+        limiter.acquire()
+    try:
+        data = client.details(place_id, PLACE_DETAILS_FIELDS)
+    except requests.RequestException as e:
+        print(f"\nError fetching details for {place_id}: {e}")
+        return None
+
+    details = {"status": data.get("status"), "result": data.get("result", {})}
+    # Definitive answers are shared with every other user's ingestion
+    if details["status"] in ("OK", "NOT_FOUND", "ZERO_RESULTS", "INVALID_REQUEST"):
+        place_details_cache.set(place_id, details)
+    return details
+
+def fetch_place_details(place_ids, rate=DETAILS_RATE_LIMIT, concurrency=DETAILS_CONCURRENCY, client=None):
+    """
+    Fetches Place Details for many places concurrently under a shared rate limit.
+
+    Returns:
+        dict: place_id -> details dict (or None on a network error)
+    """
+    place_ids = list(place_ids)
+    cached = place_details_cache.get_many(place_ids)
+    pending = [pid for pid in place_ids if pid not in cached]
+    if pending:
+        client = client or PlacesClient(othersapi_key, max_concurrency=concurrency)
+        limiter = RateLimiter(rate)
+        fetched = client.map(lambda pid: get_place_details(pid, client, limiter), pending)
+        for pid, details in zip(pending, fetched):
+            cached[pid] = None if isinstance(details, Exception) else details
+    return cached
+
+###############################################################################
+# 3. Incremental Ingestion State
+###############################################################################
+def checkpoint_path(output_dir, user_id=None):
+    # Checkpoint of runs before incremental ingestion; read once and migrated
+    prefix = f"{user_id}_" if user_id else ""
+    return os.path.join(output_dir, f"{prefix}takeout_checkpoint.json")
+
+def state_path(output_dir, user_id=None):
+    prefix = f"{user_id}_" if user_id else ""
+    return os.path.join(output_dir, f"{prefix}takeout_state.json")
+
+def empty_state():
+    return {"high_water_mark": None, "processed": {}, "visits": {}}
+
+def load_state(path, legacy_checkpoint=None):
+    """
+    Returns the ingestion state saved by previous runs:
+        high_water_mark: latest visit startTime already ingested (None before the first run)
+        processed: place_id -> restaurant name, or None if not a restaurant
+        visits: place_id -> {'start', 'end', 'placeLocation'} for every ingested
+                place that is a restaurant or still unresolved
+
+    Without a state file, the place IDs of an interrupted pre-incremental run's
+    checkpoint are reused so they are not looked up again.
+    """
+    try:
+        with open(path, "r") as f:
+            state = json.load(f)
+        if all(key in state for key in ("high_water_mark", "processed", "visits")):
+            return state
+    except (FileNotFoundError, ValueError):
+        pass
+
+    state = empty_state()
+    if legacy_checkpoint and os.path.exists(legacy_checkpoint):
+        try:
+            with open(legacy_checkpoint, "r") as f:
+                state["processed"] = json.load(f)["processed"]
+            print(f"Resuming from checkpoint with {len(state['processed'])} processed place IDs")
+        except (ValueError, KeyError):
+            pass
+    return state
+
+def save_state(path, state):
+    # Write to a temp file and rename, so a crash never leaves a torn state file.
+    # json.dumps uses the C encoder; json.dump to a file would not
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(json.dumps(state))
+    os.replace(tmp_path, path)
 
-print(f"Found {len(place_ids)} unique place IDs to analyze")
-
-# Function to get place details
-def get_place_details(place_id):
-    url = f"https://maps.googleapis.com/maps/api/place/details/json?place_id={place_id}&key={othersapi_key}"
-    response = requests.get(url)
-    if response.status_code == 200:
-        return response.json()
-    return None
-
-# Check each placeID and add restaurant visits to our dictionary
-restaurant_count = 0
-print("Analyzing place visits...")
-
-for place_id, info in place_ids.items():
-    details = get_place_details(place_id)
-    if not details or details.get("status") != "OK":
-        continue
-    
-    types = details["result"].get("types", [])
-    name = details["result"].get("name", "Unknown")
-    
-    if any(t in types for t in ["restaurant", "food", "cafe", "meal_takeaway", "bar"]):
-        restaurant_count += 1
-        print(f"\rProcessing restaurant {restaurant_count}: {name}", end="")
-        
-        # Get or create restaurant entry
+def parse_timestamp(value):
+    """
+    Parses a Takeout startTime ('2024-01-01T09:37:47.000-06:00' or '...Z') to an
+    aware datetime; naive times are taken as UTC. Returns None if unparseable.
+    """
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except (TypeError, ValueError):
+        return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+def collect_new_place_ids(visits, high_water_mark):
+    """
+    collect_place_ids over only the visits that started after high_water_mark
+    (all of them when it is None). Visits without a usable startTime cannot be
+    placed on the timeline and are always read; re-reading one only refreshes
+    its place's visit info.
+
+    Returns:
+        tuple: (place_ids as from collect_place_ids, new high-water mark)
+    """
+    mark = parse_timestamp(high_water_mark)
+    latest = {"time": mark, "raw": high_water_mark}
+
+    def fresh():
+        for visit in visits:
+            started = parse_timestamp(visit["startTime"])
+            if started is not None and mark is not None and started <= mark:
+                continue
+            if started is not None and (latest["time"] is None or started > latest["time"]):
+                latest["time"], latest["raw"] = started, visit["startTime"]
+            yield visit
+
+    place_ids = collect_place_ids(fresh())
+    return place_ids, latest["raw"]
+
+###############################################################################
+# 4. Building & Writing Restaurant Visits
+###############################################################################
+def build_restaurant_visits(place_ids, processed):
+    """
+    Groups visits by restaurant name (case-insensitive).
+
+    Args:
+        place_ids (dict): Output of collect_place_ids
+        processed (dict): place_id -> restaurant name, or None if not a restaurant
+
+    Returns:
+        dict: lowercase name -> {'name', 'visit_count', 'visits'}
+    """
+    restaurant_visits = defaultdict(lambda: {
+        "name": "",
+        "visit_count": 0,
+        "visits": []
+    })
+    for place_id, info in place_ids.items():
+        name = processed.get(place_id)
+        if not name:
+            continue
         restaurant_key = name.lower()  # Use lowercase name as key for consistency
-        
-        # If this is the first time seeing this restaurant, set the name
         if restaurant_visits[restaurant_key]["visit_count"] == 0:
             restaurant_visits[restaurant_key]["name"] = name
-        
-        # Increment visit count
         restaurant_visits[restaurant_key]["visit_count"] += 1
-        
-        # Add this specific visit
         restaurant_visits[restaurant_key]["visits"].append({
             "start_time": info['start'],
             "end_time": info['end'],
             "place_id": place_id,
             "location": info['placeLocation']
         })
-    
-    time.sleep(0.2)  # Be kind to the API rate limit
-
-print(f"\nDone! Analyzed {restaurant_count} restaurant visits across {len(restaurant_visits)} unique restaurants.")
-
-# Create simplified restaurant visits data with just name and count
-restaurant_visits_simple = {}
-for restaurant_key, data in restaurant_visits.items():
-    restaurant_visits_simple[data["name"]] = data["visit_count"]
-
-# Write simplified results to JSON file
-output_file = os.path.join(OUTPUT_DIR, "restaurant_visits.json")
-try:
-    with open(output_file, "w") as f:
-        json.dump(restaurant_visits_simple, f, indent=2)
-    print(f"Simplified restaurant data written to {output_file}")
-except Exception as e:
-    print(f"Error writing to {output_file}: {e}")
-    # Try to create directories if they don't exist
+    return restaurant_visits
+
+def write_visits(restaurant_visits_simple, output_file):
+    """
+    Writes the simplified {name: visit_count} mapping, falling back to the
+    current directory if the output directory cannot be written.
+    """
     try:
-        os.makedirs(os.path.dirname(output_file), exist_ok=True)
         with open(output_file, "w") as f:
             json.dump(restaurant_visits_simple, f, indent=2)
-        print(f"Successfully created directories and wrote to {output_file}")
-    except Exception as e2:
-        print(f"Failed to create directories or write file: {e2}")
-        # Fallback to current directory
-        fallback_file = "restaurant_visits.json"
-        with open(fallback_file, "w") as f:
-            json.dump(restaurant_visits_simple, f, indent=2)
-        print(f"Saved fallback file to current directory: {fallback_file}")
-
-# Generate a summary of most visited restaurants
-if restaurant_visits:
-    print("\nMost visited restaurants:")
-    sorted_restaurants = sorted(
-        restaurant_visits_simple.items(), 
-        key=lambda x: x[1], 
-        reverse=True
-    )
-    
-    for i, (name, count) in enumerate(sorted_restaurants[:10]):
-        print(f"{i+1}. {name}: {count} visits")
\ No newline at end of file
+        print(f"Simplified restaurant data written to {output_file}")
+    except Exception as e:
+        print(f"Error writing to {output_file}: {e}")
+        # Try to create directories if they don't exist
+        try:
+            os.makedirs(os.path.dirname(output_file), exist_ok=True)
+            with open(output_file, "w") as f:
+                json.dump(restaurant_visits_simple, f, indent=2)
+            print(f"Successfully created directories and wrote to {output_file}")
+        except Exception as e2:
+            print(f"Failed to create directories or write file: {e2}")
+            # Fallback to current directory
+            fallback_file = "restaurant_visits.json"
+            with open(fallback_file, "w") as f:
+                json.dump(restaurant_visits_simple, f, indent=2)
+            print(f"Saved fallback file to current directory: {fallback_file}")
+
+###############################################################################
+# 5. Ingestion Pipeline
+###############################################################################
+def run_ingestion(path=location_history_path, output_dir=OUTPUT_DIR, user_id=None,
+                  rate=DETAILS_RATE_LIMIT, concurrency=DETAILS_CONCURRENCY, client=None, full=False):
+    """
+    Runs Takeout ingestion: collect place IDs, resolve them to restaurants
+    concurrently, and write <user_id>_restaurant_visits.json
+    (restaurant_visits.json without a user_id).
+
+    Ingestion is incremental. The user's state file remembers the latest visit
+    startTime ingested and every place ID already resolved, so a re-uploaded
+    Takeout only costs lookups for places first visited since the last run,
+    and its visits are merged into the existing visit store. The state is
+    saved as lookups complete, so an interrupted run resumes where it stopped.
+
+    The timeline is streamed, so plain, gzip and zip Takeout files of any size
+    are read in constant memory.
+
+    Args:
+        client (PlacesClient): Client for Place Details, defaults to a new one
+                               (pass a replaying client to run without keys)
+        full (bool): Ignore the saved state and ingest the whole history again
+
+    Returns:
+        dict: {restaurant name: visit count}, or None if the history could not be loaded
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    print(f"Output directory set to: {output_dir}")
+
+    state_file = state_path(output_dir, user_id)
+    state = empty_state() if full else load_state(state_file, checkpoint_path(output_dir, user_id))
+    processed, visits = state["processed"], state["visits"]
+
+    try:
+        print(f"Streaming location history from: {path}")
+        place_ids, high_water_mark = collect_new_place_ids(iter_visits(path), state["high_water_mark"])
+    except FileNotFoundError:
+        print("location-history.json not found at the expected path.")
+        return None
+    except Exception as e:
+        print(f"Error loading location history: {e}")
+        return None
+    if state["high_water_mark"]:
+        print(f"Found {len(place_ids)} place IDs visited since {state['high_water_mark']}")
+    else:
+        print(f"Found {len(place_ids)} unique place IDs to analyze")
+
+    # New visits replace the stored info of places visited before; places
+    # already known not to be restaurants are not stored again
+    for pid, info in place_ids.items():
+        if processed.get(pid, "") is not None:
+            visits[pid] = info
+    state["high_water_mark"] = high_water_mark
+    pending = [pid for pid in visits if pid not in processed]
+    save_state(state_file, state)
+
+    print(f"Analyzing {len(pending)} new place IDs...")
+    owns_client = client is None
+    client = client or PlacesClient(othersapi_key, max_concurrency=concurrency)
+    try:
+        for start in range(0, len(pending), CHECKPOINT_EVERY):
+            batch = pending[start:start + CHECKPOINT_EVERY]
+            details = fetch_place_details(batch, rate=rate, concurrency=concurrency, client=client)
+            catalog_places = []
+            for pid in batch:
+                result = details.get(pid)
+                if result is None:
+                    continue  # Network error: leave it for the next run
+                if result.get("status") != "OK":
+                    processed[pid] = None
+                    visits.pop(pid, None)
+                    continue
+                types = result["result"].get("types", [])
+                name = result["result"].get("name", "Unknown")
+                is_restaurant = any(t in types for t in RESTAURANT_TYPES)
+                processed[pid] = name if is_restaurant else None
+                if is_restaurant:
+                    catalog_places.append(dict(result["result"], place_id=pid))
+                else:
+                    visits.pop(pid, None)
+            # Takeout-derived restaurants also feed the local catalog
+            restaurant_catalog.add(catalog_places)
+            save_state(state_file, state)
+            print(f"\rProcessed {min(start + CHECKPOINT_EVERY, len(pending))}/{len(pending)} place IDs", end="")
+    finally:
+        if owns_client:
+            client.close()
+
+    # Rebuilt from every ingested place, so counts match a full re-run
+    restaurant_visits = build_restaurant_visits(visits, processed)
+    restaurant_count = sum(v["visit_count"] for v in restaurant_visits.values())
+    print(f"\nDone! Analyzed {restaurant_count} restaurant visits across {len(restaurant_visits)} unique restaurants.")
+
+    # Create simplified restaurant visits data with just name and count
+    restaurant_visits_simple = {v["name"]: v["visit_count"] for v in restaurant_visits.values()}
+
+    prefix = f"{user_id}_" if user_id else ""
+    write_visits(restaurant_visits_simple, os.path.join(output_dir, f"{prefix}restaurant_visits.json"))
+
+    # Visited restaurants count as tried, so recommendations skip them
+    if user_id:
+        names = list(restaurant_visits_simple)
+        if get_profile_store().update(user_id, lambda profile: merge_tried_foods(profile, names)) is None:
+            print(f"No profile for user {user_id}; visited restaurants were not recorded as tried.")
+
+    # The state file supersedes a pre-incremental checkpoint
+    legacy_checkpoint = checkpoint_path(output_dir, user_id)
+    if os.path.exists(legacy_checkpoint):
+        os.remove(legacy_checkpoint)
+
+    return restaurant_visits_simple
+
+def print_summary(restaurant_visits_simple):
+    """
+    Prints the ten most visited restaurants.
+    """
+    if restaurant_visits_simple:
+        print("\nMost visited restaurants:")
+        sorted_restaurants = sorted(
+            restaurant_visits_simple.items(),
+            key=lambda x: x[1],
+            reverse=True
+        )
+        for i, (name, count) in enumerate(sorted_restaurants[:10]):
+            print(f"{i+1}. {name}: {count} visits")
+
+if __name__ == "__main__":
+    # Usage: python parseTakeoutData.py [location-history.json] [user_id] [--full]
+    args = [a for a in sys.argv[1:] if a != "--full"]
+    history_path = args[0] if args else location_history_path
+    user = args[1] if len(args) > 1 else None
+    print_summary(run_ingestion(history_path, user_id=user, full="--full" in sys.argv))